@@ -0,0 +1,486 @@
+import io
+import os
+import posixpath
+import select
+import shlex
+import socket
+import stat
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from pull_log import AdbError
+
+# 进程内的 adb 主机协议客户端：直接连 adb server（默认 127.0.0.1:5037），
+# 不再为每次传输启动 adb 可执行文件。协议：
+#   主机请求   "%04x" 长度 + 请求串，回 OKAY / FAIL + "%04x" 长度 + 错误信息
+#   host:transport:<serial> 之后同一连接即转给设备服务：sync: / shell:<cmd> / exec:<cmd>
+#   sync 子协议  4 字节 id + u32(LE) 长度 + 数据；STAT / LIST / RECV / QUIT
+#   shell,v2 子协议 1 字节 id + u32(LE) 长度 + 数据；1 stdout / 2 stderr / 3 退出码
+ADB_SERVER_ADDRESS = os.environ.get("PULLLOG_ADB_SERVER", "127.0.0.1:5037")
+ADB_SOCKET_TIMEOUT = 30
+# 服务不可达后多久再试（秒），期间直接走 adb 子进程
+SERVER_RETRY_INTERVAL = 30
+# sync 连接池：每台设备最多保留的空闲连接
+SYNC_POOL_SIZE = 4
+# RECV 的 DATA 包直接收进这块缓冲，攒满后一次写盘
+RECV_BUFFER_SIZE = 1024 * 1024
+SYNC_DATA_MAX = 64 * 1024
+STREAM_BUFFER_SIZE = 256 * 1024
+
+_SHELL_V2_HEADER = struct.Struct("<BI")
+_SHELL_V2_STDOUT = 1
+_SHELL_V2_EXIT = 3
+# 连接在收到退出码之前断开（设备掉线等），与 adb 可执行文件一致记为 255
+SHELL_LOST_EXIT_CODE = 255
+
+_SYNC_HEADER = struct.Struct("<4sI")
+_SYNC_STAT = struct.Struct("<4sIII")
+_SYNC_DENT = struct.Struct("<4sIIII")
+
+SyncEntry = namedtuple("SyncEntry", ["name", "mode", "size", "mtime"])
+
+
+class AdbProtocolError(AdbError):
+    pass
+
+
+class AdbServerUnreachable(OSError):
+    # 连不上 adb server 本身（未启动、端口被占等）；区别于连上之后某台设备的连接被重置
+    pass
+
+
+def _parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _read_exact(sock, size):
+    data = bytearray(size)
+    _read_into(sock, memoryview(data))
+    return bytes(data)
+
+
+def _read_into(sock, view):
+    # 填满 view；对端关闭时抛 ConnectionError
+    pos = 0
+    while pos < len(view):
+        n = sock.recv_into(view[pos:])
+        if n == 0:
+            raise ConnectionError("adb server closed the connection")
+        pos += n
+
+
+def _write_all(f, view):
+    # 无缓冲文件的 write 可能只写一部分
+    while view:
+        n = f.write(view)
+        view = view[n:]
+
+
+class AdbConnection:
+    # 一条到 adb server 的 TCP 连接；poll/kill 与 Popen 同名，便于按设备登记后统一取消
+    def __init__(self, serial=None, address=None, timeout=ADB_SOCKET_TIMEOUT):
+        self.serial = serial
+        self.address = address or ADB_SERVER_ADDRESS
+        try:
+            self.sock = socket.create_connection(_parse_address(self.address), timeout=timeout)
+        except OSError as e:
+            raise AdbServerUnreachable(f"cannot connect to adb server {self.address}: {e}") from e
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.returncode = None
+
+    def request(self, payload):
+        data = payload.encode("utf-8")
+        self.sock.sendall(b"%04x" % len(data) + data)
+        self._read_status()
+
+    def _read_status(self):
+        status = _read_exact(self.sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(self.read_message())
+        raise AdbProtocolError(f"unexpected adb server reply {status!r}")
+
+    def read_message(self):
+        length = int(_read_exact(self.sock, 4), 16)
+        return _read_exact(self.sock, length).decode("utf-8", errors="replace")
+
+    def transport(self):
+        self.request(f"host:transport:{self.serial}" if self.serial else "host:transport-any")
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        # 关闭套接字，阻塞在 recv 上的线程随即出错返回
+        if self.returncode is None:
+            self.returncode = -9
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    close = kill
+
+    def stale(self):
+        # 空闲连接可读即已被对端关闭（或有残留数据），不能复用
+        try:
+            return bool(select.select([self.sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+
+def host_query(request, address=None, timeout=ADB_SOCKET_TIMEOUT):
+    # 主机服务（host:version、host:devices-l 等），返回回复内容
+    conn = AdbConnection(address=address, timeout=timeout)
+    try:
+        conn.request(request)
+        return conn.read_message()
+    finally:
+        conn.close()
+
+
+class SyncConnection(AdbConnection):
+    # sync: 服务连接，可连续执行多次 STAT/LIST/RECV，用完归还连接池
+    def __init__(self, serial=None, address=None, timeout=ADB_SOCKET_TIMEOUT):
+        super().__init__(serial, address, timeout)
+        try:
+            self.transport()
+            self.request("sync:")
+        except Exception:
+            self.close()
+            raise
+        self._buffer = None
+        # 正在传输时 poll() 返回 None，供取消时识别
+        self.returncode = 0
+
+    def _send(self, kind, path=b""):
+        if isinstance(path, str):
+            path = path.encode("utf-8")
+        self.sock.sendall(_SYNC_HEADER.pack(kind, len(path)) + path)
+
+    def _fail(self, length):
+        raise AdbError(_read_exact(self.sock, length).decode("utf-8", errors="replace"))
+
+    def stat(self, path):
+        # 返回 (mode, size, mtime)；不存在时 mode 为 0。size 为 32 位，超过 4 GB 的文件不准
+        self._send(b"STAT", path)
+        kind, mode, size, mtime = _SYNC_STAT.unpack(_read_exact(self.sock, _SYNC_STAT.size))
+        if kind != b"STAT":
+            raise AdbProtocolError(f"unexpected sync reply {kind!r}")
+        return mode, size, mtime
+
+    def list(self, path):
+        self._send(b"LIST", path)
+        entries = []
+        while True:
+            kind, mode, size, mtime, namelen = _SYNC_DENT.unpack(_read_exact(self.sock, _SYNC_DENT.size))
+            if kind == b"DONE":
+                return entries
+            if kind == b"FAIL":
+                self._fail(mode)
+            if kind != b"DENT":
+                raise AdbProtocolError(f"unexpected sync reply {kind!r}")
+            name = _read_exact(self.sock, namelen).decode("utf-8", errors="replace")
+            if name not in (".", ".."):
+                entries.append(SyncEntry(name, mode, size, mtime))
+
+    def recv(self, path, f, on_bytes=None):
+        # 把远端文件写入 f，返回字节数。DATA 包用 recv_into 直接收进缓冲区，
+        # 攒满 RECV_BUFFER_SIZE 后以 memoryview 整块写盘，中间不产生额外拷贝
+        if self._buffer is None:
+            self._buffer = bytearray(RECV_BUFFER_SIZE)
+        view = memoryview(self._buffer)
+        self._send(b"RECV", path)
+        filled = 0
+        total = 0
+        while True:
+            kind, length = _SYNC_HEADER.unpack(_read_exact(self.sock, _SYNC_HEADER.size))
+            if kind == b"DATA":
+                if length > len(view):
+                    raise AdbProtocolError(f"sync DATA packet too large: {length}")
+                if filled + length > len(view):
+                    _write_all(f, view[:filled])
+                    filled = 0
+                _read_into(self.sock, view[filled:filled + length])
+                filled += length
+                total += length
+                if on_bytes is not None:
+                    on_bytes(length)
+            elif kind == b"DONE":
+                break
+            elif kind == b"FAIL":
+                self._fail(length)
+            else:
+                raise AdbProtocolError(f"unexpected sync reply {kind!r}")
+        if filled:
+            _write_all(f, view[:filled])
+        return total
+
+    def pull(self, remote_path, local_path, on_bytes=None):
+        # 与 adb pull 相同：文件拉到 local_path，目录递归拉到 local_path 下；保留远端 mtime。
+        # 返回 (文件数, 字节数)
+        self.returncode = None
+        try:
+            mode, _, mtime = self.stat(remote_path)
+            if mode == 0:
+                raise AdbError(f"failed to stat remote object '{remote_path}': No such file or directory")
+            if stat.S_ISDIR(mode):
+                return self._pull_dir(remote_path, local_path, on_bytes)
+            return 1, self._pull_file(remote_path, local_path, mtime, on_bytes)
+        finally:
+            if self.returncode is None:
+                self.returncode = 0
+
+    def _pull_file(self, remote_path, local_path, mtime, on_bytes):
+        # 无缓冲打开：recv 已按大块写，不需要再经一层 BufferedWriter。失败（FAIL、断开、取消）时不留半个文件
+        try:
+            with open(local_path, "wb", buffering=0) as f:
+                size = self.recv(remote_path, f, on_bytes)
+        except BaseException:
+            try:
+                os.remove(local_path)
+            except OSError:
+                pass
+            raise
+        if mtime:
+            os.utime(local_path, (mtime, mtime))
+        return size
+
+    def _check_readable(self, remote_dir):
+        # LIST 对无权读取的目录（如未 root 的 /data/anr）与空目录一样只回 DONE；
+        # 列表为空时再确认一次，与 adb pull 一样把权限错误报给调用方
+        stream = AdbStream(f"exec:test -r {shlex.quote(remote_dir)} -a -x {shlex.quote(remote_dir)} && echo ok",
+                           self.serial, self.address, ADB_SOCKET_TIMEOUT)
+        try:
+            readable = stream.stdout.read().strip() == b"ok"
+        finally:
+            stream.kill()
+        if not readable:
+            raise AdbError(f"adb: error: failed to read directory '{remote_dir}': Permission denied")
+
+    def _pull_dir(self, remote_dir, local_dir, on_bytes):
+        entries = self.list(remote_dir)
+        if not entries:
+            self._check_readable(remote_dir)
+        os.makedirs(local_dir, exist_ok=True)
+        files = 0
+        total = 0
+        for entry in entries:
+            remote_path = posixpath.join(remote_dir, entry.name)
+            local_path = os.path.join(local_dir, entry.name)
+            if stat.S_ISDIR(entry.mode):
+                count, size = self._pull_dir(remote_path, local_path, on_bytes)
+            elif stat.S_ISREG(entry.mode) or stat.S_ISLNK(entry.mode):
+                count, size = 1, self._pull_file(remote_path, local_path, entry.mtime, on_bytes)
+            else:
+                continue
+            files += count
+            total += size
+        return files, total
+
+    def quit(self):
+        try:
+            self._send(b"QUIT")
+        except OSError:
+            pass
+        self.close()
+
+
+class _ShellV2Reader(io.RawIOBase):
+    # 把 shell,v2 的分包流还原成 stdout 字节流；stderr 丢弃（与 adb_popen 一致），退出码记到 exit_code
+    def __init__(self, raw):
+        super().__init__()
+        self._raw = raw
+        self._left = 0
+        self.exit_code = None
+
+    def readable(self):
+        return True
+
+    def _header(self):
+        data = self._raw.read(_SHELL_V2_HEADER.size)
+        if len(data) < _SHELL_V2_HEADER.size:
+            return None, 0
+        return _SHELL_V2_HEADER.unpack(data)
+
+    def readinto(self, buffer):
+        while self._left == 0:
+            if self.exit_code is not None:
+                return 0
+            kind, length = self._header()
+            if kind is None:
+                # 没收到退出码就断开
+                self.exit_code = SHELL_LOST_EXIT_CODE
+                return 0
+            if kind == _SHELL_V2_STDOUT:
+                self._left = length
+            else:
+                payload = self._raw.read(length)
+                if kind == _SHELL_V2_EXIT:
+                    self.exit_code = payload[0] if payload else SHELL_LOST_EXIT_CODE
+        n = self._raw.readinto(memoryview(buffer)[:min(len(buffer), self._left)])
+        if not n:
+            self.exit_code = SHELL_LOST_EXIT_CODE
+            self._left = 0
+            return 0
+        self._left -= n
+        return n
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+class AdbStream(AdbConnection):
+    # shell:/exec: 服务的输出流，接口与 adb_popen 返回的 Popen 一致（stdout/poll/kill/wait）。
+    # 设备支持 shell_v2 时 shell 命令走 v2 协议，wait() 返回设备端的真实退出码（断开为 255）；
+    # exec: 服务与 adb exec-out 一样不回传退出码，读到 EOF 视为 0；被 kill 为 -9
+    def __init__(self, service, serial=None, address=None, timeout=None):
+        super().__init__(serial, address, ADB_SOCKET_TIMEOUT)
+        self._v2 = None
+        try:
+            if service.startswith("shell:") and "shell_v2" in device_features(serial, address):
+                service = "shell,v2,raw:" + service.partition(":")[2]
+                self._v2 = True
+            self.transport()
+            self.request(service)
+        except Exception:
+            self.close()
+            raise
+        # 流式读取可能长时间无数据（logcat、设备端 grep），不设超时
+        self.sock.settimeout(timeout)
+        raw = self.sock.makefile("rb", buffering=STREAM_BUFFER_SIZE)
+        if self._v2:
+            self._v2 = _ShellV2Reader(raw)
+            self.stdout = io.BufferedReader(self._v2, buffer_size=STREAM_BUFFER_SIZE)
+        else:
+            self.stdout = raw
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            if not self.stdout.closed:
+                while self.stdout.read(STREAM_BUFFER_SIZE):
+                    pass
+            if self.returncode is None:
+                self.returncode = self._v2.exit_code if self._v2 else 0
+            self.sock.close()
+        return self.returncode
+
+    def kill(self):
+        super().kill()
+        try:
+            self.stdout.close()
+        except (OSError, ValueError):
+            pass
+
+
+_sync_pool = {}
+_sync_pool_lock = threading.Lock()
+
+
+def acquire_sync(serial=None, address=None):
+    # 从连接池取一条可用的 sync 连接，没有就新建
+    key = (address or ADB_SERVER_ADDRESS, serial)
+    while True:
+        with _sync_pool_lock:
+            idle = _sync_pool.get(key)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            return SyncConnection(serial, address)
+        if conn.stale():
+            conn.close()
+            continue
+        return conn
+
+
+def release_sync(conn, reuse=True):
+    # 出错或被取消的连接状态不可知，直接关闭
+    key = (conn.address, conn.serial)
+    if reuse and conn.returncode == 0:
+        with _sync_pool_lock:
+            idle = _sync_pool.setdefault(key, [])
+            if len(idle) < SYNC_POOL_SIZE:
+                idle.append(conn)
+                return
+    conn.quit()
+
+
+def close_sync_pool():
+    with _sync_pool_lock:
+        conns = [conn for idle in _sync_pool.values() for conn in idle]
+        _sync_pool.clear()
+    for conn in conns:
+        conn.quit()
+
+
+# 地址 -> (可用截止时间, 不可用截止时间)
+_server_state = {}
+
+
+def server_available(address=None):
+    # 探测 adb server，结果按地址缓存 SERVER_RETRY_INTERVAL 秒；
+    # 不可达期间调用方走 adb 子进程（adb 可执行文件会顺带拉起 server）
+    address = address or ADB_SERVER_ADDRESS
+    now = time.monotonic()
+    up_until, down_until = _server_state.get(address, (0.0, 0.0))
+    if now < up_until:
+        return True
+    if now < down_until:
+        return False
+    try:
+        host_query("host:version", address, timeout=2)
+    except (OSError, AdbError):
+        mark_server_down(address)
+        return False
+    _server_state[address] = (now + SERVER_RETRY_INTERVAL, 0.0)
+    return True
+
+
+def mark_server_down(address=None):
+    _server_state[address or ADB_SERVER_ADDRESS] = (0.0, time.monotonic() + SERVER_RETRY_INTERVAL)
+
+
+# (地址, 序列号) -> 设备特性集合；同一台设备连着时不会变
+_features = {}
+
+
+def device_features(serial=None, address=None):
+    # host-serial:<serial>:features / host:features（默认设备）；查询失败按无特性处理，退回 v1
+    key = (address or ADB_SERVER_ADDRESS, serial)
+    if key not in _features:
+        try:
+            text = host_query(f"host-serial:{serial}:features" if serial else "host:features", address)
+        except AdbError:
+            text = ""
+        _features[key] = frozenset(text.strip().split(","))
+    return _features[key]
+
+
+def list_devices_text(address=None):
+    # 与 adb devices -l 的设备行格式相同（无表头）
+    return host_query("host:devices-l", address)
+
+
+def open_stream(command, serial=None, address=None):
+    # command 为 adb 子命令列表：['exec-out', cmd] 或 ['shell', cmd...]
+    service = "exec:" if command[0] == "exec-out" else "shell:"
+    return AdbStream(service + " ".join(command[1:]), serial, address)
+
+
+def pull(remote_path, local_path, serial=None, on_bytes=None, on_connection=None, address=None):
+    # 用池化的 sync 连接拉取；on_connection(conn) 在传输开始前回调（登记以便取消）。返回 (文件数, 字节数)
+    conn = acquire_sync(serial, address)
+    reuse = False
+    try:
+        if on_connection is not None:
+            on_connection(conn)
+        result = conn.pull(remote_path, local_path, on_bytes)
+        reuse = True
+        return result
+    finally:
+        release_sync(conn, reuse)
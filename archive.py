@@ -0,0 +1,495 @@
+import io
+import json
+import os
+import shutil
+import time
+import traceback
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+from pull_log import (
+    LOG_OUTPUT_ROOT,
+    METRICS_FILE_NAME,
+    STORE_DIR_NAME,
+    IncrementalStore,
+    format_size,
+)
+
+# 本地归档的后台维护：按 年龄 / 总大小 / 单设备配额 清理旧会话，把较旧的会话原地压缩成可随机读取的归档。
+# 每个文件按固定大小的块独立压缩后拼接（gzip 多成员 / zstd 多帧），标准工具可直接解压；
+# 块偏移记在会话目录下的 .archive.json，open_log() 据此只解压用到的块
+ARCHIVE_MANIFEST_NAME = ".archive.json"
+ARCHIVE_BLOCK_SIZE = 1024 * 1024
+# 小于该大小的文件不压缩
+ARCHIVE_MIN_FILE_SIZE = 64 * 1024
+# 不压缩的文件：已压缩、索引、指标、未完成的传输等
+ARCHIVE_SKIP_SUFFIXES = (".gz", ".zst", ".zip", ".idx", ".json", ".jsonl", ".db", ".part", ".tmp")
+# 默认策略：超过 N 天的会话压缩；超过 N 天的会话删除（0 为不限）；总大小 / 单设备配额（字节，0 为不限）
+ARCHIVE_COMPRESS_AFTER_DAYS = 3
+ARCHIVE_MAX_AGE_DAYS = 90
+ARCHIVE_MAX_TOTAL_BYTES = 0
+ARCHIVE_DEVICE_QUOTA_BYTES = 0
+# 最近这段时间内有改动的会话视为正在使用（拉取中），不压缩也不删除
+ARCHIVE_IDLE_SECONDS = 3600
+ARCHIVE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# 有拉取/kill 在跑时暂停派发压缩，轮询间隔（秒）
+ARCHIVE_PAUSE_POLL = 1.0
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+
+CODEC_GZIP = "gzip"
+CODEC_ZSTD = "zstd"
+_CODEC_SUFFIX = {CODEC_GZIP: ".gz", CODEC_ZSTD: ".zst"}
+
+# path: 会话目录或多设备会话里的设备子目录；device: 设备目录名（单设备会话为 metrics 里的序列号或 "default"）
+ArchiveUnit = namedtuple("ArchiveUnit", ["session", "device", "path", "started", "modified", "size"])
+
+
+def _zstd():
+    # zstd 为可选依赖（pip install zstandard），没有时用 gzip
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def default_codec():
+    return CODEC_ZSTD if _zstd() is not None else CODEC_GZIP
+
+
+def _lower_priority():
+    # 进程池初始化：把压缩进程降到后台优先级，不与拉取争 CPU 和磁盘
+    try:
+        if os.name == 'nt':
+            import ctypes
+            # PROCESS_MODE_BACKGROUND_BEGIN：同时降低 CPU、I/O 与内存优先级
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), 0x00100000)
+        else:
+            os.nice(19)
+            try:
+                import psutil
+                psutil.Process().ionice(psutil.IOPRIO_CLASS_IDLE)
+            except (ImportError, AttributeError, OSError):
+                pass
+    except Exception:
+        traceback.print_exc()
+
+
+def _compress_block(data, codec):
+    if codec == CODEC_ZSTD:
+        return _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress_block(data, codec):
+    if codec == CODEC_ZSTD:
+        return _zstd().ZstdDecompressor().decompress(data)
+    return zlib.decompress(data, 31)
+
+
+def compress_file(path, codec=CODEC_GZIP, block_size=ARCHIVE_BLOCK_SIZE):
+    # 进程池 worker：把 path 压成 path.gz / path.zst（块独立压缩），返回清单条目；原文件由调用方删除
+    st = os.stat(path)
+    target = path + _CODEC_SUFFIX[codec]
+    offsets = [0]
+    with open(path, "rb") as src, open(target + ".tmp", "wb") as out:
+        while True:
+            data = src.read(block_size)
+            if not data:
+                break
+            out.write(_compress_block(data, codec))
+            offsets.append(out.tell())
+    os.replace(target + ".tmp", target)
+    os.utime(target, (st.st_mtime, st.st_mtime))
+    return {"codec": codec, "size": st.st_size, "mtime": st.st_mtime, "block": block_size, "offsets": offsets}
+
+
+def load_archive_manifest(directory):
+    try:
+        with open(os.path.join(directory, ARCHIVE_MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_archive_manifest(directory, manifest):
+    path = os.path.join(directory, ARCHIVE_MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+class ArchivedLog(io.RawIOBase):
+    # 归档文件的随机读取：按需打开、只解压用到的块，并缓存最近一个块；
+    # 偏移与原始文件一致，全文索引里记录的字节偏移可以直接 seek
+    def __init__(self, archive_path, entry):
+        super().__init__()
+        self.archive_path = archive_path
+        self.codec = entry["codec"]
+        self.size = entry["size"]
+        self.block = entry["block"]
+        self.offsets = entry["offsets"]
+        self._file = None
+        self._pos = 0
+        self._cached = (None, b"")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def _load(self, index):
+        if self._cached[0] != index:
+            if self._file is None:
+                self._file = open(self.archive_path, "rb")
+            self._file.seek(self.offsets[index])
+            data = self._file.read(self.offsets[index + 1] - self.offsets[index])
+            self._cached = (index, _decompress_block(data, self.codec))
+        return self._cached[1]
+
+    def readinto(self, buffer):
+        if self._pos >= self.size:
+            return 0
+        index, start = divmod(self._pos, self.block)
+        data = self._load(index)
+        n = min(len(buffer), len(data) - start)
+        buffer[:n] = data[start:start + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+def _find_archive_entry(path):
+    # 从文件所在目录向上找会话的 .archive.json（单设备会话在会话根，多设备在设备子目录）
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    for _ in range(8):
+        manifest = load_archive_manifest(directory)
+        relpath = os.path.relpath(path, directory).replace(os.sep, "/")
+        if relpath in manifest:
+            return directory, manifest[relpath]
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return None, None
+
+
+def open_log(path):
+    # 以二进制方式打开拉取下来的日志；已归档的文件透明解压。返回可 seek 的缓冲读取对象
+    if os.path.exists(path):
+        return open(path, "rb")
+    _, entry = _find_archive_entry(path)
+    if entry is None:
+        raise FileNotFoundError(path)
+    archive_path = path + _CODEC_SUFFIX[entry["codec"]]
+    return io.BufferedReader(ArchivedLog(archive_path, entry), buffer_size=64 * 1024)
+
+
+def list_logs(directory):
+    # 目录下可查看的文件（绝对路径，已压缩的给出原文件名，可直接交给 open_log），跳过隐藏文件
+    paths = set()
+    archived = set()
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        if ARCHIVE_MANIFEST_NAME in filenames:
+            for relpath, entry in load_archive_manifest(dirpath).items():
+                path = os.path.normpath(os.path.join(dirpath, relpath))
+                if os.path.exists(path + _CODEC_SUFFIX[entry["codec"]]):
+                    paths.add(path)
+                    archived.add(path + _CODEC_SUFFIX[entry["codec"]])
+        for name in filenames:
+            if not name.startswith("."):
+                paths.add(os.path.normpath(os.path.join(dirpath, name)))
+    return sorted(paths - archived)
+
+
+def log_stat(path):
+    # 原始文件的 (大小, mtime)；已压缩时取清单里记录的值，与压缩前一致
+    if os.path.exists(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+    _, entry = _find_archive_entry(path)
+    if entry is None:
+        raise FileNotFoundError(path)
+    return entry["size"], entry["mtime"]
+
+
+def log_mtime(path):
+    return log_stat(path)[1]
+
+
+def _session_started(name):
+    # 只有 %Y%m%d%H%M%S 命名的目录是拉取会话；其它目录（用户自建的笔记等）返回 None，整理时一律不碰
+    if len(name) != 14 or not name.isdigit():
+        return None
+    try:
+        return datetime.strptime(name, "%Y%m%d%H%M%S").timestamp()
+    except ValueError:
+        return None
+
+
+def _tree_stats(path):
+    # (字节数, 最近修改时间)；修改时间取文件而非目录，压缩后的文件保留原 mtime，整理本身不会让会话显得"正在使用"。
+    # 字节数只计删除后真正释放的部分：增量拉取的文件与 .store 中的 blob 是硬链接（st_nlink > 1），
+    # blob 仍被清单引用时删除会话不释放空间，不计入
+    size = 0
+    modified = None
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            if st.st_nlink == 1:
+                size += st.st_size
+            if name != ARCHIVE_MANIFEST_NAME:
+                modified = st.st_mtime if modified is None else max(modified, st.st_mtime)
+    return size, modified if modified is not None else os.path.getmtime(path)
+
+
+def _metrics_serial(path):
+    try:
+        with open(os.path.join(path, METRICS_FILE_NAME), "r", encoding="utf-8") as f:
+            return json.loads(f.readline()).get("serial") or "default"
+    except (OSError, ValueError):
+        return "default"
+
+
+def list_units(root=LOG_OUTPUT_ROOT):
+    # 归档里的会话单元：多设备会话按设备子目录拆开，单设备会话整体一个单元；按开始时间从旧到新
+    units = []
+    if not os.path.isdir(root):
+        return units
+    for session in sorted(os.listdir(root)):
+        session_dir = os.path.join(root, session)
+        started = _session_started(session)
+        if started is None or not os.path.isdir(session_dir):
+            continue
+        devices = []
+        if not os.path.exists(os.path.join(session_dir, METRICS_FILE_NAME)):
+            devices = [d for d in sorted(os.listdir(session_dir))
+                       if os.path.exists(os.path.join(session_dir, d, METRICS_FILE_NAME))]
+        if devices:
+            for device in devices:
+                size, modified = _tree_stats(os.path.join(session_dir, device))
+                units.append(ArchiveUnit(session, device, os.path.join(session_dir, device), started, modified, size))
+        else:
+            size, modified = _tree_stats(session_dir)
+            units.append(ArchiveUnit(session, _metrics_serial(session_dir), session_dir, started, modified, size))
+    units.sort(key=lambda u: (u.started, u.session, u.device))
+    return units
+
+
+def _remove_unit(root, unit):
+    shutil.rmtree(unit.path, ignore_errors=True)
+    session_dir = os.path.join(root, unit.session)
+    if unit.path != session_dir and os.path.isdir(session_dir) and not any(
+            not name.startswith(".") for name in os.listdir(session_dir)):
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+
+def plan_retention(units, now=None, max_age_days=ARCHIVE_MAX_AGE_DAYS, max_total_bytes=ARCHIVE_MAX_TOTAL_BYTES,
+                   device_quota_bytes=ARCHIVE_DEVICE_QUOTA_BYTES, idle_seconds=ARCHIVE_IDLE_SECONDS):
+    # 返回要删除的单元（按从旧到新），依次按 年龄、单设备配额、总大小；正在使用的单元不删
+    now = now or time.time()
+    removed = []
+    kept = []
+    for unit in units:
+        active = now - unit.modified < idle_seconds
+        if max_age_days and not active and now - unit.started > max_age_days * 86400:
+            removed.append(unit)
+        else:
+            kept.append(unit)
+    if device_quota_bytes:
+        usage = {}
+        for unit in reversed(kept):
+            usage[unit.device] = usage.get(unit.device, 0) + unit.size
+            if usage[unit.device] > device_quota_bytes and now - unit.modified >= idle_seconds:
+                removed.append(unit)
+                usage[unit.device] -= unit.size
+        kept = [unit for unit in kept if unit not in removed]
+    if max_total_bytes:
+        total = sum(unit.size for unit in kept)
+        for unit in list(kept):
+            if total <= max_total_bytes:
+                break
+            if now - unit.modified >= idle_seconds:
+                removed.append(unit)
+                kept.remove(unit)
+                total -= unit.size
+    removed.sort(key=lambda u: (u.started, u.session, u.device))
+    return removed
+
+
+def _compress_candidates(directory, manifest):
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name.startswith(".") or name.endswith(ARCHIVE_SKIP_SUFFIXES):
+                continue
+            # 已压缩过（上次删除原文件前中断）或同名压缩文件已存在的不再处理
+            if os.path.relpath(path, directory).replace(os.sep, "/") in manifest or any(
+                    os.path.exists(path + suffix) for suffix in _CODEC_SUFFIX.values()):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # 与 .store 共享数据的硬链接不压缩：删掉这个链接不释放空间，压缩件反而多占一份
+            if st.st_size < ARCHIVE_MIN_FILE_SIZE or st.st_nlink > 1:
+                continue
+            yield path
+
+
+def _wait_idle(should_pause, check_cancel):
+    while should_pause is not None and should_pause():
+        if check_cancel is not None:
+            check_cancel()
+        time.sleep(ARCHIVE_PAUSE_POLL)
+    if check_cancel is not None:
+        check_cancel()
+
+
+def compact_units(units, codec=None, workers=ARCHIVE_WORKERS, on_progress=None, check_cancel=None, should_pause=None):
+    # 在低优先级进程池里压缩这些单元下的文件；同时在途的任务不超过 workers 个，
+    # should_pause() 为真时不再派发（有拉取在跑），check_cancel() 用于中途取消。
+    # 返回 {files, before, after, seconds}
+    if codec is None or (codec == CODEC_ZSTD and _zstd() is None):
+        codec = default_codec()
+    started = time.perf_counter()
+    result = {"files": 0, "before": 0, "after": 0}
+    jobs = []
+    for unit in units:
+        manifest = load_archive_manifest(unit.path)
+        jobs.extend((unit.path, path) for path in _compress_candidates(unit.path, manifest))
+    if not jobs:
+        result["seconds"] = round(time.perf_counter() - started, 4)
+        return result
+    if on_progress is not None:
+        on_progress(f"Archive: compressing {len(jobs)} files ({codec}) in {len(units)} sessions")
+    manifests = {}
+    pending = {}
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_lower_priority) as pool:
+            queue = list(reversed(jobs))
+            while queue or pending:
+                while queue and len(pending) < max(1, workers):
+                    _wait_idle(should_pause, check_cancel)
+                    directory, path = queue.pop()
+                    pending[pool.submit(compress_file, path, codec)] = (directory, path)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory, path = pending.pop(future)
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        traceback.print_exc()
+                        if on_progress is not None:
+                            on_progress(f"Archive: {path}: {e}")
+                        continue
+                    manifest = manifests.setdefault(directory, load_archive_manifest(directory))
+                    manifest[os.path.relpath(path, directory).replace(os.sep, "/")] = entry
+                    # 先落清单再删原文件：中途中断时原文件仍在，下次重新压缩即可
+                    _save_archive_manifest(directory, manifest)
+                    compressed = os.path.getsize(path + _CODEC_SUFFIX[codec])
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        # Windows 下文件正被查看器映射时删不掉；open_log 优先读原文件，下次整理不再重复压缩
+                        traceback.print_exc()
+                        continue
+                    result["files"] += 1
+                    result["before"] += entry["size"]
+                    result["after"] += compressed
+    finally:
+        for future in pending:
+            future.cancel()
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    if on_progress is not None:
+        on_progress(f"Archive: {result['files']} files {format_size(result['before'])} -> "
+                    f"{format_size(result['after'])} in {result['seconds']:.1f}s")
+    return result
+
+
+def gc_store(root=LOG_OUTPUT_ROOT):
+    # 回收增量存储里不再被清单引用的 blob（设备端文件已变化，旧版本不会再被复用）；
+    # 会话中的硬链接各自保有数据，删除 blob 不影响已拉取的日志。返回 (删除数, 字节数)
+    if not os.path.isdir(os.path.join(root, STORE_DIR_NAME)):
+        return 0, 0
+    return IncrementalStore(root).collect_garbage(ARCHIVE_IDLE_SECONDS)
+
+
+def _forget_sessions(root, sessions):
+    # 删除的会话从全文索引中移除，避免搜索结果指向不存在的文件
+    from log_search import SEARCH_DB_NAME, SearchIndex, SearchIndexError
+    if not sessions or not os.path.exists(os.path.join(root, SEARCH_DB_NAME)):
+        return
+    try:
+        index = SearchIndex(root)
+        try:
+            index.remove_sessions(sessions)
+        finally:
+            index.close()
+    except SearchIndexError:
+        traceback.print_exc()
+
+
+def run_maintenance(root=LOG_OUTPUT_ROOT, compress_after_days=ARCHIVE_COMPRESS_AFTER_DAYS,
+                    max_age_days=ARCHIVE_MAX_AGE_DAYS, max_total_bytes=ARCHIVE_MAX_TOTAL_BYTES,
+                    device_quota_bytes=ARCHIVE_DEVICE_QUOTA_BYTES, codec=None, workers=ARCHIVE_WORKERS,
+                    dry_run=False, on_progress=None, check_cancel=None, should_pause=None):
+    # 一次维护：先按策略删除（最快释放空间），再压缩较旧的会话，最后回收增量存储里失去引用的 blob
+    def emit(message):
+        if on_progress is not None:
+            on_progress(message)
+
+    now = time.time()
+    units = list_units(root)
+    removed = plan_retention(units, now, max_age_days, max_total_bytes, device_quota_bytes)
+    result = {"units": len(units), "removed": [{"session": u.session, "device": u.device, "bytes": u.size}
+                                               for u in removed],
+              "freed": sum(u.size for u in removed)}
+    emit(f"Archive: {len(units)} sessions, {format_size(sum(u.size for u in units))}; "
+         f"retention removes {len(removed)} ({format_size(result['freed'])})")
+    removed_paths = {u.path for u in removed}
+    eligible = [u for u in units if u.path not in removed_paths
+                and now - u.started > compress_after_days * 86400 and now - u.modified >= ARCHIVE_IDLE_SECONDS]
+    result["compress_candidates"] = len(eligible)
+    if dry_run:
+        return result
+    for unit in removed:
+        if check_cancel is not None:
+            check_cancel()
+        emit(f"Archive: remove {unit.session}/{unit.device} ({format_size(unit.size)})")
+        _remove_unit(root, unit)
+    _forget_sessions(root, sorted({u.session for u in removed if not os.path.exists(os.path.join(root, u.session))}))
+    result["compress"] = compact_units(eligible, codec, workers, on_progress, check_cancel, should_pause)
+    result["store_removed"], result["store_freed"] = gc_store(root)
+    if result["store_removed"]:
+        emit(f"Archive: released {result['store_removed']} unreferenced store blobs "
+             f"({format_size(result['store_freed'])})")
+    return result
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pull_log
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+# 合成设备上的服务，与真实列表规模相当
+BENCH_SERVICES = ["NavigationService", "CoreService", "can_service", "OTAService", "launcher",
+                  "pudutech-mirsdk.g3log", "mirsdk.g3log"]
+
+
+def _measure(func, *args, **kwargs):
+    before = pull_log.adb_round_trips()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    return result, elapsed, pull_log.adb_round_trips() - before
+
+
+def bench_find(folder, extension, serial=None):
+    # 对比逐目录爬取与单次 find 的往返次数和耗时
+    rows = []
+    for label, func in (("crawl (ls + test -d)", pull_log._find_files_recursive_crawl),
+                        ("single find", pull_log.find_files_recursive)):
+        files, elapsed, trips = _measure(func, folder, extension, serial=serial)
+        rows.append((label, len(files), trips, elapsed))
+    print(f"find_files_recursive({folder!r}, {extension!r})")
+    print(f"{'method':<24}{'files':>8}{'round-trips':>14}{'seconds':>10}")
+    for label, count, trips, elapsed in rows:
+        print(f"{label:<24}{count:>8}{trips:>14}{elapsed:>10.3f}")
+    return rows
+
+
+def use_fake_adb(root, latency=0.0, bandwidth=0.0, serials=None):
+    # 让 pull_log 的所有 adb 调用走 fake_adb.py；子进程通过环境变量拿到配置
+    os.environ["FAKE_ADB_ROOT"] = root
+    os.environ["FAKE_ADB_LATENCY"] = str(latency)
+    os.environ["FAKE_ADB_BANDWIDTH"] = str(bandwidth)
+    if serials:
+        os.environ["FAKE_ADB_SERIALS"] = ",".join(serials)
+    pull_log.ADB_COMMAND = [sys.executable, FAKE_ADB]
+    # 替身只接管 adb 可执行文件；直连 server 的对比见 _bench_native
+    pull_log.USE_NATIVE_ADB = False
+    for session in list(pull_log._shell_sessions.values()):
+        session.close()
+    pull_log._shell_sessions.clear()
+    with pull_log._catalogs_lock:
+        pull_log._catalogs.clear()
+
+
+def _row(name, elapsed, trips, nbytes=None, **extra):
+    row = {"name": name, "seconds": round(elapsed, 4), "round_trips": trips}
+    if nbytes is not None:
+        row["bytes"] = nbytes
+        row["mbps"] = round(nbytes / 1048576.0 / elapsed, 3) if elapsed else None
+    row.update(extra)
+    return row
+
+
+def _bench_pull(mode, catalog, out_root, workers, count, label=None):
+    index = catalog.log_index(BENCH_SERVICES)
+    selected = index.select(BENCH_SERVICES, count)
+    sizes = catalog.sizes()
+    name = f"{mode} {label}" if label else mode
+    local_dir = os.path.join(out_root, name.replace(" ", "-"))
+    os.makedirs(local_dir, exist_ok=True)
+    jobs = [pull_log.PullJob(f"{pull_log.REMOTE_LOG_DIR}/{name}", local_dir, sizes.get(name)) for name in selected]
+    jobs.append(pull_log.PullJob("/sdcard/pudu/log/kernel", local_dir, None))
+    jobs.append(pull_log.PullJob("/data/anr", local_dir, None))
+    stats = pull_log.TransferStats()
+    errors, elapsed, trips = _measure(pull_log.pull_jobs, jobs, mode, workers, None, stats)
+    return _row(f"pull [{name}]", elapsed, trips, stats.disk_bytes, items=len(jobs), errors=len(errors),
+                wire_bytes=stats.wire_bytes)
+
+
+def _start_fake_server():
+    # 独立进程起 fake adb server（同进程会与客户端争 GIL），返回 (进程, 地址)
+    import socket
+    import subprocess
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, FAKE_ADB, "--server", "--port", str(port)], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return proc, f"127.0.0.1:{port}"
+
+
+def _bench_native(catalog, out_root, workers, count):
+    # 直连 adb server（adb_client.py）：起 fake server 后再测逐文件与 tar 拉取
+    import adb_client
+
+    proc, address = _start_fake_server()
+    saved = (pull_log.USE_NATIVE_ADB, adb_client.ADB_SERVER_ADDRESS)
+    try:
+        adb_client.ADB_SERVER_ADDRESS = address
+        pull_log.USE_NATIVE_ADB = True
+        return [_bench_pull(mode, catalog, out_root, workers, count, label="native")
+                for mode in (pull_log.TRANSFER_PER_FILE, pull_log.TRANSFER_TAR)]
+    finally:
+        pull_log.USE_NATIVE_ADB, adb_client.ADB_SERVER_ADDRESS = saved
+        adb_client.close_sync_pool()
+        proc.kill()
+        proc.wait()
+
+
+def _bench_session(out_root, workers, count):
+    # 端到端走真实入口：命令行同款的 LogPuller.run（列表、选择、传输、指标落盘），
+    # 以及界面同款的任务队列（ANR/kernel 快照与 pdlog 分两个任务、kill 排在后面），计入排队与会话开销
+    from job_queue import (Job, JobQueue, PRIORITY_SNAPSHOT, PRIORITY_PULL, PRIORITY_KILL,
+                           STATE_DONE)
+
+    rows = []
+    # bytes_total() 只在设置了 on_bytes 时累计
+    on_bytes = lambda done, expected: None
+    pull_log.get_catalog().invalidate()
+    puller = pull_log.LogPuller(BENCH_SERVICES, count, False, True, True, workers=workers, on_bytes=on_bytes,
+                                output_root=os.path.join(out_root, "session"))
+    result, elapsed, trips = _measure(puller.run)
+    done, _ = puller.bytes_total()
+    rows.append(_row("session [LogPuller.run]", elapsed, trips, done, errors=len(result["failures"])))
+
+    pull_log.get_catalog().invalidate()
+    queue = JobQueue()
+    target_dir = os.path.join(out_root, "queued", datetime.now().strftime("%Y%m%d%H%M%S"))
+    before = pull_log.adb_round_trips()
+    started = time.perf_counter()
+    try:
+        snapshot = pull_log.LogPuller([], count, False, True, True, workers=workers, on_bytes=on_bytes)
+        pdlog = pull_log.LogPuller(BENCH_SERVICES, count, False, False, False, workers=workers, on_bytes=on_bytes)
+        jobs = [queue.submit(Job("pull anr/kernel", lambda job: snapshot.run(target_dir), PRIORITY_SNAPSHOT)),
+                queue.submit(Job("pull pdlog", lambda job: pdlog.run(target_dir), PRIORITY_PULL)),
+                queue.submit(Job("kill", lambda job: pull_log.kill_devices(pull_log.KILL_PACKAGES, False),
+                                 PRIORITY_KILL))]
+        for job in jobs:
+            job.wait()
+        elapsed = time.perf_counter() - started
+        stats = queue.stats()
+    finally:
+        queue.shutdown(cancel=False)
+    nbytes = snapshot.bytes_total()[0] + pdlog.bytes_total()[0]
+    rows.append(_row("session [queued jobs]", elapsed, pull_log.adb_round_trips() - before, nbytes,
+                     jobs=len(jobs), failed=sum(1 for job in jobs if job.state != STATE_DONE),
+                     avg_wait=round(stats["avg_wait"], 4), avg_run=round(stats["avg_run"], 4)))
+    return rows
+
+
+def _bench_kill(packages, parallel=False):
+    # 与界面 kill 任务相同的调用：一个脚本完成删除 pdlog + force-stop
+    result, elapsed, trips = _measure(pull_log.kill_device, packages, True, None, None, parallel)
+    return _row(f"kill [{'parallel' if parallel else 'serial'}]", elapsed, trips, packages=len(result["stopped"]),
+                deleted=len(result["deleted"]))
+
+
+def run_suite(files=20, size=64 * 1024, latency=0.02, bandwidth=0.0, workers=pull_log.DEFAULT_PULL_WORKERS,
+              count=5, keep=None):
+    # 在临时目录生成合成设备，依次测 列表/递归查找/选择/各模式拉取/kill，返回结果行
+    import fake_adb
+
+    work = keep or tempfile.mkdtemp(prefix="pulllog-bench-")
+    device_root = os.path.join(work, "device")
+    out_root = os.path.join(work, "out")
+    rows = []
+    try:
+        fake_adb.make_tree(device_root, BENCH_SERVICES, files, size, kernel_files=files)
+        use_fake_adb(device_root, latency, bandwidth)
+        pull_log.USE_SHELL_SESSION = False
+        names, elapsed, trips = _measure(pull_log.get_files_in_folder, pull_log.REMOTE_LOG_DIR)
+        rows.append(_row("get_files_in_folder [spawn]", elapsed, trips, entries=len(names)))
+        pull_log.USE_SHELL_SESSION = True
+        pull_log.get_shell_session().run("true")
+        names, elapsed, trips = _measure(pull_log.get_files_in_folder, pull_log.REMOTE_LOG_DIR)
+        rows.append(_row("get_files_in_folder [session]", elapsed, trips, entries=len(names)))
+        for label, func in (("find_files_recursive [crawl]", pull_log._find_files_recursive_crawl),
+                            ("find_files_recursive [find]", pull_log.find_files_recursive)):
+            found, elapsed, trips = _measure(func, "/sdcard/pudu/log/kernel", ".log")
+            rows.append(_row(label, elapsed, trips, entries=len(found)))
+        catalog = pull_log.get_catalog()
+        entries, elapsed, trips = _measure(catalog.entries)
+        rows.append(_row("catalog fetch", elapsed, trips, entries=len(entries)))
+        index, elapsed, trips = _measure(pull_log.LogIndex, names, BENCH_SERVICES)
+        rows.append(_row("LogIndex build", elapsed, trips, entries=len(names)))
+        selected, elapsed, trips = _measure(index.select, BENCH_SERVICES, count)
+        rows.append(_row("_select_logs", elapsed, trips, entries=len(selected)))
+        for mode in pull_log.TRANSFER_MODES:
+            rows.append(_bench_pull(mode, catalog, out_root, workers, count))
+        rows.extend(_bench_native(catalog, out_root, workers, count))
+        rows.extend(_bench_session(out_root, workers, count))
+        rows.append(_bench_kill(pull_log.KILL_PACKAGES))
+        rows.append(_bench_kill(pull_log.KILL_PACKAGES, parallel=True))
+    finally:
+        for session in list(pull_log._shell_sessions.values()):
+            session.close()
+        if keep is None:
+            shutil.rmtree(work, ignore_errors=True)
+    return rows
+
+
+def print_rows(rows):
+    print(f"{'benchmark':<34}{'seconds':>10}{'round-trips':>13}{'MB/s':>9}  extra")
+    for row in rows:
+        extra = {k: v for k, v in row.items() if k not in ("name", "seconds", "round_trips", "mbps")}
+        mbps = "" if row.get("mbps") is None else f"{row['mbps']:.2f}"
+        print(f"{row['name']:<34}{row['seconds']:>10.3f}{row['round_trips']:>13}{mbps:>9}  {extra}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PullLog adb 性能对比")
+    parser.add_argument("-s", "--serial", default=None)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_find = sub.add_parser("find", help="递归查找：逐目录爬取 vs 单次 find")
+    p_find.add_argument("folder", nargs="?", default="/sdcard/pudu/log/kernel")
+    p_find.add_argument("extension", nargs="?", default=".txt")
+    p_suite = sub.add_parser("suite", help="基于 fake_adb.py 的端到端基准，无需真机")
+    p_suite.add_argument("--files", type=int, default=20, help="每个服务的轮转文件数")
+    p_suite.add_argument("--size", type=int, default=64 * 1024, help="单个文件字节数")
+    p_suite.add_argument("--latency", type=float, default=0.02, help="每条 adb 命令附加延迟（秒）")
+    p_suite.add_argument("--bandwidth", type=float, default=0.0, help="带宽上限（字节/秒），0 不限")
+    p_suite.add_argument("--workers", type=int, default=pull_log.DEFAULT_PULL_WORKERS)
+    p_suite.add_argument("--count", type=int, default=5, help="每个服务拉取的份数")
+    p_suite.add_argument("--json", action="store_true", help="输出 JSON 行")
+    args = parser.parse_args(argv)
+    if args.cmd == "find":
+        bench_find(args.folder, args.extension, args.serial)
+    elif args.cmd == "suite":
+        rows = run_suite(args.files, args.size, args.latency, args.bandwidth, args.workers, args.count)
+        if args.json:
+            for row in rows:
+                print(json.dumps(row))
+        else:
+            print_rows(rows)
+
+
+if __name__ == '__main__':
+    main()
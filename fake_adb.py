@@ -0,0 +1,499 @@
+# 本地 adb 替身：把一个主机目录当作设备文件系统，用于没有真机时的基准测试。
+# 用法：python fake_adb.py [-s SERIAL] <adb 子命令...>，行为通过环境变量配置：
+#   FAKE_ADB_ROOT       设备根目录（其下的 sdcard/、data/ 即设备上的 /sdcard、/data）
+#   FAKE_ADB_LATENCY    每条命令的附加延迟（秒），模拟 USB/Wi-Fi 往返
+#   FAKE_ADB_BANDWIDTH  传输带宽上限（字节/秒），0 表示不限
+#   FAKE_ADB_SERIALS    adb devices 列出的序列号，逗号分隔
+#   FAKE_ADB_DROP_RATE  传输中每 64 KB 断线的概率（exec-out / pull），模拟不稳定的 Wi-Fi 连接
+#   FAKE_ADB_LOGCAT_RATE   adb logcat 每秒输出的行数
+#   FAKE_ADB_LOGCAT_LINES  adb logcat 输出多少行后断开（模拟设备重启），0 表示不断开
+# 设备命令交给主机 sh 执行，需要 POSIX 环境（Linux CI / WSL）。
+# python fake_adb.py --server [--port N] 则作为 adb server 监听，供 adb_client.py 直连测试：
+#   PULLLOG_ADB_NATIVE=1 PULLLOG_ADB_SERVER=127.0.0.1:N
+import argparse
+import os
+import random
+import re
+import shutil
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT_ENV = "FAKE_ADB_ROOT"
+LATENCY_ENV = "FAKE_ADB_LATENCY"
+BANDWIDTH_ENV = "FAKE_ADB_BANDWIDTH"
+SERIALS_ENV = "FAKE_ADB_SERIALS"
+DROP_RATE_ENV = "FAKE_ADB_DROP_RATE"
+LOGCAT_RATE_ENV = "FAKE_ADB_LOGCAT_RATE"
+LOGCAT_LINES_ENV = "FAKE_ADB_LOGCAT_LINES"
+DEFAULT_SERIAL = "FAKE0001"
+CHUNK_SIZE = 64 * 1024
+
+# 设备上的 am、GNU ls 的 ISO 时间格式（与 toybox ls -l 一致）
+SHELL_PRELUDE = (
+    "am() { :; }; "
+    "ls() { command ls --time-style=long-iso \"$@\" 2>/dev/null || command ls \"$@\"; }; "
+)
+_DEVICE_PATH_RE = re.compile(r"(^|[\s'\"=(])/(sdcard|data)(?=/|\b)")
+_HOST_PATH_RE = re.compile(rb"(^|[\s'\"=(])\./(sdcard|data)(?=/|\b)")
+
+
+def _config():
+    root = os.path.abspath(os.environ.get(ROOT_ENV, "fake_device"))
+    latency = float(os.environ.get(LATENCY_ENV, "0") or 0)
+    bandwidth = float(os.environ.get(BANDWIDTH_ENV, "0") or 0)
+    serials = [s for s in os.environ.get(SERIALS_ENV, DEFAULT_SERIAL).split(",") if s]
+    return root, latency, bandwidth, serials
+
+
+def to_host_command(command):
+    # 设备绝对路径 /sdcard/... 改成相对设备根目录的 ./sdcard/...，shell 以根目录为 cwd 执行
+    return _DEVICE_PATH_RE.sub(lambda m: m.group(1) + "./" + m.group(2), command)
+
+
+def to_device_output(data):
+    return _HOST_PATH_RE.sub(lambda m: m.group(1) + b"/" + m.group(2), data)
+
+
+class LinkDropped(Exception):
+    pass
+
+
+class Throttle:
+    # 令牌桶式限速：累计字节数超出带宽允许量时睡眠；drop_rate > 0 时按概率模拟断线
+    def __init__(self, bandwidth, drop_rate=0.0):
+        self.bandwidth = bandwidth
+        self.drop_rate = drop_rate
+        self.started = time.monotonic()
+        self.sent = 0
+
+    def consume(self, nbytes):
+        if self.drop_rate and random.random() < self.drop_rate:
+            raise LinkDropped()
+        if self.bandwidth <= 0:
+            return
+        self.sent += nbytes
+        ahead = self.sent / self.bandwidth - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _copy_stream(src, dst, throttle, rewrite=False):
+    while True:
+        chunk = src.read1(CHUNK_SIZE) if hasattr(src, "read1") else src.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if rewrite:
+            chunk = to_device_output(chunk)
+        throttle.consume(len(chunk))
+        dst.write(chunk)
+        dst.flush()
+
+
+def _drop_rate(rewrite=False):
+    # 只对二进制传输注入断线，shell 文本命令保持可靠
+    return 0.0 if rewrite else float(os.environ.get(DROP_RATE_ENV, "0") or 0)
+
+
+def run_device_command(root, command, bandwidth, rewrite, out=None):
+    proc = subprocess.Popen(["sh", "-c", SHELL_PRELUDE + to_host_command(command)], cwd=root,
+                            stdout=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    try:
+        _copy_stream(proc.stdout, out or sys.stdout.buffer, Throttle(bandwidth, _drop_rate(rewrite)), rewrite)
+    except (LinkDropped, OSError):
+        proc.kill()
+        proc.wait()
+        sys.stderr.write("error: connection reset\n")
+        return 1
+    return proc.wait()
+
+
+def run_interactive_shell(root, latency, bandwidth):
+    # adb shell 无参数：逐行读 stdin 交给同一个 sh，模拟常驻会话
+    proc = subprocess.Popen(["sh"], cwd=root, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    pump = threading.Thread(target=_copy_stream, args=(proc.stdout, sys.stdout.buffer, Throttle(bandwidth), True),
+                            daemon=True)
+    pump.start()
+    proc.stdin.write(SHELL_PRELUDE.encode() + b"\n")
+    for line in sys.stdin.buffer:
+        if latency:
+            time.sleep(latency)
+        proc.stdin.write(to_host_command(line.decode("utf-8", errors="replace")).encode("utf-8"))
+        proc.stdin.flush()
+    proc.stdin.close()
+    code = proc.wait()
+    pump.join()
+    return code
+
+
+def _host_path(root, device_path):
+    return os.path.join(root, device_path.lstrip("/"))
+
+
+def _pull_one(src, dst, throttle):
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            chunk = fin.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            throttle.consume(len(chunk))
+            fout.write(chunk)
+    shutil.copystat(src, dst)
+
+
+def pull(root, remote, local, bandwidth):
+    src = _host_path(root, remote)
+    if not os.path.exists(src):
+        sys.stderr.write(f"adb: error: failed to stat remote object '{remote}': No such file or directory\n")
+        return 1
+    dst = local
+    if os.path.isdir(local):
+        dst = os.path.join(local, os.path.basename(src.rstrip("/")))
+    throttle = Throttle(bandwidth, _drop_rate())
+    try:
+        count = _pull_tree(src, dst, throttle)
+    except LinkDropped:
+        sys.stderr.write(f"adb: error: failed to copy '{remote}' to '{dst}': connection reset\n")
+        return 1
+    print(f"{remote}: {count} file{'s' if count != 1 else ''} pulled.")
+    return 0
+
+
+def _pull_tree(src, dst, throttle):
+    count = 0
+    if os.path.isdir(src):
+        for dirpath, _, filenames in os.walk(src):
+            target_dir = os.path.join(dst, os.path.relpath(dirpath, src))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in filenames:
+                _pull_one(os.path.join(dirpath, name), os.path.join(target_dir, name), throttle)
+                count += 1
+    else:
+        _pull_one(src, dst, throttle)
+        count = 1
+    return count
+
+
+def logcat(args):
+    # 合成 logcat 流：threadtime 文本或 -B 二进制（logger_entry v4）；-T <epoch> 只输出该时间之后的行
+    rate = float(os.environ.get(LOGCAT_RATE_ENV, "200") or 200)
+    limit = int(os.environ.get(LOGCAT_LINES_ENV, "0") or 0)
+    binary = "-B" in args
+    since = float(args[args.index("-T") + 1]) if "-T" in args else None
+    out = sys.stdout.buffer
+    count = 0
+    try:
+        while not limit or count < limit:
+            now = time.time()
+            if since is None or now > since:
+                message = f"fake logcat line {count}"
+                if binary:
+                    payload = b"\x04" + b"FakeTag\0" + message.encode() + b"\0"
+                    sec = int(now)
+                    out.write(struct.pack("<HHiIIIII", len(payload), 28, 1000, 1001, sec, int((now - sec) * 1e9), 0, 0)
+                              + payload)
+                else:
+                    stamp = datetime.fromtimestamp(now).strftime("%m-%d %H:%M:%S.%f")[:-3]
+                    out.write(f"{stamp}  1000  1001 I FakeTag: {message}\n".encode())
+                out.flush()
+                count += 1
+            time.sleep(1.0 / rate)
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    return 0
+
+
+def _device_root(root, serial):
+    # 多设备：<root>/<serial> 存在时作为该设备的根目录
+    if serial and os.path.isdir(os.path.join(root, serial)):
+        return os.path.join(root, serial)
+    return root
+
+
+def _devices_text(serials):
+    return "".join(f"{s}\tdevice usb:1-1 product:fake model:FakeRobot device:fake transport_id:1\n" for s in serials)
+
+
+# 与较新的 adbd 一样声明 shell_v2，客户端据此改走带退出码的 shell,v2 协议
+DEVICE_FEATURES = "shell_v2,cmd"
+
+
+class _ShellV2Writer:
+    # shell,v2 输出：每块 stdout 包成 id 1 的分包，结束时补一个 id 3 的退出码包
+    def __init__(self, sock):
+        self.sock = sock
+
+    def write(self, data):
+        self.sock.sendall(struct.pack("<BI", 1, len(data)) + data)
+
+    def flush(self):
+        pass
+
+    def exit(self, code):
+        self.sock.sendall(struct.pack("<BIB", 3, 1, code & 0xff))
+
+
+class _ServerConnection:
+    # adb server 协议的一条连接：主机请求 -> (transport ->) 设备服务
+    def __init__(self, sock):
+        self.sock = sock
+        # 与真实 adb server 一样关掉 Nagle，否则连接复用时小包回复会卡在延迟确认上
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = sock.makefile("rb")
+        self.root, self.latency, self.bandwidth, self.serials = _config()
+
+    def read_exact(self, size):
+        data = self.reader.read(size)
+        if len(data) < size:
+            raise EOFError()
+        return data
+
+    def read_request(self):
+        return self.read_exact(int(self.read_exact(4), 16)).decode("utf-8", errors="replace")
+
+    def okay(self, message=None):
+        data = b"OKAY"
+        if message is not None:
+            payload = message.encode("utf-8")
+            data += b"%04x" % len(payload) + payload
+        self.sock.sendall(data)
+
+    def fail(self, message):
+        payload = message.encode("utf-8")
+        self.sock.sendall(b"FAIL" + b"%04x" % len(payload) + payload)
+
+    def serve(self):
+        request = self.read_request()
+        if request == "host:version":
+            self.okay("0029")
+        elif request in ("host:devices", "host:devices-l"):
+            self.okay(_devices_text(self.serials))
+        elif request == "host:features" or (request.startswith("host-serial:") and request.endswith(":features")):
+            self.okay(DEVICE_FEATURES)
+        elif request == "host:transport-any" or request.startswith("host:transport:"):
+            serial = request.split(":", 2)[2] if request.startswith("host:transport:") else self.serials[0]
+            if serial not in self.serials:
+                self.fail(f"device '{serial}' not found")
+                return
+            self.okay()
+            self.serve_device(_device_root(self.root, serial))
+        else:
+            self.fail(f"unknown host service {request}")
+
+    def serve_device(self, root):
+        service = self.read_request()
+        if self.latency:
+            time.sleep(self.latency)
+        if service == "sync:":
+            self.okay()
+            self.serve_sync(root)
+        elif service.startswith("shell,v2,raw:") and service.partition(":")[2]:
+            self.okay()
+            out = _ShellV2Writer(self.sock)
+            code = run_device_command(root, service.partition(":")[2], self.bandwidth, True, out)
+            try:
+                out.exit(code)
+            except OSError:
+                pass
+        elif service.startswith(("shell:", "exec:")) and service.partition(":")[2]:
+            # shell 输出里的路径改回设备形式；exec 为二进制流，原样输出
+            self.okay()
+            out = self.sock.makefile("wb")
+            run_device_command(root, service.partition(":")[2], self.bandwidth, service.startswith("shell:"), out)
+            try:
+                out.close()
+            except OSError:
+                pass
+        else:
+            self.fail(f"unsupported service {service}")
+
+    def serve_sync(self, root):
+        while True:
+            kind, length = struct.unpack("<4sI", self.read_exact(8))
+            path = self.read_exact(length).decode("utf-8", errors="replace")
+            if kind == b"QUIT":
+                return
+            if self.latency:
+                time.sleep(self.latency)
+            host = _host_path(root, path)
+            if kind == b"STAT":
+                try:
+                    st = os.stat(host)
+                    self.sock.sendall(struct.pack("<4sIII", b"STAT", st.st_mode, st.st_size & 0xffffffff,
+                                                  int(st.st_mtime)))
+                except OSError:
+                    self.sock.sendall(struct.pack("<4sIII", b"STAT", 0, 0, 0))
+            elif kind == b"LIST":
+                try:
+                    names = sorted(os.listdir(host))
+                except OSError:
+                    names = []
+                data = b""
+                for name in names:
+                    try:
+                        st = os.lstat(os.path.join(host, name))
+                    except OSError:
+                        continue
+                    encoded = name.encode("utf-8")
+                    data += struct.pack("<4sIIII", b"DENT", st.st_mode, st.st_size & 0xffffffff, int(st.st_mtime),
+                                        len(encoded)) + encoded
+                self.sock.sendall(data + struct.pack("<4sIIII", b"DONE", 0, 0, 0, 0))
+            elif kind == b"RECV":
+                if not self.send_file(host, path):
+                    return
+            else:
+                self.fail(f"unknown sync request {kind!r}")
+                return
+
+    def send_file(self, host, path):
+        # 返回 False 表示模拟断线，连接需关闭
+        if not os.path.isfile(host) or not os.access(host, os.R_OK):
+            message = f"remote object '{path}' does not exist".encode("utf-8")
+            self.sock.sendall(struct.pack("<4sI", b"FAIL", len(message)) + message)
+            return True
+        throttle = Throttle(self.bandwidth, _drop_rate())
+        try:
+            with open(host, "rb") as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    throttle.consume(len(chunk))
+                    self.sock.sendall(struct.pack("<4sI", b"DATA", len(chunk)) + chunk)
+        except LinkDropped:
+            return False
+        self.sock.sendall(struct.pack("<4sI", b"DONE", 0))
+        return True
+
+
+class _ServerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            _ServerConnection(self.request).serve()
+        except (EOFError, OSError):
+            pass
+
+
+def start_server(port=0, host="127.0.0.1"):
+    # 在后台线程里起 fake adb server（port=0 取随机端口），返回 server，调用方负责 shutdown()
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer((host, port), _ServerHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve(port, host="127.0.0.1"):
+    server = start_server(port, host)
+    print(f"fake adb server listening on {host}:{server.server_address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    server.server_close()
+    return 0
+
+
+def fake_main(argv):
+    root, latency, bandwidth, serials = _config()
+    args = list(argv)
+    serial = None
+    if args[:1] == ["-s"] and len(args) > 1:
+        serial = args[1]
+        args = args[2:]
+    if not args:
+        sys.stderr.write("fake adb: no command\n")
+        return 1
+    root = _device_root(root, serial)
+    cmd = args[0]
+    if cmd == "devices":
+        print("List of devices attached")
+        sys.stdout.write(_devices_text(serials))
+        print()
+        return 0
+    if cmd in ("start-server", "kill-server", "wait-for-device"):
+        return 0
+    if latency:
+        time.sleep(latency)
+    if cmd == "shell" and len(args) == 1:
+        return run_interactive_shell(root, latency, bandwidth)
+    if cmd in ("shell", "exec-out"):
+        # shell 输出里的路径改回设备形式；exec-out 为二进制流，原样输出
+        return run_device_command(root, " ".join(args[1:]), bandwidth, rewrite=(cmd == "shell"))
+    if cmd == "logcat":
+        return logcat(args[1:])
+    if cmd == "pull" and len(args) >= 3:
+        return pull(root, args[1], args[2], bandwidth)
+    sys.stderr.write(f"fake adb: unsupported command {cmd}\n")
+    return 1
+
+
+def make_tree(root, services, files_per_service=20, file_size=64 * 1024, kernel_files=20, anr_files=5,
+              start=None, seconds_per_file=600, seed=0):
+    # 生成合成设备目录：sdcard/pudu/log/<svc>.<日期>.pdlog.<轮转号>.log、kernel/、data/anr/
+    rng = random.Random(seed)
+    start = start or datetime(2024, 5, 1, 8, 0, 0)
+    log_dir = os.path.join(root, "sdcard", "pudu", "log")
+    kernel_dir = os.path.join(log_dir, "kernel", "log")
+    anr_dir = os.path.join(root, "data", "anr")
+    for d in (log_dir, kernel_dir, anr_dir):
+        os.makedirs(d, exist_ok=True)
+    levels = "DIWE"
+    for svc in services:
+        for rid in range(1, files_per_service + 1):
+            begin = start + timedelta(seconds=(rid - 1) * seconds_per_file)
+            path = os.path.join(log_dir, f"{svc}.{begin:%Y%m%d}.pdlog.{rid}.log")
+            _write_log(path, begin, seconds_per_file, file_size, svc, levels, rng)
+    for i in range(kernel_files):
+        begin = start + timedelta(seconds=i * seconds_per_file)
+        _write_log(os.path.join(kernel_dir, f"kernel.{i}.log"), begin, seconds_per_file, file_size, "kernel", levels, rng)
+    for i in range(anr_files):
+        _write_log(os.path.join(anr_dir, f"anr_{i}.txt"), start, 60, file_size // 4, "anr", levels, rng)
+    return log_dir
+
+
+def _write_log(path, begin, span_seconds, size, tag, levels, rng):
+    lines = []
+    written = 0
+    line_no = 0
+    while written < size:
+        ts = begin + timedelta(seconds=span_seconds * written / max(size, 1))
+        line = f"{ts:%Y-%m-%d %H:%M:%S}.{ts.microsecond // 1000:03d} {rng.choice(levels)} {tag} line {line_no} " \
+               f"value={rng.randint(0, 1 << 30)}\n"
+        lines.append(line)
+        written += len(line)
+        line_no += 1
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    end = (begin + timedelta(seconds=span_seconds)).timestamp()
+    os.utime(path, (end, end))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--make-tree"]:
+        parser = argparse.ArgumentParser(prog="fake_adb.py --make-tree")
+        parser.add_argument("root")
+        parser.add_argument("--services", default="NavigationService,CoreService,can_service")
+        parser.add_argument("--files", type=int, default=20)
+        parser.add_argument("--size", type=int, default=64 * 1024)
+        args = parser.parse_args(argv[1:])
+        print(make_tree(args.root, args.services.split(","), args.files, args.size))
+        return 0
+    if argv[:1] == ["--server"]:
+        parser = argparse.ArgumentParser(prog="fake_adb.py --server")
+        parser.add_argument("--port", type=int, default=5037)
+        args = parser.parse_args(argv[1:])
+        return serve(args.port)
+    return fake_main(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections import deque
+
+from pull_log import JobCancelled, cancel_adb, release_adb, shared_adb
+
+# 优先级：数值越小越先执行。kill 与 ANR/kernel 等小快照排在大批量 pdlog 之前
+PRIORITY_KILL = 0
+PRIORITY_CAPTURE = 10
+PRIORITY_SNAPSHOT = 20
+PRIORITY_BROWSE = 30
+PRIORITY_PULL = 50
+# 归档整理（archive.py）排在所有交互任务之后
+PRIORITY_MAINTENANCE = 90
+# 共享线程池大小；同一设备上的独占任务仍然串行
+JOB_QUEUE_WORKERS = 4
+# 界面里保留的已结束任务数
+JOB_HISTORY = 100
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATE_CANCELLED = "cancelled"
+_FINISHED = (STATE_DONE, STATE_FAILED, STATE_CANCELLED)
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+    # 一个排队执行的任务：fn(job) 在线程池里运行，返回值存到 result。
+    # serials 为涉及的设备（空为默认设备）；exclusive=True 时同一设备同一时间只跑一个独占任务。
+    # on_finish(job) 在工作线程里回调，Qt 调用方需自行转回 GUI 线程
+    def __init__(self, name, fn, priority=PRIORITY_PULL, serials=None, exclusive=True, on_finish=None):
+        self.id = next(_job_ids)
+        self.name = name
+        self.fn = fn
+        self.priority = priority
+        self.serials = list(serials or [])
+        self.exclusive = exclusive
+        self.on_finish = on_finish
+        self.state = STATE_QUEUED
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def devices(self):
+        return self.serials or [None]
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        # 任务函数在阶段之间调用，取消后尽早退出
+        if self.cancelled:
+            raise JobCancelled(f"job {self.id} cancelled")
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def wait_seconds(self):
+        # 排队等待时间；仍在排队时为到目前为止的等待
+        return (self.started or self.finished or time.monotonic()) - self.submitted
+
+    def run_seconds(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+    def describe(self):
+        text = f"#{self.id} [{self.state}] {self.name}  p={self.priority}  wait {self.wait_seconds():.1f}s"
+        run = self.run_seconds()
+        if run is not None:
+            text += f"  run {run:.1f}s"
+        if self.error:
+            text += f"  {self.error}"
+        return text
+
+
+class JobQueue:
+    # 优先级队列 + 共享线程池。取同优先级时按提交顺序；
+    # 队首任务的设备被占用时跳过它，先跑能跑的（不同设备或非独占的任务）
+    def __init__(self, workers=JOB_QUEUE_WORKERS, on_change=None):
+        self.on_change = on_change
+        self._heap = []
+        self._seq = itertools.count()
+        self._busy = set()
+        self._running = {}
+        self._history = deque(maxlen=JOB_HISTORY)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def _changed(self, job):
+        if self.on_change is not None:
+            try:
+                self.on_change(job)
+            except Exception:
+                traceback.print_exc()
+
+    def submit(self, job):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("job queue is closed")
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            self._cond.notify()
+        self._changed(job)
+        return job
+
+    def _runnable(self, job):
+        return not job.exclusive or not any(device in self._busy for device in job.devices)
+
+    def _next_job(self):
+        # 持锁调用：取出优先级最高且设备空闲的任务；已取消的排队任务顺带丢弃
+        skipped = []
+        found = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            job = entry[2]
+            if job.state == STATE_CANCELLED:
+                continue
+            if self._runnable(job):
+                found = job
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return found
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                if job.exclusive:
+                    self._busy.update(job.devices)
+                job.state = STATE_RUNNING
+                job.started = time.monotonic()
+                self._running[job.id] = job
+            self._changed(job)
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            job.check()
+            if job.exclusive:
+                job.result = job.fn(job)
+            else:
+                # 非独占任务的 adb 调用不受同设备独占任务被取消的牵连
+                with shared_adb():
+                    job.result = job.fn(job)
+            job.state = STATE_CANCELLED if job.cancelled else STATE_DONE
+        except Exception as e:
+            if job.cancelled:
+                job.state = STATE_CANCELLED
+            else:
+                traceback.print_exc()
+                job.state = STATE_FAILED
+                job.error = str(e)
+        finally:
+            job.finished = time.monotonic()
+            with self._cond:
+                self._running.pop(job.id, None)
+                if job.exclusive:
+                    self._busy.difference_update(job.devices)
+                if job.cancelled:
+                    release_adb(job.devices)
+                self._history.append(job)
+                self._cond.notify_all()
+            job._done.set()
+            self._finish(job)
+
+    def _finish(self, job):
+        self._changed(job)
+        if job.on_finish is not None:
+            try:
+                job.on_finish(job)
+            except Exception:
+                traceback.print_exc()
+
+    def cancel(self, job_id):
+        # 排队中的任务直接出队；运行中的独占任务杀掉其设备上登记的 adb 子进程（非独占任务的调用不登记，见 shared_adb），
+        # 由任务函数自行收尾；非独占任务与别的任务共用设备，只置取消标志
+        with self._cond:
+            job = self._running.get(job_id) or next((e[2] for e in self._heap if e[2].id == job_id), None)
+            if job is None or job.state in _FINISHED:
+                return False
+            job._cancel.set()
+            queued = job.state == STATE_QUEUED
+            if queued:
+                job.state = STATE_CANCELLED
+                job.finished = time.monotonic()
+                self._history.append(job)
+            elif job.exclusive:
+                cancel_adb(job.devices)
+        if queued:
+            job._done.set()
+            self._finish(job)
+        return True
+
+    def abort(self):
+        # 全部中止：清空队列并取消所有运行中的任务；返回取消的任务数
+        with self._cond:
+            ids = [e[2].id for e in self._heap] + list(self._running)
+        return sum(1 for job_id in ids if self.cancel(job_id))
+
+    def depth(self):
+        with self._cond:
+            return sum(1 for e in self._heap if e[2].state == STATE_QUEUED)
+
+    def running(self):
+        with self._cond:
+            return list(self._running.values())
+
+    def jobs(self):
+        # 运行中、排队中（按执行顺序）、最近结束的任务，供界面显示
+        with self._cond:
+            queued = [e[2] for e in sorted(self._heap) if e[2].state == STATE_QUEUED]
+            return list(self._running.values()) + queued + list(reversed(self._history))
+
+    def stats(self):
+        with self._cond:
+            finished = [job for job in self._history if job.started is not None]
+            return {
+                "queued": sum(1 for e in self._heap if e[2].state == STATE_QUEUED),
+                "running": len(self._running),
+                "avg_wait": sum(job.started - job.submitted for job in finished) / len(finished) if finished else 0.0,
+                "avg_run": sum(job.finished - job.started for job in finished) / len(finished) if finished else 0.0,
+            }
+
+    def shutdown(self, cancel=True, timeout=5):
+        if cancel:
+            self.abort()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
@@ -0,0 +1,230 @@
+import mmap
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from archive import open_log
+
+# 本地日志查看器（main.py 的 LogViewerWindow）的底层：稀疏行偏移索引 + 流式正则搜索，不依赖 Qt。
+# 索引只记录每个固定大小字节块之前的换行数，定位某一行时在所在块内扫描，
+# 2 GB 的文件只有 3 万多个索引项，内存与文件大小基本无关
+LINE_INDEX_BLOCK = 64 * 1024
+# 后台建索引/搜索时每次读取的字节数（按块对齐）
+LINE_SCAN_CHUNK = 64 * LINE_INDEX_BLOCK
+# 可见窗口每次读取的字节数
+LINE_READ_SIZE = 256 * 1024
+# 单行显示的最大字符数，超长行（如 base64、二进制）截断
+LINE_MAX_CHARS = 4096
+# 搜索命中上限与每行预览长度；命中分批回调的最小间隔（秒）
+SEARCH_MAX_HITS = 100000
+SEARCH_PREVIEW_CHARS = 300
+SEARCH_BATCH_INTERVAL = 0.1
+# 搜索时一行超过这么长仍没有换行就强行切开，避免缓冲无限增长
+SEARCH_MAX_CARRY = 16 * 1024 * 1024
+
+
+def _decode(raw, limit=LINE_MAX_CHARS):
+    text = raw[:limit * 4].decode("utf-8", errors="replace").rstrip("\r")
+    if len(text) > limit or len(raw) > limit * 4:
+        text = text[:limit] + " …"
+    return text
+
+
+class LineIndex:
+    # 打开一个拉取下来的日志（已归档压缩的透明解压），start() 后在后台线程建索引；
+    # 建索引期间即可按行读取已扫描的部分，line_count() 随进度增长。
+    # 普通文件用 mmap 随机读取，只有实际访问的页进内存；建索引与搜索用独立的顺序读取
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open_log(path)
+        self.size = self._file.seek(0, os.SEEK_END)
+        self._map = None
+        if self.size:
+            try:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # 归档文件没有真实的文件描述符（io.UnsupportedOperation），或 32 位进程映射不下
+                self._map = None
+        # _counts[b]：第 b 个块起点之前的换行数；只追加，读线程无需加锁
+        self._counts = array("Q", [0])
+        self._trailing = False
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+        self.seconds = None
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def scanned_bytes(self):
+        return min(self.size, (len(self._counts) - 1) * LINE_INDEX_BLOCK)
+
+    def start(self, on_progress=None):
+        # on_progress(LineIndex) 在后台线程里回调，每读完一段调用一次，结束时再调用一次
+        self._thread = threading.Thread(target=self._build, args=(on_progress,), daemon=True)
+        self._thread.start()
+        return self
+
+    def _build(self, on_progress):
+        started = time.perf_counter()
+        try:
+            with open_log(self.path) as f:
+                total = 0
+                last = b""
+                while not self._stop.is_set():
+                    chunk = f.read(LINE_SCAN_CHUNK)
+                    if not chunk:
+                        break
+                    for start in range(0, len(chunk), LINE_INDEX_BLOCK):
+                        total += chunk.count(b"\n", start, start + LINE_INDEX_BLOCK)
+                        self._counts.append(total)
+                    last = chunk[-1:]
+                    if on_progress is not None:
+                        on_progress(self)
+                # 末尾没有换行时最后一行也算一行
+                self._trailing = bool(self.size) and last != b"\n"
+        finally:
+            self.seconds = round(time.perf_counter() - started, 4)
+            if not self._stop.is_set():
+                self._done.set()
+                if on_progress is not None:
+                    on_progress(self)
+
+    def line_count(self):
+        # 已可读取的行数：建索引期间为已扫描部分中的完整行
+        lines = self._counts[-1]
+        return lines + 1 if self.done and self._trailing else lines
+
+    def _read(self, offset, size):
+        if self._map is not None:
+            return self._map[offset:offset + size]
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def line_offset(self, line):
+        # 第 line 行（从 0 开始）的起始字节偏移；尚未索引到时返回 None
+        if line == 0:
+            return 0
+        counts = self._counts
+        if line > counts[-1]:
+            return None
+        # 第 line 个换行落在块 block 内：counts[block] < line <= counts[block + 1]
+        block = bisect_left(counts, line) - 1
+        data = self._read(block * LINE_INDEX_BLOCK, LINE_INDEX_BLOCK)
+        pos = -1
+        for _ in range(line - counts[block]):
+            pos = data.find(b"\n", pos + 1)
+        return block * LINE_INDEX_BLOCK + pos + 1
+
+    def line_at(self, offset):
+        # 字节偏移 offset 所在的行号（从 0 开始）；尚未索引到时返回 None
+        block = offset // LINE_INDEX_BLOCK
+        if block >= len(self._counts) and not (self.done and offset <= self.size):
+            return None
+        block = min(block, len(self._counts) - 1)
+        start = block * LINE_INDEX_BLOCK
+        return self._counts[block] + self._read(start, offset - start).count(b"\n")
+
+    def lines(self, start, count):
+        # 从第 start 行起最多 count 行的文本
+        result = []
+        end = min(start + count, self.line_count())
+        row = start
+        offset = self.line_offset(start) if start < end else None
+        while offset is not None and row < end:
+            data = self._read(offset, LINE_READ_SIZE)
+            if not data:
+                break
+            pos = 0
+            while row < end:
+                nl = data.find(b"\n", pos)
+                if nl < 0:
+                    break
+                result.append(_decode(data[pos:nl]))
+                row += 1
+                pos = nl + 1
+            if row >= end:
+                break
+            if offset + len(data) >= self.size:
+                # 文件末尾没有换行的最后一行
+                result.append(_decode(data[pos:]))
+                break
+            if pos == 0:
+                # 超长行：只显示开头，下一行由索引定位
+                result.append(_decode(data))
+                row += 1
+                offset = self.line_offset(row) if row < end else None
+            else:
+                offset += pos
+        return result
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+
+
+def search_lines(path, pattern, on_hits, stop_event=None, max_hits=SEARCH_MAX_HITS):
+    # 流式正则搜索：pattern 为编译好的 bytes 正则（建议带 re.MULTILINE），每行最多算一次命中；
+    # 命中以 [(行号, 预览文本)] 分批回调 on_hits，不依赖行索引，边读边出结果。
+    # 返回 {hits, lines, truncated, seconds}
+    started = time.perf_counter()
+    line = 0
+    hits = 0
+    batch = []
+    emitted = time.monotonic()
+    truncated = False
+    with open_log(path) as f:
+        carry = b""
+        while not truncated and (stop_event is None or not stop_event.is_set()):
+            chunk = f.read(LINE_SCAN_CHUNK)
+            data = carry + chunk if carry else chunk
+            if not data:
+                break
+            # 只处理到最后一个换行，剩下的半行留到下一段；读完时处理全部
+            cut = data.rfind(b"\n") + 1 if chunk else len(data)
+            if cut == 0:
+                if len(data) < SEARCH_MAX_CARRY:
+                    carry = data
+                    continue
+                cut = len(data)
+            pos = 0
+            while True:
+                m = pattern.search(data, pos, cut)
+                if m is None:
+                    break
+                line += data.count(b"\n", pos, m.start())
+                line_start = data.rfind(b"\n", 0, m.start()) + 1
+                nl = data.find(b"\n", m.start(), cut)
+                line_end = nl if nl >= 0 else cut
+                batch.append((line, _decode(data[line_start:line_end], SEARCH_PREVIEW_CHARS)))
+                hits += 1
+                if hits >= max_hits:
+                    truncated = True
+                    break
+                if nl < 0:
+                    pos = cut
+                    break
+                pos = nl + 1
+                line += 1
+            line += data.count(b"\n", pos, cut)
+            carry = data[cut:]
+            if batch and time.monotonic() - emitted >= SEARCH_BATCH_INTERVAL:
+                on_hits(batch)
+                batch = []
+                emitted = time.monotonic()
+            if not chunk:
+                break
+    if batch:
+        on_hits(batch)
+    return {"hits": hits, "lines": line, "truncated": truncated, "seconds": round(time.perf_counter() - started, 4)}
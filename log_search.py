@@ -0,0 +1,279 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from archive import log_stat, open_log
+from pull_log import LOG_OUTPUT_ROOT, METRICS_FILE_NAME, CONSOLE_DIR_NAME, SERVICES, parse_rotation_id
+from timeline import timeline_sources
+
+# 输出根目录下的全文索引库（SQLite FTS5）；以 "." 开头，拉取/时间线遍历时会跳过
+SEARCH_DB_NAME = ".search.db"
+# 读取/解码文件的线程数；读取线程按批交给唯一的写入线程，分词在 SQLite 写入时完成（不持 GIL），与读取重叠进行
+SEARCH_INDEX_WORKERS = 4
+# 每批行数、队列中最多排队的批数（内存上限约为 批数 x 批大小 行，与文件大小无关）、每写入多少行提交一次事务
+SEARCH_BATCH_ROWS = 10000
+SEARCH_QUEUE_BATCHES = 8
+SEARCH_COMMIT_ROWS = 200000
+SEARCH_DEFAULT_LIMIT = 200
+# 行的 rowid = 文件 id << 40 | 行在文件内的字节偏移，单文件上限 1 TB
+_OFFSET_BITS = 40
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+SearchHit = namedtuple("SearchHit", ["session", "serial", "service", "rotation", "path", "offset", "line"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    session TEXT,
+    serial TEXT,
+    service TEXT,
+    rotation INTEGER,
+    size INTEGER,
+    mtime REAL,
+    line_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_key ON files(session, service, rotation);
+CREATE VIRTUAL TABLE IF NOT EXISTS log_lines USING fts5(text, tokenize='unicode61');
+"""
+
+
+class SearchIndexError(Exception):
+    pass
+
+
+def classify_log(relpath):
+    # 由相对路径得到 (服务名, 轮转编号)；服务取已知服务中最长的前缀，kernel/ANR 按所在目录归类
+    parts = relpath.replace("\\", "/").split("/")
+    name = parts[-1]
+    service = None
+    for svc in SERVICES:
+        if (name == svc or name.startswith(svc + ".")) and (service is None or len(svc) > len(service)):
+            service = svc
+    if service is None:
+        if "anr" in parts[:-1]:
+            service = "anr"
+        elif "kernel" in parts[:-1]:
+            service = "kernel"
+    return service, parse_rotation_id(name)
+
+
+def _read_batches(path, file_id, batches, stop, batch_rows=SEARCH_BATCH_ROWS):
+    # 读取线程：把 [(rowid, 文本)] 按批放进有界队列，跳过空行；最后放 (file_id, None, 行数) 表示该文件读完，
+    # 出错时行数为 None。队列满时阻塞，读取速度受写入速度约束
+    base = file_id << _OFFSET_BITS
+    count = 0
+    rows = []
+    offset = 0
+    try:
+        # 已归档压缩的文件透明解压；行偏移是原文件内的偏移，与压缩前索引的一致
+        with open_log(path) as f:
+            for raw in f:
+                if stop.is_set():
+                    return
+                text = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+                if text.strip():
+                    rows.append((base | offset, text))
+                    if len(rows) >= batch_rows:
+                        batches.put((file_id, rows, None))
+                        count += len(rows)
+                        rows = []
+                offset += len(raw)
+        if rows:
+            batches.put((file_id, rows, None))
+            count += len(rows)
+    except Exception:
+        batches.put((file_id, None, None))
+        raise
+    batches.put((file_id, None, count))
+
+
+def _quote_query(query):
+    # 把用户输入的每个词当作短语，避免 "com.pudutech.x" 之类触发 FTS5 语法错误
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+class SearchIndex:
+    # 拉取归档（<根目录>/<会话>/[<设备>/]...）的持久全文索引；按 会话/设备/服务/轮转编号 记录每个文件，
+    # 已索引且大小与 mtime 未变的文件不会重复处理
+    def __init__(self, root=LOG_OUTPUT_ROOT, db_path=None):
+        self.root = root
+        self.db_path = db_path or os.path.join(root, SEARCH_DB_NAME)
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+        try:
+            # WAL：拉取线程写索引时界面仍可查询
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        except sqlite3.OperationalError as e:
+            self._conn.close()
+            raise SearchIndexError(f"SQLite FTS5 unavailable: {e}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _relpath(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _pending(self, paths):
+        # 返回需要（重新）索引的文件：新文件或大小/mtime 变化的文件
+        pending = []
+        with self._lock:
+            for path in paths:
+                # 压缩后清单里记录的是原大小与 mtime，整理过的会话不会被重复索引
+                size, mtime = log_stat(path)
+                row = self._conn.execute("SELECT size, mtime FROM files WHERE path = ?", (self._relpath(path),)).fetchone()
+                if row is None or row[0] != size or row[1] != mtime:
+                    pending.append((path, size, mtime))
+        return pending
+
+    def _begin_files(self, paths, session, serial):
+        # 登记待索引文件并清掉其旧行，返回 [(文件 id, 路径)]。size/mtime 先置空、全部写完才填上，
+        # 中途失败或被打断的文件下次会被 _pending 重新选中
+        files = []
+        with self._lock, self._conn:
+            for path in paths:
+                relpath = self._relpath(path)
+                service, rotation = classify_log(os.path.relpath(path, os.path.join(self.root, session)))
+                row = self._conn.execute("SELECT id FROM files WHERE path = ?", (relpath,)).fetchone()
+                if row is None:
+                    file_id = self._conn.execute(
+                        "INSERT INTO files(path, session, serial, service, rotation, size, mtime, line_count) "
+                        "VALUES (?, ?, ?, ?, ?, NULL, NULL, 0)",
+                        (relpath, session, serial, service, rotation)).lastrowid
+                else:
+                    file_id = row[0]
+                    base = file_id << _OFFSET_BITS
+                    self._conn.execute("DELETE FROM log_lines WHERE rowid BETWEEN ? AND ?", (base, base | _OFFSET_MASK))
+                    self._conn.execute("UPDATE files SET size = NULL, mtime = NULL, line_count = 0 WHERE id = ?",
+                                       (file_id,))
+                files.append((file_id, path))
+        return files
+
+    def _write_batches(self, pending, files, workers):
+        # 读取线程并行读文件，调用线程是唯一的写入者：executemany 逐批插入，每 SEARCH_COMMIT_ROWS 行提交一次；
+        # 文件读完时填上 size/mtime/行数。返回写入的行数
+        meta = {file_id: (size, mtime) for (file_id, _), (_, size, mtime) in zip(files, pending)}
+        batches = queue.Queue(maxsize=SEARCH_QUEUE_BATCHES)
+        stop = threading.Event()
+        lines = 0
+        uncommitted = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(files)))) as pool:
+            futures = [pool.submit(_read_batches, path, file_id, batches, stop) for file_id, path in files]
+            try:
+                finished = 0
+                while finished < len(files):
+                    file_id, rows, count = batches.get()
+                    if rows is not None:
+                        with self._lock:
+                            self._conn.executemany("INSERT INTO log_lines(rowid, text) VALUES (?, ?)", rows)
+                        lines += len(rows)
+                        uncommitted += len(rows)
+                        if uncommitted >= SEARCH_COMMIT_ROWS:
+                            with self._lock:
+                                self._conn.commit()
+                            uncommitted = 0
+                        continue
+                    finished += 1
+                    if count is not None:
+                        size, mtime = meta[file_id]
+                        with self._lock:
+                            self._conn.execute("UPDATE files SET size = ?, mtime = ?, line_count = ? WHERE id = ?",
+                                               (size, mtime, count, file_id))
+            except BaseException:
+                stop.set()
+                # 放行阻塞在 put 上的读取线程
+                while not all(f.done() for f in futures):
+                    try:
+                        batches.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                raise
+            finally:
+                with self._lock:
+                    self._conn.commit()
+        for future in futures:
+            future.result()
+        return lines
+
+    def index_dir(self, directory, session=None, serial=None, workers=SEARCH_INDEX_WORKERS, on_progress=None):
+        # 索引一次拉取的输出目录（单设备目录或会话目录）；返回 {files, skipped, lines, seconds}
+        started = time.perf_counter()
+        if session is None:
+            session = os.path.relpath(directory, self.root).replace(os.sep, "/").split("/")[0]
+        sources = timeline_sources(directory)
+        pending = self._pending(sources)
+        lines = 0
+        if pending:
+            if on_progress is not None:
+                on_progress(f"Index: {len(pending)} new files ({len(sources) - len(pending)} unchanged)")
+            files = self._begin_files([path for path, _, _ in pending], session, serial)
+            lines = self._write_batches(pending, files, workers)
+        result = {"files": len(pending), "skipped": len(sources) - len(pending), "lines": lines,
+                  "seconds": round(time.perf_counter() - started, 4)}
+        if on_progress is not None and pending:
+            on_progress(f"Index: {lines} lines from {len(pending)} files in {result['seconds']:.1f}s")
+        return result
+
+    def index_archive(self, workers=SEARCH_INDEX_WORKERS, on_progress=None):
+        # 补齐整个归档：每个会话目录；多设备会话按含 metrics.jsonl 的设备子目录分别索引
+        totals = {"sessions": 0, "files": 0, "skipped": 0, "lines": 0}
+        if not os.path.isdir(self.root):
+            return totals
+        for session in sorted(os.listdir(self.root)):
+            session_dir = os.path.join(self.root, session)
+            if session.startswith(".") or session == CONSOLE_DIR_NAME or not os.path.isdir(session_dir):
+                continue
+            targets = [(session_dir, None)]
+            if not os.path.exists(os.path.join(session_dir, METRICS_FILE_NAME)):
+                devices = [d for d in sorted(os.listdir(session_dir))
+                           if os.path.exists(os.path.join(session_dir, d, METRICS_FILE_NAME))]
+                if devices:
+                    targets = [(os.path.join(session_dir, d), d) for d in devices]
+            for directory, serial in targets:
+                result = self.index_dir(directory, session, serial, workers, on_progress)
+                for key in ("files", "skipped", "lines"):
+                    totals[key] += result[key]
+            totals["sessions"] += 1
+        return totals
+
+    def remove_sessions(self, sessions):
+        # 会话目录被删除（归档保留策略）后移除其文件与行；返回移除的文件数
+        removed = 0
+        with self._lock, self._conn:
+            for session in sessions:
+                ids = [row[0] for row in self._conn.execute("SELECT id FROM files WHERE session = ?", (session,))]
+                for file_id in ids:
+                    base = file_id << _OFFSET_BITS
+                    self._conn.execute("DELETE FROM log_lines WHERE rowid BETWEEN ? AND ?", (base, base | _OFFSET_MASK))
+                self._conn.execute("DELETE FROM files WHERE session = ?", (session,))
+                removed += len(ids)
+        return removed
+
+    def search(self, query, limit=SEARCH_DEFAULT_LIMIT, session=None, serial=None, service=None, rotation=None):
+        # FTS5 查询，最新索引的文件在前；返回 SearchHit 列表（path 相对根目录，offset 为字节偏移）
+        sql = ("SELECT log_lines.rowid, log_lines.text, files.path, files.session, files.serial, files.service, "
+               "files.rotation FROM log_lines JOIN files ON files.id = (log_lines.rowid >> ?) WHERE log_lines MATCH ?")
+        filters = []
+        for column, value in (("session", session), ("serial", serial), ("service", service), ("rotation", rotation)):
+            if value is not None:
+                sql += f" AND files.{column} = ?"
+                filters.append(value)
+        sql += " ORDER BY log_lines.rowid DESC LIMIT ?"
+        for match in (query, _quote_query(query)):
+            try:
+                with self._lock:
+                    rows = self._conn.execute(sql, [_OFFSET_BITS, match] + filters + [limit]).fetchall()
+                break
+            except sqlite3.OperationalError:
+                # FTS5 语法错误时按普通词重试
+                if match != query:
+                    raise
+        return [SearchHit(session, serial, service, rotation, path, rowid & _OFFSET_MASK, text)
+                for rowid, text, path, session, serial, service, rotation in rows]
@@ -0,0 +1,359 @@
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from pull_log import adb_popen, serial_dir_name, parse_log_timestamp, LOG_OUTPUT_ROOT, TIMESTAMP_SCAN_CHARS
+
+# 后台 logcat 抓取：每台设备一个长驻 adb logcat 流，写入 <输出根目录>/.logcat/<设备>/ 下按大小轮转的分段文件
+LOGCAT_DIR_NAME = ".logcat"
+LOGCAT_SEGMENT_SIZE = 4 * 1024 * 1024
+# 每台设备最多保留的分段数（环形，超出删除最旧的），磁盘占用上限 = 分段大小 × 分段数
+LOGCAT_MAX_SEGMENTS = 32
+# 写缓冲与分段清单的落盘间隔（秒）
+LOGCAT_FLUSH_INTERVAL = 1.0
+# 断开（设备重启、拔插、Wi-Fi 掉线）后重连的退避（秒）
+LOGCAT_RECONNECT_DELAY = 1.0
+LOGCAT_RECONNECT_MAX_DELAY = 30.0
+LOGCAT_READ_SIZE = 64 * 1024
+# 文本模式下单行超过该长度按原样切出，避免无换行的输出撑大内存
+LOGCAT_MAX_LINE = 64 * 1024
+SEGMENTS_FILE_NAME = "segments.json"
+FORMAT_TEXT = "text"
+FORMAT_BINARY = "binary"
+_SEGMENT_SUFFIX = {FORMAT_TEXT: ".log", FORMAT_BINARY: ".bin"}
+
+# logcat -B 的 logger_entry 头：len(u16) hdr_size(u16) pid(i32) tid(u32) sec(u32) nsec(u32)...
+_ENTRY_HEAD = struct.Struct("<HHiIII")
+_ENTRY_V1_SIZE = 20
+
+
+class _TextFramer:
+    # 把流切成完整的行，并解析行首时间戳（threadtime 无年份，按当前年份补全）
+    def __init__(self):
+        self._pending = b""
+        self._year = datetime.now().year
+
+    def feed(self, data):
+        data = self._pending + data
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+        if len(self._pending) > LOGCAT_MAX_LINE:
+            lines.append(self._pending)
+            self._pending = b""
+        for line in lines:
+            head = line[:TIMESTAMP_SCAN_CHARS].decode("utf-8", errors="replace")
+            yield line + b"\n", parse_log_timestamp(head, self._year)
+
+
+class _BinaryFramer:
+    # 把 logcat -B 流切成完整的 logger_entry，时间戳取条目头里的 sec/nsec
+    def __init__(self):
+        self._pending = b""
+
+    def feed(self, data):
+        buf = self._pending + data
+        pos = 0
+        while len(buf) - pos >= _ENTRY_HEAD.size:
+            length, hdr_size, _, _, sec, nsec = _ENTRY_HEAD.unpack_from(buf, pos)
+            hdr_size = hdr_size or _ENTRY_V1_SIZE
+            if hdr_size < _ENTRY_V1_SIZE or hdr_size > 64:
+                # 流已错位，丢弃剩余数据，等下一次重连重新对齐
+                buf, pos = b"", 0
+                break
+            total = hdr_size + length
+            if len(buf) - pos < total:
+                break
+            yield buf[pos:pos + total], sec + nsec / 1e9
+            pos += total
+        self._pending = buf[pos:]
+
+
+def _framer(fmt):
+    return _BinaryFramer() if fmt == FORMAT_BINARY else _TextFramer()
+
+
+class RotatingLogWriter:
+    # 按大小轮转的缓冲写入器：只保留最近 max_segments 个分段，内存只有写缓冲和分段清单。
+    # 清单（每段的首末时间戳）写在 segments.json，其它进程也能据此做快照
+    def __init__(self, directory, fmt=FORMAT_TEXT, segment_size=LOGCAT_SEGMENT_SIZE, max_segments=LOGCAT_MAX_SEGMENTS):
+        self.directory = directory
+        self.fmt = fmt
+        self.segment_size = segment_size
+        self.max_segments = max(1, max_segments)
+        os.makedirs(directory, exist_ok=True)
+        self._segments = [s for s in load_segments(directory)
+                          if os.path.exists(os.path.join(directory, s["name"]))]
+        self._seq = max((int(s["name"].split(".")[1]) for s in self._segments), default=0)
+        self._file = None
+        self._current = None
+
+    def _open_segment(self):
+        self._seq += 1
+        name = f"seg.{self._seq:08d}{_SEGMENT_SUFFIX[self.fmt]}"
+        self._file = open(os.path.join(self.directory, name), "wb", buffering=256 * 1024)
+        self._current = {"name": name, "format": self.fmt, "first": None, "last": None, "size": 0}
+        self._segments.append(self._current)
+        while len(self._segments) > self.max_segments:
+            oldest = self._segments.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, oldest["name"]))
+            except OSError:
+                pass
+
+    def write(self, record, ts):
+        if self._file is None or self._current["size"] + len(record) > self.segment_size:
+            self._close_segment()
+            self._open_segment()
+        self._file.write(record)
+        current = self._current
+        current["size"] += len(record)
+        if ts is None:
+            # 没有时间戳的行/条目沿用前一条的时间
+            ts = current["last"]
+        if ts is not None:
+            if current["first"] is None:
+                current["first"] = ts
+            current["last"] = ts if current["last"] is None else max(current["last"], ts)
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._save()
+
+    def _save(self):
+        path = os.path.join(self.directory, SEGMENTS_FILE_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"segments": self._segments}, f)
+        os.replace(path + ".tmp", path)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+        self._save()
+
+    def close(self):
+        self._close_segment()
+        self._current = None
+
+    def last_timestamp(self):
+        return max((s["last"] for s in self._segments if s["last"] is not None), default=None)
+
+
+def load_segments(directory):
+    try:
+        with open(os.path.join(directory, SEGMENTS_FILE_NAME), "r", encoding="utf-8") as f:
+            return json.load(f).get("segments", [])
+    except (OSError, ValueError):
+        return []
+
+
+def capture_dir(serial=None, root=LOG_OUTPUT_ROOT):
+    return os.path.join(root, LOGCAT_DIR_NAME, serial_dir_name(serial) if serial else "default")
+
+
+def snapshot_segments(directory, target_dir, minutes):
+    # 从分段环中取出最近 minutes 分钟（以已抓到的最新时间为终点）写到 target_dir；
+    # 完整落在窗口内的分段直接拷贝，跨越起点的分段逐条过滤。返回写出的文件列表
+    segments = [s for s in load_segments(directory) if os.path.exists(os.path.join(directory, s["name"]))]
+    latest = max((s["last"] for s in segments if s["last"] is not None), default=None)
+    if latest is None:
+        return []
+    cutoff = latest - minutes * 60
+    outputs = {}
+    os.makedirs(target_dir, exist_ok=True)
+    try:
+        for segment in segments:
+            if segment["last"] is None or segment["last"] < cutoff:
+                continue
+            fmt = segment.get("format", FORMAT_TEXT)
+            if fmt not in outputs:
+                name = f"logcat.last{minutes:g}m{_SEGMENT_SUFFIX[fmt]}"
+                outputs[fmt] = (os.path.join(target_dir, name), open(os.path.join(target_dir, name), "wb"))
+            out = outputs[fmt][1]
+            with open(os.path.join(directory, segment["name"]), "rb") as f:
+                if segment["first"] is not None and segment["first"] >= cutoff:
+                    shutil.copyfileobj(f, out)
+                    continue
+                framer = _framer(fmt)
+                keep = False
+                for chunk in iter(lambda: f.read(LOGCAT_READ_SIZE), b""):
+                    for record, ts in framer.feed(chunk):
+                        if ts is not None:
+                            keep = ts >= cutoff
+                        if keep:
+                            out.write(record)
+    finally:
+        for _, out in outputs.values():
+            out.close()
+    return [path for path, _ in outputs.values()]
+
+
+class LogcatCapture:
+    # 一台设备的后台抓取：等待设备上线 -> 长驻 adb logcat -> 断开后退避重连；
+    # 重连时用 -T <最后时间> 接续，设备重启后也不会重复写入已抓到的部分
+    def __init__(self, serial=None, root=LOG_OUTPUT_ROOT, buffers=None, binary=False,
+                 segment_size=LOGCAT_SEGMENT_SIZE, max_segments=LOGCAT_MAX_SEGMENTS, on_status=None):
+        self.serial = serial
+        self.directory = capture_dir(serial, root)
+        self.buffers = buffers
+        self.fmt = FORMAT_BINARY if binary else FORMAT_TEXT
+        self.on_status = on_status
+        self.connected = False
+        self.reconnects = 0
+        self.bytes_written = 0
+        self._writer = RotatingLogWriter(self.directory, self.fmt, segment_size, max_segments)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._proc = None
+        self._thread = None
+
+    def _emit(self, message):
+        if self.on_status is not None:
+            self.on_status(f"[logcat {self.serial or 'default'}] {message}")
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        proc = self._proc
+        if proc is not None:
+            proc.kill()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        with self._lock:
+            self._writer.close()
+
+    def _logcat_args(self):
+        args = ["logcat"]
+        if self.buffers:
+            args += ["-b", self.buffers]
+        args += ["-B"] if self.fmt == FORMAT_BINARY else ["-v", "threadtime"]
+        with self._lock:
+            last = self._writer.last_timestamp()
+        if last is not None:
+            args += ["-T", f"{last:.3f}"]
+        return args
+
+    def _wait_for_device(self):
+        proc = self._proc = adb_popen(["wait-for-device"], self.serial, cancellable=False)
+        while proc.poll() is None and not self._stop.wait(0.5):
+            pass
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        self._proc = None
+
+    def _run(self):
+        delay = LOGCAT_RECONNECT_DELAY
+        while not self._stop.is_set():
+            try:
+                self._wait_for_device()
+                if self._stop.is_set():
+                    break
+                if self._stream():
+                    delay = LOGCAT_RECONNECT_DELAY
+            except Exception as e:
+                traceback.print_exc()
+                self._emit(f"capture error: {e}")
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            self._emit(f"disconnected, reconnect in {delay:.1f}s")
+            self._stop.wait(delay)
+            delay = min(delay * 2, LOGCAT_RECONNECT_MAX_DELAY)
+
+    def _stream(self):
+        # 读到 EOF（断开）返回；收到过数据返回 True
+        framer = _framer(self.fmt)
+        proc = self._proc = adb_popen(self._logcat_args(), self.serial, cancellable=False)
+        self.connected = True
+        self._emit("connected")
+        received = False
+        flushed_at = time.monotonic()
+        try:
+            while True:
+                data = proc.stdout.read1(LOGCAT_READ_SIZE)
+                if not data:
+                    break
+                received = True
+                with self._lock:
+                    for record, ts in framer.feed(data):
+                        self._writer.write(record, ts)
+                    self.bytes_written += len(data)
+                    if time.monotonic() - flushed_at >= LOGCAT_FLUSH_INTERVAL:
+                        self._writer.flush()
+                        flushed_at = time.monotonic()
+        finally:
+            self.connected = False
+            proc.stdout.close()
+            proc.kill()
+            proc.wait()
+            self._proc = None
+            with self._lock:
+                self._writer.flush()
+        return received
+
+    def flush(self):
+        with self._lock:
+            self._writer.flush()
+
+    def snapshot(self, target_dir, minutes):
+        self.flush()
+        return snapshot_segments(self.directory, target_dir, minutes)
+
+    def status(self):
+        return {"serial": self.serial, "running": self.running, "connected": self.connected,
+                "reconnects": self.reconnects, "bytes": self.bytes_written, "dir": self.directory}
+
+
+_captures = {}
+_captures_lock = threading.Lock()
+
+
+def start_capture(serial=None, root=LOG_OUTPUT_ROOT, buffers=None, binary=False, on_status=None):
+    # 每台设备一个抓取；已在运行则直接返回
+    with _captures_lock:
+        capture = _captures.get(serial)
+        if capture is None or not capture.running:
+            capture = LogcatCapture(serial, root, buffers, binary, on_status=on_status)
+            _captures[serial] = capture
+            capture.start()
+        return capture
+
+
+def stop_capture(serial=None):
+    with _captures_lock:
+        capture = _captures.pop(serial, None)
+    if capture is not None:
+        capture.stop()
+
+
+def stop_all_captures():
+    with _captures_lock:
+        captures = list(_captures.values())
+        _captures.clear()
+    for capture in captures:
+        capture.stop()
+
+
+def snapshot_device(serial, target_dir, minutes, root=LOG_OUTPUT_ROOT):
+    # 拉取时调用：本进程在抓取则先落盘再取；否则直接读磁盘上的分段（可能由另一个进程在抓）
+    with _captures_lock:
+        capture = _captures.get(serial)
+    if capture is not None:
+        return capture.snapshot(target_dir, minutes)
+    return snapshot_segments(capture_dir(serial, root), target_dir, minutes)
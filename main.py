@@ -1,9 +1,15 @@
+import multiprocessing
+import re
 import sys
 import os
 import subprocess
+import threading
+import time
 import traceback
+from collections import OrderedDict
 from datetime import datetime
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QDateTime, QTimer, pyqtSignal, QAbstractListModel, QModelIndex
+from PyQt5.QtGui import QFontDatabase
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -15,19 +21,56 @@ from PyQt5.QtWidgets import (
     QSpinBox,
     QCheckBox,
     QPushButton,
-    QTextEdit,
+    QPlainTextEdit,
     QMessageBox,
     QDialog,
     QListWidget,
     QListWidgetItem,
+    QDateTimeEdit,
+    QLineEdit,
+    QProgressBar,
+    QListView,
+    QSplitter,
+    QFileDialog,
+)
+from pull_log import (
+    get_catalog,
+    format_size,
+    DEFAULT_PULL_WORKERS,
+    MAX_PULL_WORKERS,
+    TRANSFER_MODES,
+    list_devices,
+    LogPuller,
+    kill_devices,
+    SERVICES,
+    KILL_PACKAGES,
+    ConsoleBuffer,
+    LOG_OUTPUT_ROOT,
+    CONSOLE_DIR_NAME,
+)
+from archive import list_logs
+from line_index import LineIndex, search_lines, SEARCH_MAX_HITS
+from timeline import TIMELINE_FILE_NAME, TIMELINE_INDEX_NAME, timeline_seek
+from logcat_capture import start_capture, stop_capture, stop_all_captures
+from job_queue import (
+    Job,
+    JobQueue,
+    JOB_QUEUE_WORKERS,
+    PRIORITY_KILL,
+    PRIORITY_CAPTURE,
+    PRIORITY_SNAPSHOT,
+    PRIORITY_BROWSE,
+    PRIORITY_PULL,
+    PRIORITY_MAINTENANCE,
+    STATE_DONE,
+    STATE_CANCELLED,
 )
-from pull_log import adb_command, get_files_in_folder
 
 
-# 在启动时异步触发 PyInstaller 打包（仅源码运行时触发，已打包环境跳过）
+# 在启动时异步触发 PyInstaller 打包（仅源码运行时且设置 PULLLOG_AUTOPACK=1 时触发，已打包环境跳过）
 def trigger_pack_once():
     try:
-        if getattr(sys, "frozen", False):
+        if getattr(sys, "frozen", False) or os.environ.get("PULLLOG_AUTOPACK") != "1":
             return
         project_dir = os.path.dirname(os.path.abspath(__file__))
         cmd = [r"D:\python\Scripts\pyinstaller", "-w", "-F", "-i", "img.png", "-n", "PullLogUI", "main.py"]
@@ -42,251 +85,379 @@ def trigger_pack_once():
     except Exception:
         traceback.print_exc()
 
-SERVICES = [
-    "NavigationService",
-    "pudutech-maptools",
-    "RunTimeInfoService",
-    "launcher",
-    "can_service",
-    "OTAService",
-    "IOTService",
-    "CoreService",
-    "CloudService",
-    "SpeechService",
-    "Diagnose",
-    "pudutech-mirsdk.g3log",
-    "mirsdk.g3log"
-]
-
-KILL_PACKAGES = [
-    "com.pudutech.usher",
-    "com.pudutech.resource.manager.service",
-    "com.pudutech.solicit",
-    "com.pudutech.business.usher",
-    "com.pudutech.remotemaintenance",
-    "com.pudutech.ad.service",
-    "com.pudutech.business.delivery",
-    "com.pudutech.business.recycle",
-    "com.pudutech.business.call",
-    "com.pudutech.business.function",
-    "com.pudutech.function",
-    "com.pudutech.puduossetting",
-    "com.pudutech.business.gohome",
-    "com.pudutech.robot.peanut",
-    "com.pudutech.factory_test",
-    "com.pudutech.bumblebee",
-    "com.pudutech.business.cruise",
-    "com.pudutech.project_one.business_delivery",
-    "com.pudutech.map",
-    "com.pudutech.iot2",
-    "com.pudutech.cloud",
-    "com.pudutech.hardware2",
-    "com.pudutech.navigation",
-    "com.pudutech.ota",
-    "com.pudutech.maptools",
-    "com.pudutech.setupwizard",
-    "com.pudutech.hls2robot",
-    "com.pudutech.robot.vacuum",
-    "com.pudutech.launcher",
-    "com.pudutech.core",
-    "puduos.app",
-    "run_time_info_service",
-    "com.pudutech.diagnose",
-]
-
-class LogPullWorker(QThread):
-    progress = pyqtSignal(str)
-    done = pyqtSignal(str)
-    failed = pyqtSignal(str)
-
-    def __init__(self, service_names, count, need_logcat, need_kernel, need_anr, selected_files=None):
-        super().__init__()
-        self.service_names = service_names or []
-        self.count = count
-        self.need_logcat = need_logcat
-        self.need_kernel = need_kernel
-        self.need_anr = need_anr
-        self.selected_files = selected_files or []
-
-    def _emit(self, message):
-        self.progress.emit(message)
-
-    def _ensure_dir(self, base_dir):
-        if not os.path.exists(base_dir):
-            os.makedirs(base_dir)
-
-    def _select_by_threshold(self, filenames, count):
-        # 参考 pull_process_log：以 max_id - count 为阈值，取编号大于阈值的日志
-        id_list = []
-        for name in filenames:
-            parts = name.split(".")
-            if len(parts) > 3 and parts[3].isdigit():
-                id_list.append(int(parts[3]))
-        if not id_list:
-            return []
-        max_id = max(id_list)
-        threshold = max_id - count
-        selected = []
-        for name in filenames:
-            parts = name.split(".")
-            if len(parts) > 3 and parts[3].isdigit():
-                if int(parts[3]) > threshold:
-                    selected.append(name)
-        return selected
-
-    def _select_top_n(self, filenames, count):
-        candidates = []
-        for name in filenames:
-            parts = name.split(".")
-            if len(parts) > 3 and parts[3].isdigit():
-                candidates.append((int(parts[3]), name))
-        if not candidates:
-            return []
-        candidates.sort(key=lambda x: x[0], reverse=True)
-        return [name for _, name in candidates[:max(0, count)]]
-
-    def _select_logs(self, all_filenames, service_names, count):
-        if not service_names:
-            return []
-        union_set = []
-        seen = set()
-        multiple = len(service_names) > 1
-        for svc in service_names:
-            svc_files = [name for name in all_filenames if name.startswith(svc)]
-            # 多选/ALL：精确每个服务取前 N 份；单选：沿用阈值法以兼容原逻辑
-            if multiple:
-                chosen = self._select_top_n(svc_files, count)
-            else:
-                chosen = self._select_by_threshold(svc_files, count)
-            for item in chosen:
-                if item not in seen:
-                    seen.add(item)
-                    union_set.append(item)
-        return union_set
-
-    def _pull_file_safely(self, remote_path, local_dir):
-        try:
-            self._emit(f"Pull: {remote_path}")
-            result = adb_command(["pull", remote_path, local_dir])
-            if result is None:
-                result = ""
-            self._emit(result)
-        except Exception as e:
-            traceback.print_exc()
-            self._emit(f"Error pulling {remote_path}: {e}")
 
-    def _dump_logcat(self, local_dir):
-        try:
-            # 改为按需求拉取 /sdcard/pudu/log/kernel/log 文件夹
-            self._emit("Pull logcat folder: /sdcard/pudu/log/kernel/log")
-            self._pull_file_safely("/sdcard/pudu/log/kernel/log", local_dir)
-        except Exception as e:
-            traceback.print_exc()
-            self._emit(f"Error pull logcat folder: {e}")
+# 字节进度信号的最小间隔（秒），避免淹没 GUI 线程
+BYTES_PROGRESS_INTERVAL = 0.1
+# 日志窗口最多保留的行数（更早的行被淘汰，完整记录见 console 目录）与刷新间隔（毫秒，约 20 帧/秒）
+CONSOLE_MAX_LINES = 5000
+CONSOLE_FLUSH_MS = 50
+# 任务列表与队列统计的刷新间隔（毫秒）
+JOB_REFRESH_MS = 500
+# 勾选后台归档整理时的执行间隔（毫秒）
+MAINTENANCE_INTERVAL_MS = 60 * 60 * 1000
+
+
+# 查看器每次从文件读取并缓存的行数（一页）与缓存的页数；可见窗口之外的行不进内存
+VIEWER_PAGE_LINES = 256
+VIEWER_CACHE_PAGES = 16
+
+
+class LogLineModel(QAbstractListModel):
+    # 虚拟化的行模型：只在视图请求时按页从 LineIndex 读取，行数随后台索引进度增长
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.line_index = None
+        self._rows = 0
+        self._pages = OrderedDict()
+
+    def set_index(self, line_index):
+        self.beginResetModel()
+        self.line_index = line_index
+        self._rows = 0
+        self._pages.clear()
+        self.endResetModel()
+        self.grow()
+
+    def grow(self):
+        if self.line_index is None:
+            return
+        rows = self.line_index.line_count()
+        if rows > self._rows:
+            # 末页可能是按当时的行数截短读的，丢弃后重读
+            for page in [p for p, lines in self._pages.items() if len(lines) < VIEWER_PAGE_LINES]:
+                del self._pages[page]
+            self.beginInsertRows(QModelIndex(), self._rows, rows - 1)
+            self._rows = rows
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._rows
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        row = index.row()
+        page = row // VIEWER_PAGE_LINES
+        lines = self._pages.get(page)
+        if lines is None:
+            lines = self.line_index.lines(page * VIEWER_PAGE_LINES, VIEWER_PAGE_LINES)
+            self._pages[page] = lines
+            while len(self._pages) > VIEWER_CACHE_PAGES:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page)
+        i = row - page * VIEWER_PAGE_LINES
+        return f"{row + 1:>8}  {lines[i] if i < len(lines) else ''}"
+
+
+class SearchHitModel(QAbstractListModel):
+    # 搜索命中 [(行号, 预览)]，随搜索线程分批追加
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.hits = []
+
+    def clear(self):
+        self.beginResetModel()
+        self.hits = []
+        self.endResetModel()
+
+    def append(self, batch):
+        self.beginInsertRows(QModelIndex(), len(self.hits), len(self.hits) + len(batch) - 1)
+        self.hits.extend(batch)
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.hits)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        line, text = self.hits[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{line + 1:>8}  {text}"
+        if role == Qt.UserRole:
+            return line
+        return None
+
+
+class LogViewerWindow(QMainWindow):
+    # 内置日志查看器：左侧为目录下的文件（含已归档压缩的），右侧按需渲染可见行，
+    # 行偏移索引与正则搜索都在后台线程进行，打开大文件不等待
+    index_progress = pyqtSignal(object)
+    # (搜索序号, 命中批次 / 结果摘要)；序号用来丢弃已被新搜索取代的结果
+    search_hits = pyqtSignal(object, object)
+    search_done = pyqtSignal(object, object)
+
+    def __init__(self, directory, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.directory = directory
+        self.setWindowTitle(f"日志查看 - {directory}")
+        self.line_index = None
+        self._search_id = 0
+        self._search_stop = threading.Event()
+        self.index_progress.connect(self.on_index_progress)
+        self.search_hits.connect(self.on_search_hits)
+        self.search_done.connect(self.on_search_done)
+        self._init_ui()
+        self.refresh_files()
+
+    def _init_ui(self):
+        root = QWidget()
+        layout = QVBoxLayout()
+        row_dir = QHBoxLayout()
+        row_dir.addWidget(QLabel(self.directory))
+        btn_open_dir = QPushButton("打开目录")
+        btn_open_dir.clicked.connect(lambda: subprocess.Popen(["explorer", os.path.normpath(self.directory)]))
+        row_dir.addWidget(btn_open_dir)
+        layout.addLayout(row_dir)
+
+        splitter = QSplitter(Qt.Horizontal)
+        self.lst_files = QListWidget()
+        self.lst_files.currentItemChanged.connect(self.on_file_selected)
+        splitter.addWidget(self.lst_files)
+        right = QWidget()
+        right_layout = QVBoxLayout()
+        right_layout.setContentsMargins(0, 0, 0, 0)
+        font = QFontDatabase.systemFont(QFontDatabase.FixedFont)
+        self.lines_model = LogLineModel(self)
+        self.view_lines = QListView()
+        # 等高行：视图不必逐行测量，百万行滚动也只渲染可见部分
+        self.view_lines.setUniformItemSizes(True)
+        self.view_lines.setFont(font)
+        self.view_lines.setModel(self.lines_model)
+        right_layout.addWidget(self.view_lines, 3)
+        row_search = QHBoxLayout()
+        self.edit_pattern = QLineEdit()
+        self.edit_pattern.setPlaceholderText("搜索当前文件")
+        self.edit_pattern.returnPressed.connect(self.on_search_clicked)
+        row_search.addWidget(self.edit_pattern)
+        self.chk_regex = QCheckBox("正则")
+        self.chk_regex.setChecked(True)
+        row_search.addWidget(self.chk_regex)
+        self.chk_case = QCheckBox("区分大小写")
+        row_search.addWidget(self.chk_case)
+        self.btn_search = QPushButton("搜索")
+        self.btn_search.clicked.connect(self.on_search_clicked)
+        row_search.addWidget(self.btn_search)
+        self.btn_stop_search = QPushButton("停止")
+        self.btn_stop_search.clicked.connect(self.stop_search)
+        row_search.addWidget(self.btn_stop_search)
+        right_layout.addLayout(row_search)
+        # 打开合并后的 timeline.log 时可按时间跳转，借助 timeline.idx 定位
+        row_time = QHBoxLayout()
+        row_time.addWidget(QLabel("跳到时间"))
+        self.dt_jump = QDateTimeEdit(QDateTime.currentDateTime())
+        self.dt_jump.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+        self.dt_jump.setCalendarPopup(True)
+        row_time.addWidget(self.dt_jump)
+        self.btn_jump = QPushButton("跳转")
+        self.btn_jump.clicked.connect(self.on_jump_clicked)
+        row_time.addWidget(self.btn_jump)
+        row_time.addStretch(1)
+        right_layout.addLayout(row_time)
+        self._set_timeline_enabled(False)
+        self.hits_model = SearchHitModel(self)
+        self.view_hits = QListView()
+        self.view_hits.setUniformItemSizes(True)
+        self.view_hits.setFont(font)
+        self.view_hits.setModel(self.hits_model)
+        self.view_hits.clicked.connect(self.on_hit_clicked)
+        self.view_hits.activated.connect(self.on_hit_clicked)
+        right_layout.addWidget(self.view_hits, 1)
+        right.setLayout(right_layout)
+        splitter.addWidget(right)
+        splitter.setStretchFactor(1, 4)
+        layout.addWidget(splitter)
+        self.lbl_status = QLabel("")
+        layout.addWidget(self.lbl_status)
+        root.setLayout(layout)
+        self.setCentralWidget(root)
+        self.resize(1100, 700)
 
-    def _pull_anr(self, local_dir):
+    def refresh_files(self):
+        self.lst_files.clear()
+        for path in list_logs(self.directory):
+            item = QListWidgetItem(os.path.relpath(path, self.directory))
+            item.setData(Qt.UserRole, path)
+            self.lst_files.addItem(item)
+
+    def open_file(self, path):
+        self.stop_search()
+        self._search_id += 1
+        self.hits_model.clear()
+        if self.line_index is not None:
+            self.line_index.close()
+            self.line_index = None
         try:
-            self._emit("Pull /data/anr ...")
-            # Attempt pull; may require permissions depending on device
-            self._pull_file_safely("/data/anr", local_dir)
-        except Exception as e:
+            self.line_index = LineIndex(path)
+        except OSError as e:
             traceback.print_exc()
-            self._emit(f"Error pulling ANR: {e}")
+            self.lines_model.set_index(None)
+            self.lbl_status.setText(f"打开失败: {e}")
+            return
+        self.lines_model.set_index(self.line_index)
+        self._set_timeline_enabled(os.path.basename(path) == TIMELINE_FILE_NAME and os.path.exists(
+            os.path.join(os.path.dirname(path), TIMELINE_INDEX_NAME)))
+        self.lbl_status.setText(f"{path}  {format_size(self.line_index.size)}  索引中…")
+        self.line_index.start(on_progress=self.index_progress.emit)
+
+    def on_file_selected(self, current, previous):
+        if current is not None:
+            self.open_file(current.data(Qt.UserRole))
 
-    def run(self):
+    def on_index_progress(self, line_index):
+        if line_index is not self.line_index:
+            return
+        self.lines_model.grow()
+        if line_index.done:
+            self.lbl_status.setText(f"{line_index.path}  {format_size(line_index.size)}  "
+                                    f"{line_index.line_count()} 行  索引 {line_index.seconds:.2f}s")
+        else:
+            percent = line_index.scanned_bytes() * 100 // max(line_index.size, 1)
+            self.lbl_status.setText(f"{line_index.path}  {format_size(line_index.size)}  索引中 {percent}%  "
+                                    f"{line_index.line_count()} 行")
+
+    def on_search_clicked(self):
+        text = self.edit_pattern.text()
+        if not text or self.line_index is None:
+            return
+        flags = re.MULTILINE | (0 if self.chk_case.isChecked() else re.IGNORECASE)
         try:
-            self._emit("Listing device logs: sdcard/pudu/log")
-            filenames = get_files_in_folder("sdcard/pudu/log")
-            if not filenames:
-                self.failed.emit("No logs found in sdcard/pudu/log")
-                return
-            now = datetime.now().strftime("%Y%m%d%H%M%S")
-            target_dir = os.path.join("E:\\pudu\\log", now)
-            self._ensure_dir(target_dir)
-            # 若显式选择了文件，则优先拉取这些文件
-            if self.selected_files:
-                selected = list(self.selected_files)
-            else:
-                selected = self._select_logs(filenames, self.service_names, self.count)
-            if not selected:
-                self._emit("No matching logs by selection; continue with options if any.")
-            else:
-                for name in selected:
-                    self._pull_file_safely(f"sdcard/pudu/log/{name}", target_dir)
-            if self.need_kernel:
-                self._pull_file_safely("/sdcard/pudu/log/kernel", target_dir)
-            if self.need_anr:
-                self._pull_anr(target_dir)
-            if self.need_logcat:
-                self._dump_logcat(target_dir)
-            subprocess.call(["explorer", target_dir])
-            self.done.emit(target_dir)
-        except Exception as e:
-            traceback.print_exc()
-            self.failed.emit(str(e))
+            pattern = re.compile((text if self.chk_regex.isChecked() else re.escape(text)).encode("utf-8"), flags)
+        except re.error as e:
+            self.lbl_status.setText(f"正则错误: {e}")
+            return
+        self.stop_search()
+        self.hits_model.clear()
+        self._search_id += 1
+        self._search_stop = threading.Event()
+        search_id, stop, path = self._search_id, self._search_stop, self.line_index.path
 
+        def run():
+            try:
+                result = search_lines(path, pattern,
+                                      lambda batch: stop.is_set() or self.search_hits.emit(search_id, batch), stop)
+            except Exception as e:
+                traceback.print_exc()
+                result = {"error": str(e)}
+            try:
+                self.search_done.emit(search_id, result)
+            except RuntimeError:
+                # 搜索结束前窗口已关闭
+                pass
+        threading.Thread(target=run, daemon=True).start()
+        self.lbl_status.setText(f"搜索中: {text}")
 
-class KillWorker(QThread):
-    progress = pyqtSignal(str)
-    done = pyqtSignal()
-    failed = pyqtSignal(str)
+    def stop_search(self):
+        self._search_stop.set()
 
-    def __init__(self, packages, delete_pdlog):
-        super().__init__()
-        self.packages = list(dict.fromkeys(packages or []))
-        self.delete_pdlog = delete_pdlog
+    def on_search_hits(self, search_id, batch):
+        if search_id == self._search_id:
+            self.hits_model.append(batch)
 
-    def _emit(self, text):
-        self.progress.emit(text)
+    def on_search_done(self, search_id, result):
+        if search_id != self._search_id:
+            return
+        if "error" in result:
+            self.lbl_status.setText(f"搜索失败: {result['error']}")
+            return
+        text = f"{result['hits']} 处命中  {result['seconds']:.2f}s"
+        if result["truncated"]:
+            text += f"  （仅显示前 {SEARCH_MAX_HITS} 处）"
+        elif self._search_stop.is_set():
+            text += "  （已停止）"
+        self.lbl_status.setText(text)
+
+    def on_hit_clicked(self, index):
+        line = self.hits_model.data(index, Qt.UserRole)
+        if line is not None:
+            self.scroll_to_line(line)
+
+    def scroll_to_line(self, line):
+        if line >= self.lines_model.rowCount():
+            self.lbl_status.setText(f"第 {line + 1} 行尚未索引，稍后再试")
+            return
+        target = self.lines_model.index(line)
+        self.view_lines.scrollTo(target, QListView.PositionAtCenter)
+        self.view_lines.setCurrentIndex(target)
 
-    def run(self):
+    def _set_timeline_enabled(self, enabled):
+        self.dt_jump.setEnabled(enabled)
+        self.btn_jump.setEnabled(enabled)
+
+    def on_jump_clicked(self):
+        # 索引点间隔固定（TIMELINE_INDEX_STRIDE 条记录），定位只顺序读一个间隔，可在 GUI 线程完成
+        if self.line_index is None:
+            return
+        root = os.path.dirname(self.line_index.path)
         try:
-            # 先删除日志（按你的要求与命令）
-            if self.delete_pdlog:
-                try:
-                    self._emit('Run: find /sdcard/pudu/log -type f -name "*pdlog*" -exec rm {} \;')
-                    cmd_str = 'find /sdcard/pudu/log -type f -name "*pdlog*" -exec rm {} \;'
-                    _ = adb_command(["shell", cmd_str])
-                    # 简单校验
-                    listing = adb_command(["shell", r'ls -l /sdcard/pudu/log 2>/dev/null'])
-                    remain = [line for line in listing.splitlines() if ("pdlog" in line or "PDLOG" in line)]
-                    if remain:
-                        self._emit("Remain pdlog files:")
-                        for r in remain[:100]:
-                            self._emit(r)
-                    else:
-                        self._emit("All pdlog files removed.")
-                except Exception as e:
-                    traceback.print_exc()
-                    self._emit(f"Delete pdlog failed: {e}")
-            # 再执行 kill
-            for pkg in self.packages:
-                try:
-                    self._emit(f"force-stop {pkg}")
-                    _ = adb_command(["shell", "am", "force-stop", pkg])
-                except Exception as e:
-                    traceback.print_exc()
-                    self._emit(f"force-stop failed for {pkg}: {e}")
-            self.done.emit()
-        except Exception as e:
+            offset = timeline_seek(root, self.dt_jump.dateTime().toSecsSinceEpoch())
+        except OSError as e:
             traceback.print_exc()
-            self.failed.emit(str(e))
+            self.lbl_status.setText(f"时间线索引读取失败: {e}")
+            return
+        line = self.line_index.line_at(offset)
+        if line is None:
+            self.lbl_status.setText("该位置尚未索引，稍后再试")
+            return
+        self.scroll_to_line(min(line, max(self.lines_model.rowCount() - 1, 0)))
+
+    def closeEvent(self, event):
+        self.stop_search()
+        if self.line_index is not None:
+            self.line_index.close()
+            self.line_index = None
+        super().closeEvent(event)
 
 
 class LogPullWindow(QMainWindow):
+    # (任务, 处理函数)：任务在线程池里结束，经此信号回到 GUI 线程调用处理函数
+    job_finished = pyqtSignal(object, object)
+    # (已完成字节, 预计总字节)；大文件超出 32 位 int，用 object 传递
+    bytes_progress = pyqtSignal(object, object)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("PUDU Log Puller")
-        self._worker = None
-        self._kill_worker = None
+        # 拉取、kill、遍历、抓取都作为任务进优先级队列，共享线程池，同一设备上的独占任务串行
+        self.jobs = JobQueue(JOB_QUEUE_WORKERS)
+        self.job_finished.connect(self._on_job_finished)
+        self.bytes_progress.connect(self.on_bytes_progress)
+        self._pull_started = time.monotonic()
         self.selected_services = []
+        # 工作线程的消息先进缓冲，由定时器批量刷到日志窗口，避免逐条 append 卡住 GUI 线程
+        transcript = os.path.join(LOG_OUTPUT_ROOT, CONSOLE_DIR_NAME, datetime.now().strftime("%Y%m%d%H%M%S") + ".log")
+        self.console = ConsoleBuffer(transcript_path=transcript)
         self._init_ui()
+        self._console_timer = QTimer(self)
+        self._console_timer.timeout.connect(self.flush_log)
+        self._console_timer.start(CONSOLE_FLUSH_MS)
+        self._job_timer = QTimer(self)
+        self._job_timer.timeout.connect(self.refresh_jobs)
+        self._job_timer.start(JOB_REFRESH_MS)
+        self._maintenance_job = None
+        # 打开着的查看器窗口（保持引用，关闭时移除）
+        self._viewers = []
+        self._maintenance_timer = QTimer(self)
+        self._maintenance_timer.timeout.connect(self.on_maintain_clicked)
 
     def _init_ui(self):
         services = ["all", "None"] + SERVICES
         root = QWidget()
         layout = QVBoxLayout()
 
+        row0 = QHBoxLayout()
+        row0.addWidget(QLabel("设备:"))
+        self.lst_devices = QListWidget()
+        self.lst_devices.setSelectionMode(QListWidget.MultiSelection)
+        self.lst_devices.setMaximumHeight(60)
+        row0.addWidget(self.lst_devices)
+        self.btn_devices = QPushButton("刷新设备")
+        self.btn_devices.clicked.connect(self.on_refresh_devices_clicked)
+        row0.addWidget(self.btn_devices)
+        layout.addLayout(row0)
+
         row1 = QHBoxLayout()
         row1.addWidget(QLabel("Service:"))
         self.combo_service = QComboBox()
@@ -309,8 +480,43 @@ class LogPullWindow(QMainWindow):
         self.spin_count.setRange(1, 1000)
         self.spin_count.setValue(1)
         row2.addWidget(self.spin_count)
+        row2.addWidget(QLabel("并发数:"))
+        self.spin_workers = QSpinBox()
+        self.spin_workers.setRange(1, MAX_PULL_WORKERS)
+        self.spin_workers.setValue(DEFAULT_PULL_WORKERS)
+        row2.addWidget(self.spin_workers)
+        row2.addWidget(QLabel("传输模式:"))
+        self.combo_transfer = QComboBox()
+        self.combo_transfer.addItems(TRANSFER_MODES)
+        row2.addWidget(self.combo_transfer)
         layout.addLayout(row2)
 
+        row_time = QHBoxLayout()
+        self.chk_time_window = QCheckBox("按时间段")
+        row_time.addWidget(self.chk_time_window)
+        now = QDateTime.currentDateTime()
+        self.dt_start = QDateTimeEdit(now.addSecs(-3600))
+        self.dt_end = QDateTimeEdit(now)
+        for dt in (self.dt_start, self.dt_end):
+            dt.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+            dt.setCalendarPopup(True)
+        row_time.addWidget(self.dt_start)
+        row_time.addWidget(QLabel("~"))
+        row_time.addWidget(self.dt_end)
+        layout.addLayout(row_time)
+
+        row_grep = QHBoxLayout()
+        self.chk_grep = QCheckBox("过滤拉取")
+        row_grep.addWidget(self.chk_grep)
+        self.edit_grep = QLineEdit()
+        self.edit_grep.setPlaceholderText("关键字/正则，多个用 ; 分隔")
+        row_grep.addWidget(self.edit_grep)
+        row_grep.addWidget(QLabel("上下文行:"))
+        self.spin_grep_context = QSpinBox()
+        self.spin_grep_context.setRange(0, 100)
+        row_grep.addWidget(self.spin_grep_context)
+        layout.addLayout(row_grep)
+
         row3 = QHBoxLayout()
         self.chk_logcat = QCheckBox("拉取当前 logcat")
         self.chk_kernel = QCheckBox("拉取 kernel")
@@ -318,14 +524,51 @@ class LogPullWindow(QMainWindow):
         row3.addWidget(self.chk_logcat)
         row3.addWidget(self.chk_kernel)
         row3.addWidget(self.chk_anr)
+        self.chk_incremental = QCheckBox("增量拉取")
+        self.chk_md5 = QCheckBox("md5 校验")
+        self.chk_timeline = QCheckBox("合并时间线")
+        row3.addWidget(self.chk_incremental)
+        row3.addWidget(self.chk_md5)
+        row3.addWidget(self.chk_timeline)
+        self.chk_search_index = QCheckBox("建立索引")
+        row3.addWidget(self.chk_search_index)
         layout.addLayout(row3)
 
+        # 后台持续抓取 logcat 到本地分段环，拉取时可附带最近 N 分钟
+        row_capture = QHBoxLayout()
+        self.chk_capture = QCheckBox("后台抓取 logcat")
+        self.chk_capture.toggled.connect(self.on_capture_toggled)
+        row_capture.addWidget(self.chk_capture)
+        self.chk_capture_all = QCheckBox("-b all")
+        row_capture.addWidget(self.chk_capture_all)
+        self.chk_capture_binary = QCheckBox("二进制")
+        row_capture.addWidget(self.chk_capture_binary)
+        row_capture.addWidget(QLabel("拉取时附带最近(分钟，0=不附带):"))
+        self.spin_logcat_minutes = QSpinBox()
+        self.spin_logcat_minutes.setRange(0, 24 * 60)
+        row_capture.addWidget(self.spin_logcat_minutes)
+        layout.addLayout(row_capture)
+        self._capture_serials = []
+
+        # 本地归档整理（archive.py）：按保留策略删除旧会话、压缩较旧的会话，有拉取在跑时自动暂停
+        row_archive = QHBoxLayout()
+        self.chk_maintain = QCheckBox("后台归档整理(每小时)")
+        self.chk_maintain.toggled.connect(self.on_maintain_toggled)
+        row_archive.addWidget(self.chk_maintain)
+        self.btn_maintain = QPushButton("立即整理")
+        self.btn_maintain.clicked.connect(self.on_maintain_clicked)
+        row_archive.addWidget(self.btn_maintain)
+        layout.addLayout(row_archive)
+
         row4 = QHBoxLayout()
         self.btn_pull = QPushButton("开始拉取")
         self.btn_pull.clicked.connect(self.on_pull_clicked)
         row4.addWidget(self.btn_pull)
         self.chk_delete_pdlog = QCheckBox("Kill时删除 pdlog")
         row4.addWidget(self.chk_delete_pdlog)
+        self.chk_kill_parallel = QCheckBox("并行 kill")
+        self.chk_kill_parallel.setChecked(True)
+        row4.addWidget(self.chk_kill_parallel)
         self.btn_kill = QPushButton("Kill")
         self.btn_kill.clicked.connect(self.on_kill_clicked)
         row4.addWidget(self.btn_kill)
@@ -337,14 +580,50 @@ class LogPullWindow(QMainWindow):
         row5.addWidget(self.btn_browse)
         self.lbl_browse_count = QLabel("(0)")
         row5.addWidget(self.lbl_browse_count)
+        # 在本地归档的全文索引里查询，结果输出到下方日志窗口
+        self.edit_search = QLineEdit()
+        self.edit_search.setPlaceholderText("全文搜索已拉取日志（FTS5 语法，如 timeout AND CoreService）")
+        self.edit_search.returnPressed.connect(self.on_search_clicked)
+        row5.addWidget(self.edit_search)
+        self.btn_search = QPushButton("搜索")
+        self.btn_search.clicked.connect(self.on_search_clicked)
+        row5.addWidget(self.btn_search)
+        self.btn_view = QPushButton("查看日志")
+        self.btn_view.clicked.connect(self.on_view_logs_clicked)
+        row5.addWidget(self.btn_view)
         layout.addLayout(row5)
 
         self.lst_logs = QListWidget()
         self.lst_logs.setSelectionMode(QListWidget.MultiSelection)
         layout.addWidget(self.lst_logs)
 
-        self.txt_log = QTextEdit()
+        row_jobs = QHBoxLayout()
+        self.lbl_queue = QLabel("任务队列: 空闲")
+        row_jobs.addWidget(self.lbl_queue)
+        self.btn_cancel_job = QPushButton("取消所选任务")
+        self.btn_cancel_job.clicked.connect(self.on_cancel_job_clicked)
+        row_jobs.addWidget(self.btn_cancel_job)
+        self.btn_abort = QPushButton("全部中止")
+        self.btn_abort.clicked.connect(self.on_abort_clicked)
+        row_jobs.addWidget(self.btn_abort)
+        layout.addLayout(row_jobs)
+        self.lst_jobs = QListWidget()
+        self.lst_jobs.setSelectionMode(QListWidget.MultiSelection)
+        self.lst_jobs.setMaximumHeight(90)
+        layout.addWidget(self.lst_jobs)
+
+        row_progress = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(0)
+        row_progress.addWidget(self.progress_bar)
+        self.lbl_eta = QLabel("")
+        row_progress.addWidget(self.lbl_eta)
+        layout.addLayout(row_progress)
+
+        self.txt_log = QPlainTextEdit()
         self.txt_log.setReadOnly(True)
+        self.txt_log.setMaximumBlockCount(CONSOLE_MAX_LINES)
         layout.addWidget(self.txt_log)
 
         root.setLayout(layout)
@@ -352,7 +631,148 @@ class LogPullWindow(QMainWindow):
         self.resize(640, 420)
 
     def append_log(self, text):
-        self.txt_log.append(text)
+        # 可在任意线程调用
+        self.console.append(text)
+
+    def flush_log(self):
+        lines, dropped = self.console.drain()
+        if dropped:
+            lines.insert(0, f"... {dropped} lines skipped, full log: {self.console.transcript_path}")
+        if lines:
+            self.txt_log.appendPlainText("\n".join(lines))
+
+    def clear_log(self):
+        self.console.clear()
+        self.txt_log.clear()
+
+    def closeEvent(self, event):
+        self._job_timer.stop()
+        self._maintenance_timer.stop()
+        for viewer in list(self._viewers):
+            viewer.close()
+        # 关闭窗口即中止所有任务，杀掉在跑的 adb
+        self.jobs.shutdown()
+        stop_all_captures()
+        self._console_timer.stop()
+        self.console.close()
+        super().closeEvent(event)
+
+    def submit_job(self, name, fn, priority, serials=None, exclusive=True, on_finish=None):
+        # on_finish(job) 在 GUI 线程调用
+        handler = on_finish or self._log_job_result
+        job = Job(name, fn, priority, serials, exclusive, on_finish=lambda j: self.job_finished.emit(j, handler))
+        self.jobs.submit(job)
+        self.refresh_jobs()
+        return job
+
+    def _on_job_finished(self, job, handler):
+        handler(job)
+        self.refresh_jobs()
+
+    def _log_job_result(self, job):
+        self.append_log(f"Job {job.describe()}")
+
+    def refresh_jobs(self):
+        stats = self.jobs.stats()
+        if stats["queued"] or stats["running"]:
+            self.lbl_queue.setText(f"任务队列: {stats['running']} 运行 / {stats['queued']} 等待  "
+                                   f"平均等待 {stats['avg_wait']:.1f}s 运行 {stats['avg_run']:.1f}s")
+        else:
+            self.lbl_queue.setText(f"任务队列: 空闲  平均等待 {stats['avg_wait']:.1f}s 运行 {stats['avg_run']:.1f}s")
+        selected = {i.data(Qt.UserRole) for i in self.lst_jobs.selectedItems()}
+        self.lst_jobs.clear()
+        for job in self.jobs.jobs():
+            item = QListWidgetItem(job.describe())
+            item.setData(Qt.UserRole, job.id)
+            self.lst_jobs.addItem(item)
+            if job.id in selected:
+                item.setSelected(True)
+
+    def on_cancel_job_clicked(self):
+        for item in self.lst_jobs.selectedItems():
+            if self.jobs.cancel(item.data(Qt.UserRole)):
+                self.append_log(f"Cancel job #{item.data(Qt.UserRole)}")
+        self.refresh_jobs()
+
+    def on_abort_clicked(self):
+        count = self.jobs.abort()
+        self.append_log(f"Aborted {count} jobs.")
+        self.refresh_jobs()
+
+    def on_capture_toggled(self, checked):
+        # 勾选时对所选设备（未选则默认设备）启动抓取，取消时全部停止；启停本身很快，不占设备
+        if checked:
+            self._capture_serials = self.selected_serials() or [None]
+            buffers = "all" if self.chk_capture_all.isChecked() else None
+            binary = self.chk_capture_binary.isChecked()
+
+            def start(job, serials=list(self._capture_serials)):
+                for serial in serials:
+                    capture = start_capture(serial, LOG_OUTPUT_ROOT, buffers, binary, on_status=self.append_log)
+                    self.append_log(f"Logcat capture started: {serial or 'default'} -> {capture.directory}")
+            self.submit_job("capture start", start, PRIORITY_CAPTURE, self._capture_serials, exclusive=False)
+        else:
+            def stop(job, serials=list(self._capture_serials)):
+                for serial in serials:
+                    stop_capture(serial)
+                    self.append_log(f"Logcat capture stopped: {serial or 'default'}")
+            self.submit_job("capture stop", stop, PRIORITY_CAPTURE, self._capture_serials, exclusive=False)
+            self._capture_serials = []
+        self.chk_capture_all.setEnabled(not checked)
+        self.chk_capture_binary.setEnabled(not checked)
+
+    def on_maintain_toggled(self, checked):
+        if checked:
+            self._maintenance_timer.start(MAINTENANCE_INTERVAL_MS)
+            self.on_maintain_clicked()
+        else:
+            self._maintenance_timer.stop()
+
+    def on_maintain_clicked(self):
+        # 同一时间只排一个整理任务；不占设备（非独占），压缩进程在有独占任务运行时暂停派发
+        if self._maintenance_job is not None and not self._maintenance_job.wait(0):
+            return
+        import archive
+
+        def run(job):
+            return archive.run_maintenance(LOG_OUTPUT_ROOT, on_progress=self.append_log, check_cancel=job.check,
+                                           should_pause=lambda: any(j.exclusive for j in self.jobs.running()))
+
+        def finished(job):
+            if job.state == STATE_DONE:
+                result = job.result
+                compress = result.get("compress") or {}
+                self.append_log(f"Archive maintenance: removed {len(result['removed'])} sessions "
+                                f"({format_size(result['freed'])}), compressed {compress.get('files', 0)} files "
+                                f"({format_size(compress.get('before', 0))} -> {format_size(compress.get('after', 0))})")
+            else:
+                self._log_job_result(job)
+        self._maintenance_job = self.submit_job("archive maintenance", run, PRIORITY_MAINTENANCE, exclusive=False,
+                                                on_finish=finished)
+
+    def selected_serials(self):
+        # 未选择设备时返回空列表，沿用 adb 默认设备
+        return [i.data(Qt.UserRole) for i in self.lst_devices.selectedItems()]
+
+    def on_refresh_devices_clicked(self):
+        # adb devices -l 在 adb server 启动或 TCP 设备失联时会卡几秒，放到队列里跑，结束后在 GUI 线程填列表
+        self.btn_devices.setEnabled(False)
+
+        def finished(job):
+            self.btn_devices.setEnabled(True)
+            if job.state != STATE_DONE:
+                self._log_job_result(job)
+                return
+            previous = set(self.selected_serials())
+            self.lst_devices.clear()
+            for dev in job.result:
+                item = QListWidgetItem(f"{dev.serial}  {dev.state}  {dev.description}")
+                item.setData(Qt.UserRole, dev.serial)
+                self.lst_devices.addItem(item)
+                if dev.serial in previous:
+                    item.setSelected(True)
+            self.append_log(f"Found {len(job.result)} devices.")
+        self.submit_job("devices", lambda job: list_devices(), PRIORITY_BROWSE, exclusive=False, on_finish=finished)
 
     def on_multi_select_clicked(self):
         dlg = QDialog(self)
@@ -388,15 +808,18 @@ class LogPullWindow(QMainWindow):
         self.lbl_multi.setText("(未选择)")
 
     def on_pull_clicked(self):
-        if self._worker is not None and self._worker.isRunning():
-            QMessageBox.warning(self, "Busy", "Task is running, please wait...")
-            return
         service = self.combo_service.currentText()
         count = int(self.spin_count.value())
         need_logcat = self.chk_logcat.isChecked()
         need_kernel = self.chk_kernel.isChecked()
         need_anr = self.chk_anr.isChecked()
-        self.txt_log.clear()
+        workers = int(self.spin_workers.value())
+        transfer_mode = self.combo_transfer.currentText()
+        incremental = self.chk_incremental.isChecked()
+        verify_md5 = self.chk_md5.isChecked()
+        if not self.jobs.stats()["running"] and not self.jobs.depth():
+            # 队列空闲时才清空日志窗口，避免冲掉其它任务的输出
+            self.clear_log()
         if self.selected_services:
             service_names = list(self.selected_services)
         else:
@@ -406,22 +829,89 @@ class LogPullWindow(QMainWindow):
                 service_names = []
             else:
                 service_names = [service]
+        serials = self.selected_serials()
+        time_window = None
+        if self.chk_time_window.isChecked():
+            time_window = (self.dt_start.dateTime().toSecsSinceEpoch(), self.dt_end.dateTime().toSecsSinceEpoch())
+        grep_patterns = []
+        if self.chk_grep.isChecked():
+            grep_patterns = [p.strip() for p in self.edit_grep.text().split(";") if p.strip()]
+        options = dict(workers=workers, transfer_mode=transfer_mode, incremental=incremental, verify_md5=verify_md5,
+                       serials=serials, time_window=time_window,
+                       grep_patterns=grep_patterns, grep_context=int(self.spin_grep_context.value()),
+                       timeline=self.chk_timeline.isChecked(), search_index=self.chk_search_index.isChecked(),
+                       logcat_minutes=int(self.spin_logcat_minutes.value()))
         # 若列表中用户手动选择了日志，则仅拉取所选
-        selected_items = [i.text() for i in self.lst_logs.selectedItems()]
+        selected_items = [i.data(Qt.UserRole) for i in self.lst_logs.selectedItems()]
         if selected_items:
-            self.append_log(f"Start pull (manual list): files={selected_items}, logcat={need_logcat}, kernel={need_kernel}, anr={need_anr}")
-            self._worker = LogPullWorker(service_names, count, need_logcat, need_kernel, need_anr, selected_files=selected_items)
+            self.append_log(f"Queue pull (manual list): files={selected_items}, logcat={need_logcat}, kernel={need_kernel}, anr={need_anr}")
         else:
-            self.append_log(f"Start pull: services={service_names}, count={count}, logcat={need_logcat}, kernel={need_kernel}, anr={need_anr}")
-            self._worker = LogPullWorker(service_names, count, need_logcat, need_kernel, need_anr)
-        self._worker.progress.connect(self.append_log)
-        self._worker.done.connect(self.on_done)
-        self._worker.failed.connect(self.on_failed)
-        self._worker.start()
+            self.append_log(f"Queue pull: services={service_names}, count={count}, logcat={need_logcat}, kernel={need_kernel}, anr={need_anr}")
+        self.progress_bar.setValue(0)
+        self.lbl_eta.setText("")
+        # ANR/kernel/logcat 快照与大批量 pdlog 拆成两个任务写进同一目录，快照优先级更高、先跑完
+        target_dir = os.path.join(LOG_OUTPUT_ROOT, datetime.now().strftime("%Y%m%d%H%M%S"))
+        has_pdlog = bool(selected_items or service_names)
+        if has_pdlog and (need_logcat or need_kernel or need_anr):
+            snapshot_options = dict(options, timeline=False, search_index=False, logcat_minutes=0)
+            self._submit_pull("pull anr/kernel", PRIORITY_SNAPSHOT, target_dir,
+                              ([], count, need_logcat, need_kernel, need_anr), snapshot_options, final=False)
+            need_logcat = need_kernel = need_anr = False
+        self._submit_pull("pull pdlog" if has_pdlog else "pull anr/kernel", PRIORITY_PULL if has_pdlog else PRIORITY_SNAPSHOT,
+                          target_dir, (service_names, count, need_logcat, need_kernel, need_anr, selected_items),
+                          options, final=True)
+
+    def _submit_pull(self, name, priority, target_dir, args, options, final):
+        # final：整次拉取的最后一个任务，完成后打开目录并弹窗
+        throttle = {"at": 0.0}
+
+        def on_bytes(done, expected):
+            # 限频后再发给 UI
+            now = time.monotonic()
+            if now - throttle["at"] < BYTES_PROGRESS_INTERVAL:
+                return
+            throttle["at"] = now
+            self.bytes_progress.emit(done, expected)
+
+        def run(job):
+            # 拉取逻辑在 pull_log.LogPuller（命令行共用）；进度直接入日志缓冲，不经 GUI 事件队列
+            self._pull_started = time.monotonic()
+            puller = LogPuller(*args, on_progress=self.append_log, on_bytes=on_bytes, check_cancel=job.check, **options)
+            result = puller.run(target_dir)
+            self.bytes_progress.emit(*puller.bytes_total())
+            return result
+
+        def finished(job):
+            if job.state == STATE_DONE:
+                if final:
+                    self.on_done(job.result["dir"])
+                else:
+                    self.append_log(f"Job {job.describe()}")
+            elif job.state == STATE_CANCELLED:
+                self.append_log(f"Cancelled: {job.name} (partial output kept in {target_dir})")
+            else:
+                self.on_failed(job.error)
+        self.submit_job(name, run, priority, options.get("serials"), on_finish=finished)
 
     # 已移除“投屏”功能
 
     def on_browse_logs_clicked(self):
+        # 清单在任务线程里获取，结果回到 GUI 线程再填列表；只读，不独占设备
+        serials = self.selected_serials()
+
+        def fetch(job):
+            # 多设备时以第一台为准浏览
+            catalog = get_catalog(serials[0] if serials else None)
+            # 点击“遍历日志”总是取最新清单，随后的拉取在 TTL 内复用它
+            catalog.invalidate()
+            return {e.path: e for e in catalog.top_level() if not e.is_dir}
+        self.submit_job("browse", fetch, PRIORITY_BROWSE, serials[:1], exclusive=False, on_finish=self.on_browse_finished)
+
+    def on_browse_finished(self, job):
+        if job.state != STATE_DONE:
+            self._log_job_result(job)
+            return
+        entries = job.result
         # 基于当前选择的服务集合获取候选日志列表
         service = self.combo_service.currentText()
         if self.selected_services:
@@ -433,7 +923,7 @@ class LogPullWindow(QMainWindow):
                 service_names = []
             else:
                 service_names = [service]
-        files = get_files_in_folder("sdcard/pudu/log")
+        files = list(entries)
         if not files:
             self.append_log("No logs found in sdcard/pudu/log")
             return
@@ -465,33 +955,87 @@ class LogPullWindow(QMainWindow):
         # 刷新列表
         self.lst_logs.clear()
         for n in ordered:
-            self.lst_logs.addItem(n)
+            entry = entries[n]
+            mtime = datetime.fromtimestamp(entry.mtime).strftime("%m-%d %H:%M:%S") if entry.mtime else "?"
+            item = QListWidgetItem(f"{n}    {format_size(entry.size)}    {mtime}")
+            item.setData(Qt.UserRole, n)
+            self.lst_logs.addItem(item)
         self.lbl_browse_count.setText(f"({len(ordered)})")
         self.append_log(f"Listed {len(ordered)} logs.")
 
     def on_kill_clicked(self):
-        if self._kill_worker is not None and self._kill_worker.isRunning():
-            QMessageBox.warning(self, "Busy", "Kill task is running, please wait...")
-            return
         delete_pdlog = self.chk_delete_pdlog.isChecked()
-        self.append_log(f"Start kill. delete_pdlog={delete_pdlog}")
-        self._kill_worker = KillWorker(KILL_PACKAGES, delete_pdlog)
-        self._kill_worker.progress.connect(self.append_log)
-        self._kill_worker.done.connect(lambda: QMessageBox.information(self, "完成", "Kill 完成"))
-        self._kill_worker.failed.connect(lambda msg: QMessageBox.critical(self, "失败", f"Kill 失败\n{msg}"))
-        self._kill_worker.start()
+        parallel = self.chk_kill_parallel.isChecked()
+        serials = self.selected_serials()
+        self.append_log(f"Queue kill. delete_pdlog={delete_pdlog}, parallel={parallel}, devices={serials or 'default'}")
+
+        def finished(job):
+            if job.state == STATE_DONE:
+                QMessageBox.information(self, "完成", "Kill 完成")
+            elif job.state == STATE_CANCELLED:
+                self.append_log("Kill cancelled.")
+            else:
+                QMessageBox.critical(self, "失败", f"Kill 失败\n{job.error}")
+        # 删除 pdlog 与正在进行的拉取冲突，按设备独占排队
+        self.submit_job("kill", lambda job: kill_devices(KILL_PACKAGES, delete_pdlog, serials, self.append_log, parallel),
+                        PRIORITY_KILL, serials, on_finish=finished)
+
+    def on_search_clicked(self):
+        query = self.edit_search.text().strip()
+        if not query:
+            return
+        from log_search import SearchIndex
+        try:
+            index = SearchIndex(LOG_OUTPUT_ROOT)
+            try:
+                started = time.perf_counter()
+                hits = index.search(query)
+                elapsed = (time.perf_counter() - started) * 1000
+            finally:
+                index.close()
+        except Exception as e:
+            traceback.print_exc()
+            self.append_log(f"Search failed: {e}")
+            return
+        self.append_log(f"Search '{query}': {len(hits)} hits in {elapsed:.1f} ms")
+        for hit in hits:
+            self.append_log(f"{hit.path}:{hit.offset}: {hit.line}")
+
+    def on_bytes_progress(self, done, expected):
+        # 目录类条目大小未知，预计总量可能偏小，按已完成量兜底
+        total = max(expected, done)
+        if total <= 0:
+            return
+        self.progress_bar.setValue(int(done * 1000 / total))
+        elapsed = max(time.monotonic() - self._pull_started, 1e-3)
+        rate = done / elapsed
+        eta = (total - done) / rate if rate > 0 else 0
+        self.lbl_eta.setText(f"{format_size(done)}/{format_size(total)}  {rate / 1048576:.2f} MB/s  ETA {eta:.0f}s")
 
     def on_done(self, target_dir):
         self.append_log(f"Done. Output: {target_dir}")
+        # 拉取完成后直接在内置查看器里打开输出目录（外部编辑器打不开几百 MB 的 pdlog/kernel）
+        self.open_viewer(target_dir)
         QMessageBox.information(self, "完成", f"拉取完成\n{target_dir}")
 
+    def open_viewer(self, directory):
+        viewer = LogViewerWindow(directory)
+        self._viewers.append(viewer)
+        viewer.destroyed.connect(lambda _=None, v=viewer: self._viewers.remove(v) if v in self._viewers else None)
+        viewer.show()
+
+    def on_view_logs_clicked(self):
+        directory = QFileDialog.getExistingDirectory(self, "选择拉取输出目录", LOG_OUTPUT_ROOT)
+        if directory:
+            self.open_viewer(directory)
+
     def on_failed(self, message):
         self.append_log(f"Failed: {message}")
         QMessageBox.critical(self, "失败", f"拉取失败\n{message}")
 
 
 def main():
-    # 每次执行 main 时触发一次打包（仅在源码态）
+    # 源码态下按需触发一次打包（见 trigger_pack_once）
     trigger_pack_once()
     app = QApplication(sys.argv)
     win = LogPullWindow()
@@ -502,5 +1046,7 @@ def main():
 #打包exe的命令：D:\python\Scripts\pyinstaller -w -F -i img.png -n PullLogUI main.py
 # -w 去除控制台窗口；-F 打包dist目录下的文件夹，生成单exe程序，不然只能在dist 目录下运行exe；-i 图标； -n exe的名称
 if __name__ == "__main__":
+    # 时间线解析用进程池，打包成 exe 后子进程需要这一步
+    multiprocessing.freeze_support()
     main()
 
@@ -1,48 +1,2175 @@
+import atexit
+import bisect
+import contextlib
+import json
+import shutil
 import subprocess
 import os
+import posixpath
+import re
+import shlex
+import queue
+import sys
+import threading
+import time
+import traceback
+import weakref
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+# 并发拉取默认线程数：adb server 对同一设备的并发传输有限，过大反而拖慢
+DEFAULT_PULL_WORKERS = 4
+MAX_PULL_WORKERS = 16
 
-def adb_command(command):
+# 传输模式：逐个 adb pull，或把整批文件打成一个 tar 流（adb exec-out tar c）边收边解
+TRANSFER_PER_FILE = "per-file"
+TRANSFER_TAR = "tar"
+# 设备端 gzip 压缩后传输，主机端边收边解压；适合 adb over Wi-Fi
+TRANSFER_GZIP = "gzip"
+# 大文件按块续传（dd/tail -c 经 exec-out 读取字节区间），断线后从本地 .part 继续；适合不稳定的 Wi-Fi 连接
+TRANSFER_CHUNKED = "chunked"
+TRANSFER_MODES = [TRANSFER_PER_FILE, TRANSFER_TAR, TRANSFER_GZIP, TRANSFER_CHUNKED]
+# gzip 模式下小于该大小的文件压缩收益抵不过额外开销，仍走 adb pull
+GZIP_MIN_SIZE = 64 * 1024
+# 流式读取的块大小
+STREAM_CHUNK_SIZE = 256 * 1024
+# 续传模式：块大小（dd bs，续传点按块对齐）、起用的最小文件大小、无进展时的最大重试次数与退避（秒）
+CHUNKED_BLOCK_SIZE = 1024 * 1024
+CHUNKED_MIN_SIZE = 4 * 1024 * 1024
+CHUNKED_MAX_RETRIES = 8
+CHUNKED_BACKOFF_BASE = 0.5
+CHUNKED_BACKOFF_MAX = 30
+# 传完后与设备端 md5 比对（head -c <size> | md5sum）；关闭时只比对大小
+CHUNKED_VERIFY_MD5 = True
+PART_SUFFIX = ".part"
+RESUME_SUFFIX = ".part.json"
+# 续传中的 .part 放在输出根目录下的固定位置，下一次拉取（新的时间戳目录）也能接着传
+PARTIAL_DIR_NAME = ".partial"
+# adb 可执行程序；可用环境变量 PULLLOG_ADB 指向其它 adb 或 fake_adb.py（如 "python fake_adb.py"）
+ADB_COMMAND = shlex.split(os.environ.get("PULLLOG_ADB", "adb"), posix=(os.name != 'nt'))
+# 设备端日志目录
+REMOTE_LOG_DIR = "sdcard/pudu/log"
+# 远端日志目录清单缓存时长（秒），浏览与拉取共用
+CATALOG_TTL = 30
+
+# 设备上的服务日志前缀（UI 与命令行共用）
+SERVICES = [
+    "NavigationService",
+    "pudutech-maptools",
+    "RunTimeInfoService",
+    "launcher",
+    "can_service",
+    "OTAService",
+    "IOTService",
+    "CoreService",
+    "CloudService",
+    "SpeechService",
+    "Diagnose",
+    "pudutech-mirsdk.g3log",
+    "mirsdk.g3log"
+]
+
+# 一键 kill 时 force-stop 的包
+KILL_PACKAGES = [
+    "com.pudutech.usher",
+    "com.pudutech.resource.manager.service",
+    "com.pudutech.solicit",
+    "com.pudutech.business.usher",
+    "com.pudutech.remotemaintenance",
+    "com.pudutech.ad.service",
+    "com.pudutech.business.delivery",
+    "com.pudutech.business.recycle",
+    "com.pudutech.business.call",
+    "com.pudutech.business.function",
+    "com.pudutech.function",
+    "com.pudutech.puduossetting",
+    "com.pudutech.business.gohome",
+    "com.pudutech.robot.peanut",
+    "com.pudutech.factory_test",
+    "com.pudutech.bumblebee",
+    "com.pudutech.business.cruise",
+    "com.pudutech.project_one.business_delivery",
+    "com.pudutech.map",
+    "com.pudutech.iot2",
+    "com.pudutech.cloud",
+    "com.pudutech.hardware2",
+    "com.pudutech.navigation",
+    "com.pudutech.ota",
+    "com.pudutech.maptools",
+    "com.pudutech.setupwizard",
+    "com.pudutech.hls2robot",
+    "com.pudutech.robot.vacuum",
+    "com.pudutech.launcher",
+    "com.pudutech.core",
+    "puduos.app",
+    "run_time_info_service",
+    "com.pudutech.diagnose",
+]
+
+# 本地输出根目录：每次拉取生成 <根目录>\<时间戳>
+LOG_OUTPUT_ROOT = "E:\\pudu\\log"
+# 增量拉取的内容寻址存储与清单，放在输出根目录下
+STORE_DIR_NAME = ".store"
+MANIFEST_NAME = ".manifest.json"
+
+# 每次拉取在输出目录写一份 JSONL 指标
+METRICS_FILE_NAME = "metrics.jsonl"
+# adb pull 期间轮询本地文件大小推进进度的间隔（秒）
+PULL_PROGRESS_INTERVAL = 0.3
+# 界面日志：待显示行的环形缓冲容量；完整记录写到 <输出根目录>/console/<启动时间>.log
+CONSOLE_BUFFER_LINES = 20000
+CONSOLE_DIR_NAME = "console"
+
+# 常驻 adb shell 会话：shell 类命令复用同一个进程，免去每次启动 adb 的开销
+USE_SHELL_SESSION = os.environ.get("PULLLOG_SHELL_SESSION", "1") != "0"
+SHELL_SESSION_TIMEOUT = 60
+# 直连 adb server（adb_client.py）做 pull / exec-out / devices，不可达时退回 adb 子进程。
+# 指定了 PULLLOG_ADB（替身等）时默认关闭，避免绕过替身连到真实的 server
+USE_NATIVE_ADB = os.environ.get("PULLLOG_ADB_NATIVE", "0" if "PULLLOG_ADB" in os.environ else "1") != "0"
+# 多设备并行时整机（adb server + USB 总线）同时进行的传输数上限
+HOST_TRANSFER_LIMIT = 8
+# 单条 tar 命令的参数总长度上限，避免超出设备 shell 的 ARG_MAX
+TAR_MAX_ARGS_CHARS = 32 * 1024
+
+
+class AdbError(Exception):
+    pass
+
+
+class JobCancelled(AdbError):
+    # 任务被取消：该设备上的 adb 子进程已被杀掉，新的 adb 调用直接抛出
+    pass
+
+
+def _hidden_window_kwargs():
+    # Windows 下隐藏控制台窗口
+    startupinfo = None
+    creationflags = 0
+    if os.name == 'nt':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        creationflags = subprocess.CREATE_NO_WINDOW
+    return {"startupinfo": startupinfo, "creationflags": creationflags}
+
+
+def _adb_args(command, serial=None):
+    # serial 为空时沿用 adb 的默认设备选择（只连一台时）
+    if serial:
+        return [*ADB_COMMAND, '-s', serial, *command]
+    return [*ADB_COMMAND, *command]
+
+
+_round_trips = 0
+_round_trips_lock = threading.Lock()
+
+
+def _count_round_trip():
+    global _round_trips
+    with _round_trips_lock:
+        _round_trips += 1
+
+
+def adb_round_trips():
+    # 进程内累计的 adb 往返次数（子进程 + 会话命令），供基准对比
+    return _round_trips
+
+
+_adb_observers = []
+
+
+def add_adb_observer(observer):
+    # observer(command, serial, seconds, returncode)，每次 adb 调用结束后回调
+    _adb_observers.append(observer)
+
+
+def remove_adb_observer(observer):
     try:
-        # Windows 下隐藏控制台窗口
-        startupinfo = None
-        creationflags = 0
-        if os.name == 'nt':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            creationflags = subprocess.CREATE_NO_WINDOW
-        result = subprocess.run(
-            ['adb', *command],
-            capture_output=True,
-            text=True,
-            startupinfo=startupinfo,
-            creationflags=creationflags,
+        _adb_observers.remove(observer)
+    except ValueError:
+        pass
+
+
+def _notify_adb(command, serial, seconds, returncode):
+    for observer in list(_adb_observers):
+        try:
+            observer(command, serial, seconds, returncode)
+        except Exception:
+            traceback.print_exc()
+
+
+# 按设备登记在跑的 adb 子进程，取消任务时整体杀掉（None 即默认设备）；
+# 进程对象结束回收后自动从 WeakSet 中消失
+_adb_processes = {}
+_cancelled_serials = set()
+_adb_processes_lock = threading.Lock()
+# 当前线程是否在跑非独占任务（浏览等，见 shared_adb）
+_adb_context = threading.local()
+
+
+@contextlib.contextmanager
+def shared_adb():
+    # 非独占任务与同设备上的独占任务并行：其 adb 调用不登记、不受按设备取消影响，
+    # 取消该任务本身只置标志，由任务自己检查（job_queue.Job.check）
+    _adb_context.shared = True
+    try:
+        yield
+    finally:
+        _adb_context.shared = False
+
+
+def _track_process(proc, serial):
+    if getattr(_adb_context, "shared", False):
+        return proc
+    with _adb_processes_lock:
+        if serial in _cancelled_serials:
+            # 登记前已被取消：不让它跑下去
+            proc.kill()
+        _adb_processes.setdefault(serial, weakref.WeakSet()).add(proc)
+    return proc
+
+
+def raise_if_cancelled(serial=None):
+    if serial in _cancelled_serials and not getattr(_adb_context, "shared", False):
+        raise JobCancelled(f"cancelled: {serial or 'default device'}")
+
+
+def cancel_adb(serials):
+    # 取消这些设备上的 adb 工作：之后的调用直接抛 JobCancelled，在跑的子进程与 shell 会话全部杀掉。
+    # 由调度方在任务结束后调用 release_adb 恢复
+    serials = list(serials or [None])
+    with _adb_processes_lock:
+        _cancelled_serials.update(serials)
+        procs = [proc for serial in serials for proc in _adb_processes.get(serial, ())]
+    for proc in procs:
+        try:
+            if proc.poll() is None:
+                proc.kill()
+        except OSError:
+            pass
+    with _shell_session_lock:
+        sessions = [_shell_sessions[s] for s in serials if s in _shell_sessions]
+    for session in sessions:
+        session.close()
+
+
+def release_adb(serials):
+    with _adb_processes_lock:
+        _cancelled_serials.difference_update(serials or [None])
+
+
+def adb_run(command, serial=None):
+    # 返回 (returncode, stdout, stderr)，供需要区分成功/失败的调用方使用
+    raise_if_cancelled(serial)
+    _count_round_trip()
+    started = time.perf_counter()
+    proc = _track_process(subprocess.Popen(
+        _adb_args(command, serial),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        **_hidden_window_kwargs(),
+    ), serial)
+    stdout, stderr = proc.communicate()
+    _notify_adb(command, serial, time.perf_counter() - started, proc.returncode)
+    raise_if_cancelled(serial)
+    stdout = stdout if isinstance(stdout, str) else ""
+    stderr = stderr if isinstance(stderr, str) else ""
+    return proc.returncode, stdout, stderr
+
+
+def _native_adb():
+    # 可直连 adb server 时返回 adb_client 模块，否则 None
+    if not USE_NATIVE_ADB:
+        return None
+    import adb_client
+    return adb_client if adb_client.server_available() else None
+
+
+def _native_failed(serial, error):
+    # 直连出错后本次调用退回子进程；被取消则照常抛 JobCancelled。
+    # 只有连不上 server 才在之后一段时间都走子进程，某台设备掉线导致的连接重置不影响其它设备
+    raise_if_cancelled(serial)
+    traceback.print_exc()
+    import adb_client
+    if isinstance(error, adb_client.AdbServerUnreachable):
+        adb_client.mark_server_down()
+
+
+def adb_popen(command, serial=None, cancellable=True):
+    # 流式读取 stdout（二进制），调用方负责 wait/关闭；stderr 丢弃，避免无人读取时管道写满卡死。
+    # cancellable=False 的进程（后台 logcat 抓取）不受任务取消影响
+    if cancellable:
+        raise_if_cancelled(serial)
+    _count_round_trip()
+    native = _native_adb() if command[0] in ("exec-out", "shell") and len(command) > 1 else None
+    if native is not None:
+        # 直连返回的流与 Popen 接口一致（stdout/poll/kill/wait）
+        try:
+            stream = native.open_stream(command, serial)
+            return _track_process(stream, serial) if cancellable else stream
+        except OSError as e:
+            _native_failed(serial, e)
+    proc = subprocess.Popen(
+        _adb_args(command, serial),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        **_hidden_window_kwargs(),
+    )
+    return _track_process(proc, serial) if cancellable else proc
+
+
+class AdbShellSession:
+    # 在一个长驻的 `adb shell` 管道上串行执行多条命令；每条命令后输出唯一哨兵行分帧。
+    # 超时或进程退出时杀掉会话，下次调用自动重连。
+
+    def __init__(self, serial=None, timeout=SHELL_SESSION_TIMEOUT):
+        self.serial = serial
+        self.timeout = timeout
+        self._proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        raise_if_cancelled(self.serial)
+        self._proc = subprocess.Popen(
+            _adb_args(['shell'], self.serial),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            **_hidden_window_kwargs(),
         )
-        stdout = result.stdout if isinstance(result.stdout, str) else ""
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_loop, args=(self._proc, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _read_loop(proc, lines):
+        try:
+            for raw in proc.stdout:
+                lines.put(raw.decode("utf-8", errors="replace"))
+        except Exception:
+            pass
+        lines.put(None)
+
+    def close(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.kill()
+            proc.wait(timeout=5)
+        except Exception:
+            pass
+
+    def _alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def _send(self, command, marker):
+        # 命令放进子 shell，cd/变量不会污染会话；不读 stdin，避免吞掉后续命令；
+        # 先 echo 换行，保证哨兵独占一行
+        script = f"( {command}\n) </dev/null; __rc=$?; echo; echo {marker} $__rc\n"
+        self._proc.stdin.write(script.encode("utf-8"))
+        self._proc.stdin.flush()
+
+    def _collect(self, marker, timeout):
+        out = []
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AdbError(f"shell session timeout after {timeout}s")
+            try:
+                line = self._lines.get(timeout=remaining)
+            except queue.Empty:
+                raise AdbError(f"shell session timeout after {timeout}s")
+            if line is None:
+                raise AdbError("shell session closed")
+            if line.startswith(marker):
+                code = line[len(marker):].strip()
+                # 去掉 _send 中补的换行
+                text = "".join(out)
+                if text.endswith("\n"):
+                    text = text[:-1]
+                return (int(code) if code.lstrip("-").isdigit() else -1), text
+            out.append(line)
+
+    def run(self, command, timeout=None):
+        # 返回 (returncode, stdout)；失败抛 AdbError
+        timeout = timeout or self.timeout
+        _count_round_trip()
+        with self._lock:
+            for attempt in range(2):
+                if not self._alive():
+                    self.close()
+                    self._start()
+                marker = f"__PULLLOG_{os.urandom(16).hex()}__"
+                try:
+                    self._send(command, marker)
+                except (BrokenPipeError, OSError):
+                    # 会话已断开（设备重启/拔插），重连后再试一次
+                    self.close()
+                    if attempt == 0:
+                        continue
+                    raise AdbError("shell session broken")
+                try:
+                    return self._collect(marker, timeout)
+                except AdbError:
+                    # 超时或断开后会话状态不可知，直接丢弃
+                    self.close()
+                    raise
+            raise AdbError("shell session unavailable")
+
+
+_shell_sessions = {}
+_shell_session_lock = threading.Lock()
+
+
+def get_shell_session(serial=None):
+    # 每台设备一个会话
+    with _shell_session_lock:
+        session = _shell_sessions.get(serial)
+        if session is None:
+            session = AdbShellSession(serial)
+            _shell_sessions[serial] = session
+            atexit.register(session.close)
+        return session
+
+
+def adb_command(command, serial=None):
+    try:
+        if USE_SHELL_SESSION and len(command) > 1 and command[0] == 'shell':
+            # adb 本身也是把 shell 参数以空格拼接后交给设备 shell
+            try:
+                started = time.perf_counter()
+                code, stdout = get_shell_session(serial).run(" ".join(command[1:]))
+                _notify_adb(command, serial, time.perf_counter() - started, code)
+                return stdout.strip()
+            except JobCancelled:
+                raise
+            except AdbError:
+                pass
+        _, stdout, _ = adb_run(command, serial)
         return stdout.strip()
+    except JobCancelled:
+        # 任务被取消要一路抛到任务边界，不能当成空输出（否则清单等会缓存空结果）
+        raise
     except Exception as e:
         # 失败保底返回空
         return ""
 
 
-def get_files_in_folder(folder_path):
-    files = adb_command(['shell', 'ls', folder_path]).splitlines()
+# serial: 设备序列号；state: device/offline/unauthorized 等；description: devices -l 其余字段
+DeviceInfo = namedtuple("DeviceInfo", ["serial", "state", "description"])
+
+
+def list_devices():
+    # adb devices -l，跳过表头与空行
+    devices = []
+    stdout = None
+    native = _native_adb()
+    if native is not None:
+        try:
+            stdout = native.list_devices_text()
+        except OSError as e:
+            _native_failed(None, e)
+    if stdout is None:
+        try:
+            _, stdout, _ = adb_run(['devices', '-l'])
+        except Exception:
+            traceback.print_exc()
+            return devices
+    for line in stdout.splitlines():
+        line = line.strip()
+        if not line or line.startswith("List of devices") or line.startswith("*"):
+            continue
+        parts = line.split(None, 2)
+        if len(parts) < 2:
+            continue
+        devices.append(DeviceInfo(parts[0], parts[1], parts[2] if len(parts) > 2 else ""))
+    return devices
+
+
+def serial_dir_name(serial):
+    # adb over TCP 的序列号形如 192.168.1.5:5555，Windows 目录名不能含冒号
+    return re.sub(r'[\\/:*?"<>|]', "_", serial)
+
+
+def get_files_in_folder(folder_path, serial=None):
+    files = adb_command(['shell', 'ls', folder_path], serial).splitlines()
     return files
 
 
-def find_files_recursive(folder_path, file_extension):
+_LS_LONG_RE = re.compile(r"^(\S+)\s+.*?\s(\d+)\s+(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2}(?::\d{2})?)\s+(.+)$")
+
+
+def get_file_sizes(folder_path, serial=None):
+    # 一次 ls -l 拿到目录下所有文件大小，{name: size}；目录与解析失败的行跳过
+    sizes = {}
+    listing = adb_command(['shell', 'ls', '-l', folder_path], serial)
+    for line in listing.splitlines():
+        m = _LS_LONG_RE.match(line.strip())
+        if not m or m.group(1).startswith("d"):
+            continue
+        sizes[m.group(5)] = int(m.group(2))
+    return sizes
+
+
+# path: 相对日志根目录的路径；size: 字节；mtime: 秒级时间戳；is_dir: 是否目录
+RemoteEntry = namedtuple("RemoteEntry", ["path", "size", "mtime", "is_dir"])
+
+
+def _parse_stat_line(line):
+    # stat -c '%F|%s|%Y|%n' 的一行，路径形如 ./kernel/kmsg.txt
+    parts = line.split("|", 3)
+    if len(parts) != 4 or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    path = parts[3]
+    if path.startswith("./"):
+        path = path[2:]
+    if not path or path == ".":
+        return None
+    return RemoteEntry(path, int(parts[1]), int(parts[2]), parts[0] == "directory")
+
+
+class RemoteCatalog:
+    # 设备日志目录的元数据快照：一次 find + stat 取回整棵树的 名称/大小/mtime/类型，
+    # 在 ttl 内复用；kill 或删除 pdlog 后调用 invalidate()
+
+    def __init__(self, root=REMOTE_LOG_DIR, serial=None, ttl=CATALOG_TTL):
+        self.root = root
+        self.serial = serial
+        self.ttl = ttl
+        self._entries = None
+        self._fetched_at = 0.0
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        cmd = (f"cd {shlex.quote(self.root)} && "
+               f"find . -exec stat -c '%F|%s|%Y|%n' {{}} + 2>/dev/null")
+        entries = []
+        for line in adb_command(['shell', cmd], self.serial).splitlines():
+            entry = _parse_stat_line(line.strip())
+            if entry is not None:
+                entries.append(entry)
+        if entries:
+            return entries
+        # 设备 find/stat 不可用时退回到顶层 ls -l
+        for name, size in get_file_sizes(self.root, self.serial).items():
+            entries.append(RemoteEntry(name, size, 0, False))
+        return entries
+
+    def entries(self):
+        with self._lock:
+            if self._entries is None or time.monotonic() - self._fetched_at > self.ttl:
+                entries = self._fetch()
+                # 空清单多半是设备离线/刚重连或命令失败，不缓存，下次重新取
+                if not entries:
+                    return entries
+                self._entries = entries
+                self._fetched_at = time.monotonic()
+            return self._entries
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+            self._index = None
+
+    def log_index(self, services=()):
+        # 与当前清单快照绑定的 LogIndex，清单刷新后重建
+        entries = self.entries()
+        services = tuple(services)
+        with self._lock:
+            if self._index is None or self._index[0] is not entries or self._index[1] != services:
+                names = sorted(e.path for e in entries if "/" not in e.path)
+                self._index = (entries, services, LogIndex(names, services))
+            return self._index[2]
+
+    def top_level(self):
+        return [e for e in self.entries() if "/" not in e.path]
+
+    def file_names(self):
+        # 等价于原来的 ls 根目录：顶层文件与目录名
+        return sorted(e.path for e in self.top_level())
+
+    def sizes(self):
+        return {e.path: e.size for e in self.top_level() if not e.is_dir}
+
+    def lookup(self, path):
+        for entry in self.entries():
+            if entry.path == path:
+                return entry
+        return None
+
+
+def parse_rotation_id(name):
+    # 轮转编号在文件名按 "." 切分后的第 4 段；无编号返回 None
+    parts = name.split(".")
+    if len(parts) > 3 and parts[3].isdigit():
+        return int(parts[3])
+    return None
+
+
+class LogIndex:
+    # 文件名只解析一次：按服务名（已知服务中最长的前缀，避免一个服务名是另一个前缀时串台）分桶，
+    # 每个服务一个按轮转编号升序的数组，top-N / 阈值查询用二分。
+    # 选择语义与原 _select_logs 一致：
+    #   单选：取编号 > max_id - count 的文件，按列表原顺序；
+    #   多选：每个服务按编号降序取前 count 个（同编号保持列表原顺序），多服务结果按服务顺序去重合并。
+
+    def __init__(self, filenames, services=()):
+        self._names = list(filenames)
+        self._services = sorted(set(services), key=len, reverse=True)
+        self._buckets = {svc: [] for svc in self._services}
+        for seq, name in enumerate(self._names):
+            svc = self._match_service(name)
+            if svc is not None:
+                self._add(svc, seq, name)
+        self._finish()
+
+    def _match_service(self, name):
+        for svc in self._services:
+            if name.startswith(svc):
+                return svc
+        return None
+
+    def _add(self, svc, seq, name):
+        rid = parse_rotation_id(name)
+        if rid is not None:
+            self._buckets.setdefault(svc, []).append((rid, -seq, name))
+
+    def _finish(self):
+        self._ids = {}
+        for svc, entries in self._buckets.items():
+            entries.sort()
+            self._ids[svc] = [rid for rid, _, _ in entries]
+
+    def _bucket(self, svc):
+        if svc not in self._buckets:
+            # 非已知服务：按前缀扫描一次并缓存
+            entries = []
+            for seq, name in enumerate(self._names):
+                rid = parse_rotation_id(name) if name.startswith(svc) else None
+                if rid is not None:
+                    entries.append((rid, -seq, name))
+            entries.sort()
+            self._buckets[svc] = entries
+            self._ids[svc] = [rid for rid, _, _ in entries]
+        return self._buckets.get(svc, []), self._ids.get(svc, [])
+
+    def services(self):
+        return [svc for svc, entries in self._buckets.items() if entries]
+
+    def entries(self, svc):
+        # [(rotation_id, name), ...]，编号升序
+        entries, _ = self._bucket(svc)
+        return [(rid, name) for rid, _, name in entries]
+
+    def max_id(self, svc):
+        _, ids = self._bucket(svc)
+        return ids[-1] if ids else None
+
+    def top_n(self, svc, count):
+        entries, _ = self._bucket(svc)
+        count = max(0, count)
+        if count == 0:
+            return []
+        return [name for _, _, name in reversed(entries[-count:])]
+
+    def above_threshold(self, svc, count):
+        entries, ids = self._bucket(svc)
+        if not ids:
+            return []
+        start = bisect.bisect_right(ids, ids[-1] - count)
+        chosen = entries[start:]
+        # 按列表原顺序输出
+        return [name for _, _, name in sorted(chosen, key=lambda e: -e[1])]
+
+    def select(self, service_names, count):
+        if not service_names:
+            return []
+        union_set = []
+        seen = set()
+        multiple = len(service_names) > 1
+        for svc in service_names:
+            chosen = self.top_n(svc, count) if multiple else self.above_threshold(svc, count)
+            for item in chosen:
+                if item not in seen:
+                    seen.add(item)
+                    union_set.append(item)
+        return union_set
+
+
+# 2024-05-01 10:00:00.123 / 2024/05/01 10:00:00,123 / 2024-05-01T10:00:00
+_TS_FULL_RE = re.compile(r"(\d{4})[-/](\d{2})[-/](\d{2})[ T](\d{2}):(\d{2}):(\d{2})(?:[.,:](\d{1,6}))?")
+# logcat threadtime：05-01 10:00:00.123（无年份）
+_TS_SHORT_RE = re.compile(r"(?<!\d)(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?")
+# 只在行首附近找时间戳，避免匹配到正文里的日期
+TIMESTAMP_SCAN_CHARS = 64
+
+
+def parse_log_timestamp(line, default_year=None):
+    # 解析日志行首时间戳为本地时间的 epoch 秒；无法解析返回 None
+    head = line[:TIMESTAMP_SCAN_CHARS]
+    m = _TS_FULL_RE.search(head)
+    if m:
+        year, month, day, hour, minute, second, frac = m.groups()
+    else:
+        m = _TS_SHORT_RE.search(head)
+        if not m:
+            return None
+        month, day, hour, minute, second, frac = m.groups()
+        year = default_year or datetime.now().year
+    try:
+        ts = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second)).timestamp()
+    except (ValueError, OverflowError, OSError):
+        return None
+    if frac:
+        ts += int(frac) / (10 ** len(frac))
+    return ts
+
+
+def read_first_lines(remote_dir, names, serial=None):
+    # 一次设备端循环对所有文件执行 head -n1，返回 {name: 首行}
+    result = {}
+    for batch in _arg_batches(names):
+        args = " ".join(shlex.quote(n) for n in batch)
+        cmd = (f"cd {shlex.quote(remote_dir)} && for f in {args}; do "
+               f"echo \"__HEAD__|$f\"; head -n 1 \"$f\" 2>/dev/null; echo; done")
+        current = None
+        for line in adb_command(['shell', cmd], serial).splitlines():
+            if line.startswith("__HEAD__|"):
+                current = line[len("__HEAD__|"):]
+                result[current] = ""
+            elif current is not None and not result[current]:
+                result[current] = line
+    return result
+
+
+def _running_max(values):
+    # 时间可能因设备校时回跳，做成单调序列以便二分
+    out = []
+    top = float("-inf")
+    for v in values:
+        top = max(top, v)
+        out.append(top)
+    return out
+
+
+def select_by_time_window(catalog, service_names, start, end, services=()):
+    # 按时间段选取：每个轮转文件覆盖 [首行时间, mtime]，编号越大越新；
+    # 先用清单里的 mtime 二分出 mtime >= start 的候选，再对候选批量读首行，二分出首行时间 <= end 的部分
+    index = catalog.log_index(services)
+    mtimes = {e.path: e.mtime for e in catalog.top_level() if not e.is_dir}
+    candidates = {}
+    for svc in service_names:
+        entries = index.entries(svc)
+        ends = _running_max([mtimes.get(name, 0) for _, name in entries])
+        lo = bisect.bisect_left(ends, start)
+        # 首个候选的覆盖起点取前一份的 mtime 作为兜底
+        candidates[svc] = (mtimes.get(entries[lo - 1][1]) if lo > 0 else None, entries[lo:])
+    names = [name for _, chosen in candidates.values() for _, name in chosen]
+    heads = read_first_lines(catalog.root, names, catalog.serial) if names else {}
+    selected = []
+    seen = set()
+    for svc in service_names:
+        prev_end, chosen = candidates[svc]
+        starts = []
+        for _, name in chosen:
+            mtime = mtimes.get(name, 0)
+            year = datetime.fromtimestamp(mtime).year if mtime else None
+            ts = parse_log_timestamp(heads.get(name, ""), year)
+            if ts is None:
+                ts = prev_end if prev_end is not None else float("-inf")
+            starts.append(ts)
+            prev_end = mtime
+        hi = bisect.bisect_right(_running_max(starts), end)
+        for _, name in chosen[:hi]:
+            if name not in seen:
+                seen.add(name)
+                selected.append(name)
+    return selected
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(serial=None, root=REMOTE_LOG_DIR):
+    # 每台设备、每个根目录共享一个清单
+    with _catalogs_lock:
+        catalog = _catalogs.get((serial, root))
+        if catalog is None:
+            catalog = RemoteCatalog(root, serial)
+            _catalogs[(serial, root)] = catalog
+        return catalog
+
+
+def invalidate_catalog(serial=None):
+    with _catalogs_lock:
+        catalogs = [c for (s, _), c in _catalogs.items() if s == serial]
+    for catalog in catalogs:
+        catalog.invalidate()
+
+
+def format_size(size):
+    if size is None:
+        return "?"
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} GB"
+
+
+# remote_path: 设备路径；local_dir: 本地目标目录；size: 字节数，目录/未知为 None；serial: 设备
+PullJob = namedtuple("PullJob", ["remote_path", "local_dir", "size", "serial"], defaults=[None])
+
+_host_transfer_slots = threading.BoundedSemaphore(HOST_TRANSFER_LIMIT)
+
+
+def set_host_transfer_limit(limit):
+    # 仅在没有传输进行时调用
+    global _host_transfer_slots
+    _host_transfer_slots = threading.BoundedSemaphore(max(1, int(limit)))
+
+
+def _watch_local_growth(path, stats, stop):
+    # adb pull 非终端下不输出百分比，改为轮询本地文件大小推进进度；返回已推进的字节数
+    reported = 0
+    while not stop.wait(PULL_PROGRESS_INTERVAL):
+        try:
+            size = _local_size(path) if os.path.exists(path) else 0
+        except OSError:
+            continue
+        if size > reported:
+            stats.advance(size - reported)
+            reported = size
+    return reported
+
+
+def _pull_file_native(native, remote_path, local_path, serial, stats):
+    # sync RECV 直接写盘，进度按收到的数据推进，不需要轮询本地文件。
+    # 失败时撤回本次已推进的字节，退回子进程重拉或报错时不会重复计入
+    advanced = [0]
+
+    def on_bytes(nbytes):
+        advanced[0] += nbytes
+        stats.advance(nbytes)
+    with _host_transfer_slots:
+        raise_if_cancelled(serial)
+        started = time.perf_counter()
+        try:
+            files, size = native.pull(remote_path, local_path, serial, on_bytes=on_bytes if stats is not None else None,
+                                      on_connection=lambda conn: _track_process(conn, serial))
+        except BaseException:
+            if advanced[0]:
+                stats.advance(-advanced[0])
+            raise
+        seconds = time.perf_counter() - started
+    _notify_adb(['pull', remote_path], serial, seconds, 0)
+    if stats is not None:
+        stats.add(size, size, seconds, remote_path, TRANSFER_PER_FILE)
+    return f"{remote_path}: {files} file{'s' if files != 1 else ''} pulled."
+
+
+def pull_file(remote_path, local_dir, serial=None, stats=None):
+    local_path = os.path.join(local_dir, _split_remote(remote_path)[1])
+    native = _native_adb()
+    if native is not None:
+        raise_if_cancelled(serial)
+        _count_round_trip()
+        os.makedirs(local_dir, exist_ok=True)
+        try:
+            return _pull_file_native(native, remote_path, local_path, serial, stats)
+        except OSError as e:
+            _native_failed(serial, e)
+    with _host_transfer_slots:
+        started = time.perf_counter()
+        if stats is None:
+            code, stdout, stderr = adb_run(['pull', remote_path, local_dir], serial)
+        else:
+            stop = threading.Event()
+            watched = []
+            watcher = threading.Thread(target=lambda: watched.append(_watch_local_growth(local_path, stats, stop)),
+                                       daemon=True)
+            watcher.start()
+            try:
+                code, stdout, stderr = adb_run(['pull', remote_path, local_dir], serial)
+            finally:
+                stop.set()
+                watcher.join()
+        seconds = time.perf_counter() - started
+    if code != 0:
+        raise AdbError((stderr or stdout).strip() or f"adb pull exited with {code}")
+    if stats is not None:
+        # adb pull 不压缩，线路字节数按落盘大小计
+        size = _local_size(local_path)
+        stats.advance(size - (watched[0] if watched else 0))
+        stats.add(size, size, seconds, remote_path, TRANSFER_PER_FILE)
+    return stdout.strip()
+
+
+class TransferStats:
+    # 统计线路上的字节数（压缩后）与落盘字节数，多线程累加。
+    # live_bytes 在传输过程中实时推进（落盘字节），配合 expected_bytes 给出进度与 ETA；
+    # on_bytes(live_bytes, expected_bytes) 在每次推进后回调，metrics 为 MetricsLog 时逐项记录传输。
+    def __init__(self, on_bytes=None, metrics=None):
+        self._lock = threading.Lock()
+        self.wire_bytes = 0
+        self.disk_bytes = 0
+        self.items = 0
+        self.live_bytes = 0
+        self.expected_bytes = 0
+        self.started = time.perf_counter()
+        self.on_bytes = on_bytes
+        self.metrics = metrics
+
+    def advance(self, nbytes):
+        # nbytes 可为负：流式传输失败回退时撤回已推进的进度
+        if not nbytes:
+            return
+        with self._lock:
+            self.live_bytes += nbytes
+            done = self.live_bytes
+        if self.on_bytes is not None:
+            self.on_bytes(done, self.expected_bytes)
+
+    def add(self, wire_bytes, disk_bytes, seconds=None, path=None, mode=None):
+        with self._lock:
+            self.wire_bytes += wire_bytes
+            self.disk_bytes += disk_bytes
+            self.items += 1
+        if self.metrics is not None and path is not None:
+            self.metrics.write("transfer", path=path, mode=mode, wire_bytes=wire_bytes, disk_bytes=disk_bytes,
+                               seconds=_round(seconds), mbps=_mbps(wire_bytes, seconds))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        elapsed = self.elapsed()
+        return {"items": self.items, "wire_bytes": self.wire_bytes, "disk_bytes": self.disk_bytes,
+                "seconds": _round(elapsed), "mbps": _mbps(self.wire_bytes, elapsed)}
+
+    def summary(self):
+        ratio = (self.disk_bytes / self.wire_bytes) if self.wire_bytes else 0.0
+        elapsed = self.elapsed()
+        return (f"Transferred {self.items} items: wire {format_size(self.wire_bytes)}, "
+                f"disk {format_size(self.disk_bytes)}, ratio {ratio:.1f}x, "
+                f"{elapsed:.1f}s, {_mbps(self.wire_bytes, elapsed) or 0:.2f} MB/s")
+
+
+def _round(seconds):
+    return None if seconds is None else round(seconds, 4)
+
+
+def _mbps(nbytes, seconds):
+    if not seconds:
+        return None
+    return round(nbytes / (1024.0 * 1024.0) / seconds, 3)
+
+
+class MetricsLog:
+    # 会话级 JSONL 指标：adb 调用、各阶段耗时、逐项传输，一行一条记录，便于跨次/跨主机对比。
+    # 只记录 serial 对应设备的 adb 调用（serial 为 None 即默认设备）。
+
+    def __init__(self, path, serial=None):
+        self.path = path
+        self.serial = serial
+        self._lock = threading.Lock()
+        self._file = None
+        self._observer = None
+
+    def write(self, record_type, **fields):
+        record = {"ts": round(time.time(), 3), "type": record_type, "serial": self.serial}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.write("stage", name=name, seconds=_round(time.perf_counter() - started), **fields)
+
+    def watch_adb(self):
+        def observer(command, serial, seconds, returncode):
+            if serial == self.serial:
+                self.write("adb", command=" ".join(command)[:200], seconds=_round(seconds), returncode=returncode)
+
+        self._observer = observer
+        add_adb_observer(observer)
+
+    def close(self):
+        if self._observer is not None:
+            remove_adb_observer(self._observer)
+            self._observer = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ConsoleBuffer:
+    # 线程安全的日志环形缓冲：任意线程 append，界面定时 drain 后批量刷新；
+    # 待显示行超出 capacity 时丢弃最旧的（drain 返回丢弃数），完整记录由后台线程写入 transcript
+    def __init__(self, capacity=CONSOLE_BUFFER_LINES, transcript_path=None):
+        self.transcript_path = transcript_path
+        self._lines = deque(maxlen=capacity)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._transcript = None
+        self._thread = None
+        if transcript_path:
+            self._transcript = queue.Queue()
+            self._thread = threading.Thread(target=self._write_transcript, daemon=True)
+            self._thread.start()
+
+    def append(self, line):
+        line = str(line)
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self._dropped += 1
+            self._lines.append(line)
+        transcript = self._transcript
+        if transcript is not None:
+            transcript.put((time.time(), line))
+
+    def drain(self):
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+            dropped, self._dropped = self._dropped, 0
+        return lines, dropped
+
+    def clear(self):
+        self.drain()
+
+    def _write_transcript(self):
+        transcript = self._transcript
+        try:
+            os.makedirs(os.path.dirname(self.transcript_path) or ".", exist_ok=True)
+            with open(self.transcript_path, "a", encoding="utf-8") as f:
+                while True:
+                    item = transcript.get()
+                    # 一次写完已积压的行再 flush，减少系统调用
+                    while item is not None:
+                        stamp, line = item
+                        f.write(f"{datetime.fromtimestamp(stamp):%H:%M:%S.%f}"[:-3] + f" {line}\n")
+                        try:
+                            item = transcript.get_nowait()
+                        except queue.Empty:
+                            break
+                    f.flush()
+                    if item is None:
+                        return
+        except Exception:
+            # 写不了记录不影响界面显示；停止入队，避免队列无限增长
+            traceback.print_exc()
+            self._transcript = None
+
+    def close(self):
+        transcript = self._transcript
+        if transcript is not None:
+            transcript.put(None)
+            self._thread.join(timeout=5)
+        self._transcript = None
+
+
+class _CountingReader:
+    # 包一层 stdout，记录实际从 adb 读到的字节数
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.count += len(data)
+        return data
+
+
+def _local_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _job_order_key(job):
+    # 大文件优先；目录（kernel/anr 等）大小未知，视为最大，最先开始
+    return -(job.size if job.size is not None else float("inf"))
+
+
+def pull_jobs_concurrently(jobs, workers=DEFAULT_PULL_WORKERS, on_progress=None, stats=None):
+    # 有界并发拉取；单个文件失败不影响其余文件，返回 [(remote_path, error), ...]
+    def emit(message):
+        if on_progress is not None:
+            on_progress(message)
+
+    ordered = sorted(jobs, key=_job_order_key)
+    total = len(ordered)
+    errors = []
+    if not ordered:
+        return errors
+    workers = max(1, min(int(workers), MAX_PULL_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(pull_file, job.remote_path, job.local_dir, job.serial, stats): job for job in ordered}
+        for finished, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                future.result()
+                emit(f"[{finished}/{total}] OK {job.remote_path} ({format_size(job.size)})")
+            except AdbError as e:
+                errors.append((job.remote_path, str(e)))
+                emit(f"[{finished}/{total}] FAIL {job.remote_path}: {e}")
+            except Exception as e:
+                traceback.print_exc()
+                errors.append((job.remote_path, str(e)))
+                emit(f"[{finished}/{total}] FAIL {job.remote_path}: {e}")
+    return errors
+
+
+def device_has_command(name, serial=None):
+    return adb_command(['shell', f'command -v {shlex.quote(name)} >/dev/null 2>&1 && echo yes'], serial) == "yes"
+
+
+def _safe_member_path(local_dir, member_name):
+    # 防止 tar 成员中的绝对路径或 .. 写出目标目录
+    target = os.path.normpath(os.path.join(local_dir, member_name))
+    root = os.path.normpath(local_dir)
+    if target != root and not target.startswith(root + os.sep):
+        return None
+    return target
+
+
+def _arg_batches(names):
+    batch = []
+    length = 0
+    for name in names:
+        quoted = shlex.quote(name)
+        if batch and length + len(quoted) + 1 > TAR_MAX_ARGS_CHARS:
+            yield batch
+            batch = []
+            length = 0
+        batch.append(name)
+        length += len(quoted) + 1
+    if batch:
+        yield batch
+
+
+def pull_tar_stream(remote_dir, names, local_dir, on_progress=None, serial=None, compress=False, stats=None):
+    # 单个 adb exec-out tar 流拉取 remote_dir 下的多个条目并直接解包到 local_dir，不落临时归档
+    # compress=True 时设备端 tar czf，主机端按 gzip 流解包；返回成功解出的顶层条目名集合
+    # tarfile/hashlib 按需导入，命令行模式启动时不付这部分开销
+    import tarfile
+    args = " ".join(shlex.quote(n) for n in names)
+    flags = "czf" if compress else "cf"
+    cmd = f"tar {flags} - -C {shlex.quote(remote_dir)} {args} 2>/dev/null"
+    extracted = set()
+    disk_bytes = 0
+    with _host_transfer_slots:
+        started = time.perf_counter()
+        proc = adb_popen(['exec-out', cmd], serial)
+        reader = _CountingReader(proc.stdout)
+        try:
+            with tarfile.open(fileobj=reader, mode="r|gz" if compress else "r|") as tar:
+                for member in tar:
+                    if not (member.isfile() or member.isdir()):
+                        continue
+                    # 成员名形如 ./CoreService.log；只去掉 ./ 前缀，保留 .hidden 之类以点开头的名字
+                    name = posixpath.normpath(member.name)
+                    if posixpath.isabs(name) or name == ".." or name.startswith("../"):
+                        continue
+                    if _safe_member_path(local_dir, name) is None:
+                        continue
+                    tar.extract(member, local_dir)
+                    top = name.split("/", 1)[0]
+                    if top == ".":
+                        continue
+                    extracted.add(top)
+                    if member.isfile():
+                        disk_bytes += member.size
+                        if stats is not None:
+                            stats.advance(member.size)
+                    if member.isfile() and on_progress is not None:
+                        on_progress(f"[tar] {posixpath.join(remote_dir, member.name)} ({format_size(member.size)})")
+        except tarfile.ReadError:
+            # 空流：条目全部不存在或无权限，交给调用方回退
+            if extracted:
+                raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        seconds = time.perf_counter() - started
+    if stats is not None and extracted:
+        stats.add(reader.count, disk_bytes, seconds, remote_dir, "tar.gz" if compress else TRANSFER_TAR)
+    return extracted
+
+
+def pull_gzip_stream(remote_path, local_dir, serial=None, stats=None):
+    # adb exec-out gzip -c 单个文件，主机端 zlib 流式解压写盘；流不完整时抛 AdbError
+    name = _split_remote(remote_path)[1]
+    local_file = os.path.join(local_dir, name)
+    part_file = local_file + ".part"
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    wire_bytes = 0
+    disk_bytes = 0
+    with _host_transfer_slots:
+        started = time.perf_counter()
+        proc = adb_popen(['exec-out', f"gzip -c {shlex.quote(remote_path)} 2>/dev/null"], serial)
+        completed = False
+        try:
+            with open(part_file, "wb") as out:
+                while True:
+                    chunk = proc.stdout.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    wire_bytes += len(chunk)
+                    data = decompressor.decompress(chunk)
+                    disk_bytes += len(data)
+                    out.write(data)
+                    if stats is not None:
+                        stats.advance(len(data))
+                data = decompressor.flush()
+                disk_bytes += len(data)
+                out.write(data)
+            completed = True
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            # 中途出错（写盘失败、数据损坏、取消）时不留下 .part
+            if not completed:
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+                if stats is not None:
+                    stats.advance(-disk_bytes)
+        seconds = time.perf_counter() - started
+    if not decompressor.eof:
+        os.remove(part_file)
+        if stats is not None:
+            # 回退到 adb pull 会重新推进进度，这里先扣回
+            stats.advance(-disk_bytes)
+        raise AdbError(f"gzip stream incomplete for {remote_path}")
+    os.replace(part_file, local_file)
+    if stats is not None:
+        stats.add(wire_bytes, disk_bytes, seconds, remote_path, TRANSFER_GZIP)
+    return wire_bytes, disk_bytes
+
+
+def _split_remote(remote_path):
+    remote = remote_path.rstrip("/")
+    return posixpath.dirname(remote) or "/", posixpath.basename(remote)
+
+
+def _pull_jobs_tar(jobs, workers, on_progress, compress=False, stats=None):
+    # 按 (设备, 父目录) 分组，每组（按参数长度分批）一个 tar 流；返回未能通过 tar 取回的 job，交给逐个 pull 兜底
+    groups = {}
+    by_name = {}
+    for job in jobs:
+        remote_dir, name = _split_remote(job.remote_path)
+        groups.setdefault((job.serial, remote_dir, job.local_dir), []).append(name)
+        by_name[(job.serial, remote_dir, job.local_dir, name)] = job
+    tasks = []
+    for key, names in groups.items():
+        for batch in _arg_batches(names):
+            tasks.append((key, batch))
+    leftovers = []
+    workers = max(1, min(int(workers), MAX_PULL_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(pull_tar_stream, remote_dir, batch, local_dir, on_progress, serial, compress, stats):
+                ((serial, remote_dir, local_dir), batch)
+            for (serial, remote_dir, local_dir), batch in tasks
+        }
+        for future in as_completed(futures):
+            key, batch = futures[future]
+            try:
+                extracted = future.result()
+            except Exception as e:
+                traceback.print_exc()
+                if on_progress is not None:
+                    on_progress(f"[tar] stream failed for {key[1]}: {e}")
+                extracted = set()
+            for name in batch:
+                if name not in extracted:
+                    leftovers.append(by_name[key + (name,)])
+    return leftovers
+
+
+def _pull_jobs_gzip(jobs, workers, on_progress, stats=None):
+    # 大文件走 gzip -c 流，目录走 tar czf 流；小文件与失败项返回给调用方用 adb pull 兜底
+    def emit(message):
+        if on_progress is not None:
+            on_progress(message)
+
+    serials = {job.serial for job in jobs}
+    with_gzip = {serial for serial in serials if device_has_command("gzip", serial)}
+    with_tar = {serial for serial in with_gzip if device_has_command("tar", serial)}
+    if len(with_gzip) < len(serials):
+        emit("Device has no gzip, fallback to adb pull")
+    folders = [job for job in jobs if job.size is None and job.serial in with_tar]
+    big_files = [job for job in jobs if job.size is not None and job.size >= GZIP_MIN_SIZE and job.serial in with_gzip]
+    handled = set(folders) | set(big_files)
+    leftovers = [job for job in jobs if job not in handled]
+    if folders:
+        leftovers.extend(_pull_jobs_tar(folders, workers, on_progress, compress=True, stats=stats))
+    if not big_files:
+        return leftovers
+    emit(f"Gzip stream: {len(big_files)} files >= {format_size(GZIP_MIN_SIZE)}")
+    workers = max(1, min(int(workers), MAX_PULL_WORKERS))
+    total = len(big_files)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(pull_gzip_stream, job.remote_path, job.local_dir, job.serial, stats): job
+                   for job in sorted(big_files, key=_job_order_key)}
+        for finished, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                wire_bytes, disk_bytes = future.result()
+                emit(f"[gzip {finished}/{total}] OK {job.remote_path} "
+                     f"({format_size(wire_bytes)} on wire, {format_size(disk_bytes)} on disk)")
+            except Exception as e:
+                if not isinstance(e, AdbError):
+                    traceback.print_exc()
+                emit(f"[gzip {finished}/{total}] {job.remote_path}: {e}, fallback to adb pull")
+                leftovers.append(job)
+    return leftovers
+
+
+def remote_stat(remote_path, serial=None):
+    # 返回设备端 (size, mtime)；不存在抛 AdbError
+    out = adb_command(['shell', f"stat -c '%s %Y' {shlex.quote(remote_path)} 2>/dev/null"], serial)
+    parts = out.split()
+    if len(parts) != 2 or not all(p.isdigit() for p in parts):
+        raise AdbError(f"stat failed: {remote_path}")
+    return int(parts[0]), int(parts[1])
+
+
+def _load_resume(record_path, part_path, remote_path, size):
+    # 续传记录与本次目标一致（同一远端文件、块大小相同、远端未变小）时返回可续传的字节数，否则 0
+    try:
+        with open(record_path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if record.get("remote") != remote_path or record.get("block") != CHUNKED_BLOCK_SIZE:
+        return 0
+    if size < record.get("size", 0):
+        # 远端被截断或轮转重写，已有数据作废
+        return 0
+    part_size = _local_size(part_path)
+    # 日志只追加，已有前缀仍然有效；续传点回退到块边界以便 dd skip
+    return min(part_size, size) // CHUNKED_BLOCK_SIZE * CHUNKED_BLOCK_SIZE
+
+
+def _chunk_command(remote_path, offset, length, use_dd):
+    quoted = shlex.quote(remote_path)
+    if use_dd:
+        blocks = (length + CHUNKED_BLOCK_SIZE - 1) // CHUNKED_BLOCK_SIZE
+        return f"dd if={quoted} bs={CHUNKED_BLOCK_SIZE} skip={offset // CHUNKED_BLOCK_SIZE} count={blocks} 2>/dev/null"
+    return f"tail -c +{offset + 1} {quoted} 2>/dev/null | head -c {length}"
+
+
+def _receive_range(remote_path, part_path, offset, size, use_dd, serial, stats):
+    # 一次 exec-out 读取 [offset, size) 并追加到 .part；返回本次写入的字节数（断线时可能不足）
+    received = 0
+    proc = adb_popen(['exec-out', _chunk_command(remote_path, offset, size - offset, use_dd)], serial)
+    try:
+        with open(part_path, "r+b" if os.path.exists(part_path) else "wb") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            while offset + received < size:
+                data = proc.stdout.read1(STREAM_CHUNK_SIZE)
+                if not data:
+                    break
+                # 远端文件在拉取期间继续增长时，只取 stat 时的大小
+                data = data[:size - offset - received]
+                f.write(data)
+                received += len(data)
+                if stats is not None:
+                    stats.advance(len(data))
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+    return received
+
+
+def _remote_md5(remote_path, size, serial=None):
+    out = adb_command(['shell', f"head -c {size} {shlex.quote(remote_path)} | md5sum"], serial)
+    digest = out.split()[0] if out.split() else ""
+    return digest if re.fullmatch(r"[0-9a-f]{32}", digest) else None
+
+
+def _partial_paths(remote_path, local_dir, serial, partial_dir):
+    # 返回 (.part 路径, 续传记录路径)；partial_dir 下按设备和远端路径区分
+    if partial_dir is None:
+        base = os.path.join(local_dir, _split_remote(remote_path)[1])
+    else:
+        device_dir = os.path.join(partial_dir, serial_dir_name(serial) if serial else "default")
+        os.makedirs(device_dir, exist_ok=True)
+        base = os.path.join(device_dir, remote_path.strip("/").replace("/", "__"))
+    return base + PART_SUFFIX, base + RESUME_SUFFIX
+
+
+def pull_chunked(remote_path, local_dir, serial=None, stats=None, on_progress=None, use_dd=True, partial_dir=None):
+    # 可续传的大文件拉取：数据追加到 .part，旁边的 .part.json 记录远端文件与块大小；
+    # 断线后按指数退避重试，从 .part 已有的块边界继续；有进展就重置重试计数。
+    # 传完比对大小（和 md5），一致后移动为正式文件；返回 (size, 本次实际传输字节数)
+    local_path = os.path.join(local_dir, _split_remote(remote_path)[1])
+    os.makedirs(local_dir, exist_ok=True)
+    part_path, record_path = _partial_paths(remote_path, local_dir, serial, partial_dir)
+    size, mtime = remote_stat(remote_path, serial)
+    offset = _load_resume(record_path, part_path, remote_path, size) if os.path.exists(part_path) else 0
+    with open(record_path, "w", encoding="utf-8") as f:
+        json.dump({"remote": remote_path, "serial": serial, "size": size, "mtime": mtime,
+                   "block": CHUNKED_BLOCK_SIZE}, f)
+    if offset and on_progress is not None:
+        on_progress(f"[chunked] resume {remote_path} at {format_size(offset)}/{format_size(size)}")
+    if stats is not None:
+        stats.advance(offset)
+    started = time.perf_counter()
+    transferred = 0
+    failures = 0
+    while offset < size:
+        try:
+            with _host_transfer_slots:
+                received = _receive_range(remote_path, part_path, offset, size, use_dd, serial, stats)
+        except JobCancelled:
+            raise
+        except (AdbError, OSError) as e:
+            received = 0
+            if on_progress is not None:
+                on_progress(f"[chunked] {remote_path}: {e}")
+        transferred += received
+        if offset + received >= size:
+            offset = size
+            break
+        # 断线：回退到块边界（dd 按块 skip），未满一块的尾部下次重传
+        aligned = (offset + received) // CHUNKED_BLOCK_SIZE * CHUNKED_BLOCK_SIZE
+        if stats is not None:
+            stats.advance(aligned - offset - received)
+        failures = 0 if aligned > offset else failures + 1
+        offset = aligned
+        if failures > CHUNKED_MAX_RETRIES:
+            raise AdbError(f"chunked transfer stalled at {format_size(offset)}/{format_size(size)}, "
+                           f"will resume on next pull")
+        # 被取消时进程已被杀掉，不再退避重试
+        raise_if_cancelled(serial)
+        # 退避期间不占主机传输名额
+        delay = min(CHUNKED_BACKOFF_BASE * (2 ** failures), CHUNKED_BACKOFF_MAX)
+        if on_progress is not None:
+            on_progress(f"[chunked] {remote_path} dropped at {format_size(offset)}/{format_size(size)}, "
+                        f"retry in {delay:.1f}s")
+        time.sleep(delay)
+    seconds = time.perf_counter() - started
+    if not os.path.exists(part_path):
+        # 空文件
+        open(part_path, "wb").close()
+    local_size = _local_size(part_path)
+    if local_size != size:
+        raise AdbError(f"size mismatch: local {local_size} != remote {size}")
+    if CHUNKED_VERIFY_MD5:
+        expected = _remote_md5(remote_path, size, serial)
+        if expected is not None and expected != _file_md5(part_path):
+            # 内容不一致说明续传前缀已失效，丢弃以便下次从头开始
+            os.remove(part_path)
+            os.remove(record_path)
+            raise AdbError(f"md5 mismatch for {remote_path}, partial data discarded")
+    shutil.move(part_path, local_path)
+    os.remove(record_path)
+    os.utime(local_path, (mtime, mtime))
+    if stats is not None:
+        stats.add(transferred, size, seconds, remote_path, TRANSFER_CHUNKED)
+    return size, transferred
+
+
+def _pull_jobs_chunked(jobs, workers, on_progress, stats=None, partial_dir=None):
+    # 已知大小且够大的文件走续传；目录、小文件与设备缺少 dd/tail 的返回给调用方用 adb pull。
+    # 续传失败不回退（.part 保留，下次拉取自动续传），作为错误返回
+    def emit(message):
+        if on_progress is not None:
+            on_progress(message)
+
+    serials = {job.serial for job in jobs}
+    use_dd = {serial: device_has_command("dd", serial) for serial in serials}
+    usable = {serial for serial in serials if use_dd[serial] or device_has_command("tail", serial)}
+    big_files = [job for job in jobs if job.size is not None and job.size >= CHUNKED_MIN_SIZE and job.serial in usable]
+    leftovers = [job for job in jobs if job not in set(big_files)]
+    errors = []
+    if not big_files:
+        return leftovers, errors
+    emit(f"Chunked transfer: {len(big_files)} files >= {format_size(CHUNKED_MIN_SIZE)}")
+    workers = max(1, min(int(workers), MAX_PULL_WORKERS))
+    total = len(big_files)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(pull_chunked, job.remote_path, job.local_dir, job.serial, stats, on_progress,
+                               use_dd[job.serial], partial_dir): job
+                   for job in sorted(big_files, key=_job_order_key)}
+        for finished, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                size, transferred = future.result()
+                emit(f"[chunked {finished}/{total}] OK {job.remote_path} ({format_size(size)}, "
+                     f"{format_size(transferred)} transferred)")
+            except Exception as e:
+                if not isinstance(e, AdbError):
+                    traceback.print_exc()
+                errors.append((job.remote_path, str(e)))
+                emit(f"[chunked {finished}/{total}] FAIL {job.remote_path}: {e}")
+    return leftovers, errors
+
+
+def pull_jobs(jobs, mode=TRANSFER_PER_FILE, workers=DEFAULT_PULL_WORKERS, on_progress=None, stats=None,
+              partial_dir=None):
+    # 按传输模式拉取；tar/gzip/chunked 模式下设备缺少命令或不适用的条目回退到逐个 adb pull
+    # partial_dir：chunked 模式的 .part 存放目录，缺省放在目标文件旁
+    def emit(message):
+        if on_progress is not None:
+            on_progress(message)
+
+    jobs = list(jobs)
+    if mode == TRANSFER_TAR and jobs:
+        serials = {job.serial for job in jobs}
+        with_tar = {serial for serial in serials if device_has_command("tar", serial)}
+        if len(with_tar) < len(serials):
+            emit("Device has no tar, fallback to adb pull")
+        tar_jobs = [job for job in jobs if job.serial in with_tar]
+        jobs = [job for job in jobs if job.serial not in with_tar]
+        if tar_jobs:
+            emit(f"Tar stream: {len(tar_jobs)} items")
+            missed = _pull_jobs_tar(tar_jobs, workers, on_progress, stats=stats)
+            if missed:
+                emit(f"Tar stream missed {len(missed)} items, fallback to adb pull")
+            jobs.extend(missed)
+    elif mode == TRANSFER_GZIP and jobs:
+        jobs = _pull_jobs_gzip(jobs, workers, on_progress, stats)
+    elif mode == TRANSFER_CHUNKED and jobs:
+        jobs, errors = _pull_jobs_chunked(jobs, workers, on_progress, stats, partial_dir)
+        return errors + pull_jobs_concurrently(jobs, workers, on_progress, stats)
+    return pull_jobs_concurrently(jobs, workers, on_progress, stats)
+
+
+# 过滤拉取的本地文件后缀：<原文件名>.filtered.log
+FILTERED_SUFFIX = ".filtered.log"
+
+
+def _grep_source(line, names, last):
+    # grep -H 输出 "name:行"（匹配）或 "name-行"（上下文），按已知文件名拆回来源；均为 bytes
+    if last is not None and line.startswith(last) and line[len(last):len(last) + 1] in (b":", b"-"):
+        return last
+    for name in names:
+        if line.startswith(name) and line[len(name):len(name) + 1] in (b":", b"-"):
+            return name
+    return None
+
+
+def pull_filtered(remote_dir, names, local_dir, patterns, context=0, ignore_case=False,
+                  serial=None, on_progress=None, stats=None):
+    # 设备端 grep 过滤后只传匹配行（及上下文），按来源文件边收边写到 <name>.filtered.log
+    # 返回 {name: 行数}，没有匹配的文件不生成本地文件
+    encoded = sorted((n.encode("utf-8") for n in names), key=len, reverse=True)
+    counts = {}
+    handles = {}
+    opts = ["-H", "-E"]
+    if ignore_case:
+        opts.append("-i")
+    if context > 0:
+        opts.append(f"-C {int(context)}")
+    opts.extend(f"-e {shlex.quote(p)}" for p in patterns)
+    try:
+        for batch in _arg_batches(names):
+            args = " ".join(shlex.quote(n) for n in batch)
+            cmd = f"cd {shlex.quote(remote_dir)} && grep {' '.join(opts)} -- {args} 2>/dev/null"
+            wire_bytes = 0
+            disk_bytes = 0
+            last = None
+            with _host_transfer_slots:
+                started = time.perf_counter()
+                proc = adb_popen(['exec-out', cmd], serial)
+                try:
+                    for raw in proc.stdout:
+                        wire_bytes += len(raw)
+                        if raw.rstrip(b"\r\n") == b"--":
+                            continue
+                        source = _grep_source(raw, encoded, last)
+                        if source is None:
+                            continue
+                        last = source
+                        name = source.decode("utf-8")
+                        out = handles.get(name)
+                        if out is None:
+                            out = open(os.path.join(local_dir, name + FILTERED_SUFFIX), "wb")
+                            handles[name] = out
+                        data = raw[len(source) + 1:]
+                        out.write(data)
+                        disk_bytes += len(data)
+                        counts[name] = counts.get(name, 0) + 1
+                finally:
+                    proc.stdout.close()
+                    proc.wait()
+                seconds = time.perf_counter() - started
+            if stats is not None:
+                stats.add(wire_bytes, disk_bytes, seconds, remote_dir, "grep")
+    finally:
+        for out in handles.values():
+            out.close()
+    if on_progress is not None:
+        for name in names:
+            if name in counts:
+                on_progress(f"[grep] {posixpath.join(remote_dir, name)}: {counts[name]} lines")
+    return counts
+
+
+def stat_remote_files(remote_dir, names, with_md5=False, serial=None):
+    # 一次设备端命令取得 size/mtime（可选 md5），返回 {name: (size, mtime, md5 或 None)}
+    result = {}
+    for batch in _arg_batches(names):
+        args = " ".join(shlex.quote(n) for n in batch)
+        cmd = f"cd {shlex.quote(remote_dir)} && stat -c '%s|%Y|%n' {args} 2>/dev/null"
+        if with_md5:
+            cmd += f"; echo __MD5__; md5sum {args} 2>/dev/null"
+        output = adb_command(['shell', cmd], serial)
+        md5s = {}
+        in_md5 = False
+        for line in output.splitlines():
+            if line == "__MD5__":
+                in_md5 = True
+                continue
+            if in_md5:
+                parts = line.split(None, 1)
+                if len(parts) == 2:
+                    md5s[parts[1].strip()] = parts[0].lower()
+                continue
+            parts = line.split("|", 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+                result[parts[2]] = (int(parts[0]), int(parts[1]), None)
+        for name, md5 in md5s.items():
+            if name in result:
+                size, mtime, _ = result[name]
+                result[name] = (size, mtime, md5)
+    return result
+
+
+def _file_md5(path):
+    import hashlib
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IncrementalStore:
+    # 内容寻址存储：<root>/.store/<md5 前两位>/<md5>，清单记录 设备路径 -> size/mtime/md5。
+    # 会话目录中的文件与 store 中的 blob 是硬链接，不要原地修改拉取下来的日志。
+
+    def __init__(self, root=LOG_OUTPUT_ROOT):
+        self.root = root
+        self.store_dir = os.path.join(root, STORE_DIR_NAME)
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._manifest = {}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except Exception:
+                traceback.print_exc()
+                self._manifest = {}
+
+    def _blob_path(self, md5):
+        return os.path.join(self.store_dir, md5[:2], md5)
+
+    def lookup(self, key, size, mtime, md5=None):
+        # 设备端文件未变化且 blob 仍在时返回 blob 路径
+        entry = self._manifest.get(key)
+        if not entry or entry.get("size") != size or entry.get("mtime") != mtime:
+            return None
+        if md5 is not None and entry.get("md5") != md5:
+            return None
+        blob = self._blob_path(entry["md5"])
+        return blob if os.path.exists(blob) else None
+
+    def add(self, key, local_file, size, mtime):
+        md5 = _file_md5(local_file)
+        blob = self._blob_path(md5)
+        with self._lock:
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                _link_or_copy(local_file, blob)
+            self._manifest[key] = {"size": size, "mtime": mtime, "md5": md5}
+        return md5
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+
+    def collect_garbage(self, grace_seconds=0):
+        # 以清单引用判断 blob 是否存活（硬链接数不可靠：复制入库或会话被压缩后同样是 1）：
+        # 不被任何清单条目引用的 blob 删除，blob 已不存在的条目同时移出清单。
+        # 新入库不足 grace_seconds 的 blob 保留，避免删掉并发拉取中尚未写进清单的文件。返回 (删除数, 字节数)
+        removed = freed = 0
+        now = time.time()
+        with self._lock:
+            live = {entry.get("md5") for entry in self._manifest.values()}
+            for dirpath, _, filenames in os.walk(self.store_dir):
+                for name in filenames:
+                    if name in live:
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                        if now - st.st_ctime < grace_seconds:
+                            continue
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    removed += 1
+                    freed += st.st_size
+            stale = [key for key, entry in self._manifest.items()
+                     if not entry.get("md5") or not os.path.exists(self._blob_path(entry["md5"]))]
+            for key in stale:
+                del self._manifest[key]
+        if stale:
+            self.save()
+        return removed, freed
+
+
+def _link_or_copy(src, dst):
+    # 优先硬链接；跨盘或文件系统不支持时退化为复制
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _manifest_key(job):
+    # 多设备时同一路径属于不同机器，清单键带上序列号
+    return f"{job.serial}:{job.remote_path}" if job.serial else job.remote_path
+
+
+def pull_jobs_incremental(jobs, store, mode=TRANSFER_PER_FILE, workers=DEFAULT_PULL_WORKERS,
+                          on_progress=None, with_md5=False, stats=None, partial_dir=None):
+    # 对单文件 job 做增量：设备端一次 stat（可选 md5sum）与清单比对，未变化的从 store 硬链接，
+    # 其余照常传输后入库；目录类 job（size 为 None）始终全量拉取
+    def emit(message):
+        if on_progress is not None:
+            on_progress(message)
+
+    file_jobs = [job for job in jobs if job.size is not None]
+    transfer = [job for job in jobs if job.size is None]
+    by_dir = {}
+    for job in file_jobs:
+        remote_dir, _ = _split_remote(job.remote_path)
+        by_dir.setdefault((job.serial, remote_dir), []).append(job)
+    remote_stats = {}
+    for (serial, remote_dir), dir_jobs in by_dir.items():
+        names = [_split_remote(j.remote_path)[1] for j in dir_jobs]
+        dir_stats = stat_remote_files(remote_dir, names, with_md5, serial)
+        for job, name in zip(dir_jobs, names):
+            remote_stats[job] = dir_stats.get(name)
+    linked = 0
+    for job in file_jobs:
+        stat = remote_stats.get(job)
+        blob = store.lookup(_manifest_key(job), *stat) if stat else None
+        if blob is None:
+            transfer.append(job)
+            continue
+        try:
+            _link_or_copy(blob, os.path.join(job.local_dir, _split_remote(job.remote_path)[1]))
+            linked += 1
+            if stats is not None:
+                stats.advance(stat[0])
+        except OSError as e:
+            emit(f"Link failed for {job.remote_path}: {e}")
+            transfer.append(job)
+    emit(f"Incremental: {linked} unchanged linked from store, {len(transfer)} to transfer")
+    errors = pull_jobs(transfer, mode, workers, on_progress, stats, partial_dir)
+    failed = {remote_path for remote_path, _ in errors}
+    for job in transfer:
+        stat = remote_stats.get(job)
+        if job.size is None or stat is None or job.remote_path in failed:
+            continue
+        local_file = os.path.join(job.local_dir, _split_remote(job.remote_path)[1])
+        if os.path.isfile(local_file):
+            try:
+                store.add(_manifest_key(job), local_file, stat[0], stat[1])
+            except OSError as e:
+                emit(f"Store failed for {job.remote_path}: {e}")
+    store.save()
+    return errors
+
+
+def iter_remote_files(folder_path, extensions=None, pattern=None, max_depth=None, serial=None):
+    # 一次设备端 find 遍历整棵树，边读边产出文件路径（生成器）
+    # extensions: 后缀列表；pattern: find -name 通配；max_depth: 相对 folder_path 的最大深度
+    args = [shlex.quote(folder_path)]
+    if max_depth is not None:
+        args.append(f"-maxdepth {int(max_depth)}")
+    args.append("-type f")
+    names = [f"*{ext}" for ext in (extensions or [])]
+    if names:
+        args.append("\\( " + " -o ".join(f"-name {shlex.quote(n)}" for n in names) + " \\)")
+    if pattern:
+        args.append(f"-name {shlex.quote(pattern)}")
+    proc = adb_popen(['shell', "find " + " ".join(args) + " 2>/dev/null"], serial)
+    try:
+        for raw in proc.stdout:
+            path = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            if path:
+                yield path
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def find_files_recursive(folder_path, file_extension, serial=None):
+    return list(iter_remote_files(folder_path, [file_extension], serial=serial))
+
+
+def _find_files_recursive_crawl(folder_path, file_extension, serial=None):
+    # 旧的逐目录 ls + test -d 实现，仅保留给 bench.py 对比往返次数
     files = []
-    folder_contents = get_files_in_folder(folder_path)
+    folder_contents = get_files_in_folder(folder_path, serial)
     for item in folder_contents:
-        item_path = os.path.join(folder_path, item)
+        item_path = posixpath.join(folder_path, item)
         if item.endswith(file_extension):
             files.append(item_path)
-        elif adb_command(['shell', 'test', '-d', item_path]):
-            files.extend(find_files_recursive(item_path, file_extension))
+        elif adb_command(['shell', f'test -d {shlex.quote(item_path)} && echo d'], serial) == "d":
+            files.extend(_find_files_recursive_crawl(item_path, file_extension, serial))
     return files
 
 
+# kill 时删除的设备日志
+PDLOG_DIR = "/sdcard/pudu/log"
+PDLOG_PATTERN = "*pdlog*"
+
+
+class LogPuller:
+    # 与 Qt 无关的一次完整拉取：列表 -> 选择 -> (过滤) -> 传输 -> 指标；
+    # GUI 的拉取任务与命令行都只是它的外壳，进度通过 on_progress / on_bytes 回调给出
+    def __init__(self, service_names, count, need_logcat, need_kernel, need_anr, selected_files=None,
+                 workers=DEFAULT_PULL_WORKERS, transfer_mode=TRANSFER_PER_FILE, incremental=False, verify_md5=False,
+                 serials=None, time_window=None, grep_patterns=None, grep_context=0, timeline=False,
+                 search_index=False, logcat_minutes=0, on_progress=None, on_bytes=None, output_root=LOG_OUTPUT_ROOT,
+                 check_cancel=None):
+        self.service_names = service_names or []
+        self.count = count
+        self.need_logcat = need_logcat
+        self.need_kernel = need_kernel
+        self.need_anr = need_anr
+        self.selected_files = selected_files or []
+        self.workers = workers
+        self.transfer_mode = transfer_mode
+        self.incremental = incremental
+        self.verify_md5 = verify_md5
+        self.serials = list(serials or [])
+        # (start, end) epoch 秒；设置后按时间段而不是份数选择
+        self.time_window = time_window
+        # 设置后所选日志只在设备端 grep 匹配行再传回
+        self.grep_patterns = list(grep_patterns or [])
+        self.grep_context = grep_context
+        # 拉取完成后把该设备目录下的日志合并成一条时间线（timeline.py）
+        self.timeline = timeline
+        # 拉取完成后把新文件加入输出根目录下的全文索引（log_search.py）
+        self.search_index = search_index
+        # >0 时从后台 logcat 抓取（logcat_capture.py）的本地分段里取最近 N 分钟放进输出目录
+        self.logcat_minutes = logcat_minutes
+        self.on_progress = on_progress
+        # on_bytes(已完成字节, 预计总字节)，为所有设备的合计，不限频
+        self.on_bytes = on_bytes
+        self.output_root = output_root
+        # 阶段之间调用，任务被取消时抛 JobCancelled（job_queue.Job.check）
+        self.check_cancel = check_cancel
+        self._bytes = {}
+        self._bytes_lock = threading.Lock()
+
+    def _emit(self, message):
+        if self.on_progress is not None:
+            self.on_progress(message)
+
+    def _check_cancel(self):
+        if self.check_cancel is not None:
+            self.check_cancel()
+
+    def _device_emitter(self, serial):
+        # 多设备时每条消息带上设备前缀，区分各自的进度
+        if not serial:
+            return self._emit
+        return lambda message: self._emit(f"[{serial}] {message}")
+
+    def _build_jobs(self, selected, target_dir, serial=None):
+        jobs = []
+        if selected:
+            sizes = get_catalog(serial).sizes()
+            for name in selected:
+                jobs.append(PullJob(f"{REMOTE_LOG_DIR}/{name}", target_dir, sizes.get(name), serial))
+        if self.need_kernel:
+            jobs.append(PullJob("/sdcard/pudu/log/kernel", target_dir, None, serial))
+        if self.need_anr:
+            # 可能因设备权限失败，失败会汇总到结尾
+            jobs.append(PullJob("/data/anr", target_dir, None, serial))
+        if self.need_logcat:
+            # 改为按需求拉取 /sdcard/pudu/log/kernel/log 文件夹
+            jobs.append(PullJob("/sdcard/pudu/log/kernel/log", target_dir, None, serial))
+        return jobs
+
+    def pull_device(self, serial, target_dir):
+        # 返回该设备的结果字典：{serial, dir, selected, items, errors, stats}
+        emit = self._device_emitter(serial)
+        emit("Listing device logs: sdcard/pudu/log")
+        list_started = time.perf_counter()
+        catalog = get_catalog(serial)
+        filenames = catalog.file_names()
+        if not filenames:
+            raise AdbError("No logs found in sdcard/pudu/log")
+        os.makedirs(target_dir, exist_ok=True)
+        metrics = MetricsLog(os.path.join(target_dir, METRICS_FILE_NAME), serial)
+        metrics.write("stage", name="list", seconds=round(time.perf_counter() - list_started, 4), entries=len(filenames))
+        metrics.watch_adb()
+        try:
+            return self._pull_selected(serial, target_dir, catalog, metrics, emit)
+        finally:
+            metrics.close()
+
+    def _pull_selected(self, serial, target_dir, catalog, metrics, emit):
+        with metrics.stage("select"):
+            # 若显式选择了文件，则优先拉取这些文件
+            if self.selected_files:
+                selected = list(self.selected_files)
+            elif self.time_window:
+                start, end = self.time_window
+                selected = select_by_time_window(catalog, self.service_names, start, end, SERVICES)
+                emit(f"Time window selected {len(selected)} logs")
+            else:
+                # 复用清单上的索引，浏览后再拉取不必重新解析文件名
+                selected = catalog.log_index(SERVICES).select(self.service_names, self.count)
+        if not selected:
+            emit("No matching logs by selection; continue with options if any.")
+        result = {"serial": serial, "dir": target_dir, "selected": list(selected)}
+        stats = TransferStats(on_bytes=self._bytes_reporter(serial), metrics=metrics)
+        if self.grep_patterns and selected:
+            emit(f"Filtered pull: {len(selected)} logs, patterns={self.grep_patterns}, context={self.grep_context}")
+            with metrics.stage("filter", items=len(selected)):
+                pull_filtered(REMOTE_LOG_DIR, selected, target_dir, self.grep_patterns, self.grep_context,
+                              serial=serial, on_progress=emit, stats=stats)
+            selected = []
+        self._check_cancel()
+        jobs = self._build_jobs(selected, target_dir, serial)
+        stats.expected_bytes = sum(job.size for job in jobs if job.size is not None)
+        emit(f"Pull {len(jobs)} items ({format_size(stats.expected_bytes)} known) with {self.workers} workers, "
+             f"mode={self.transfer_mode}")
+        with metrics.stage("transfer", items=len(jobs), mode=self.transfer_mode, incremental=self.incremental):
+            partial_dir = os.path.join(self.output_root, PARTIAL_DIR_NAME)
+            if self.incremental:
+                store = IncrementalStore(self.output_root)
+                errors = pull_jobs_incremental(jobs, store, self.transfer_mode, self.workers, emit, self.verify_md5, stats,
+                                               partial_dir)
+            else:
+                errors = pull_jobs(jobs, self.transfer_mode, self.workers, emit, stats, partial_dir)
+        metrics.write("summary", errors=len(errors), **stats.as_dict())
+        self._check_cancel()
+        emit(stats.summary())
+        if errors:
+            emit(f"{len(errors)}/{len(jobs)} items failed:")
+            for remote_path, err in errors:
+                emit(f"  {remote_path}: {err}")
+        result.update(items=len(jobs), errors=[{"path": p, "error": str(e)} for p, e in errors], stats=stats.as_dict())
+        if self.logcat_minutes:
+            from logcat_capture import snapshot_device
+            with metrics.stage("logcat_snapshot", minutes=self.logcat_minutes):
+                snapshot = snapshot_device(serial, target_dir, self.logcat_minutes, self.output_root)
+            result["logcat"] = snapshot
+            emit(f"Logcat snapshot (last {self.logcat_minutes} min): {snapshot or 'no captured data'}")
+        self._check_cancel()
+        if self.timeline:
+            from timeline import merge_timeline
+            with metrics.stage("timeline"):
+                result["timeline"] = merge_timeline(target_dir, on_progress=emit)
+        if self.search_index:
+            self._index_pulled(serial, target_dir, metrics, emit, result)
+        return result
+
+    def _index_pulled(self, serial, target_dir, metrics, emit, result):
+        from log_search import SearchIndex, SearchIndexError
+        try:
+            with metrics.stage("index"):
+                index = SearchIndex(self.output_root)
+                try:
+                    result["index"] = index.index_dir(target_dir, serial=serial_dir_name(serial) if serial else None,
+                                                      on_progress=emit)
+                finally:
+                    index.close()
+        except SearchIndexError as e:
+            # 索引失败不影响已完成的拉取
+            emit(f"Index failed: {e}")
+
+    def _bytes_reporter(self, serial):
+        # 汇总各设备的字节进度后回调 on_bytes
+        def report(done, expected):
+            if self.on_bytes is None:
+                return
+            with self._bytes_lock:
+                self._bytes[serial] = (done, expected)
+            self.on_bytes(*self.bytes_total())
+        return report
+
+    def bytes_total(self):
+        with self._bytes_lock:
+            return (sum(d for d, _ in self._bytes.values()), sum(e for _, e in self._bytes.values()))
+
+    def _pull_devices(self, target_dir):
+        # 每台设备一个线程、一个子目录；整机传输并发由主机级信号量限制
+        results = []
+        failures = {}
+        with ThreadPoolExecutor(max_workers=len(self.serials)) as pool:
+            futures = {
+                serial: pool.submit(self.pull_device, serial, os.path.join(target_dir, serial_dir_name(serial)))
+                for serial in self.serials
+            }
+            for serial, future in futures.items():
+                try:
+                    results.append(future.result())
+                except JobCancelled:
+                    raise
+                except AdbError as e:
+                    failures[serial] = str(e)
+                    self._emit(f"[{serial}] Failed: {e}")
+                except Exception as e:
+                    traceback.print_exc()
+                    failures[serial] = str(e)
+                    self._emit(f"[{serial}] Failed: {e}")
+        return results, failures
+
+    def run(self, target_dir=None):
+        # 返回 {dir, devices: [...], failures: {serial: 错误}}；全部设备失败时抛 AdbError
+        if target_dir is None:
+            target_dir = os.path.join(self.output_root, datetime.now().strftime("%Y%m%d%H%M%S"))
+        if not self.serials:
+            results, failures = [self.pull_device(None, target_dir)], {}
+        else:
+            results, failures = self._pull_devices(target_dir)
+            if len(failures) == len(self.serials):
+                raise AdbError("; ".join(f"{s}: {e}" for s, e in failures.items()))
+        return {"dir": target_dir, "devices": results, "failures": failures}
+
+
+def build_kill_script(packages, delete_pdlog, parallel=False):
+    # 生成一次 adb shell 执行的 kill 脚本，输出紧凑报告，每行一条：
+    #   D <path>     已删除的 pdlog      R <path>     删除后仍存在的 pdlog
+    #   K <rc> <pkg> force-stop 结果
+    # 删除优先用 find -delete（不逐个 fork rm），不支持时退回 xargs 批量 rm
+    lines = []
+    if delete_pdlog:
+        find = f"find {shlex.quote(PDLOG_DIR)} -type f -name {shlex.quote(PDLOG_PATTERN)}"
+        lines += [
+            f"{find} 2>/dev/null | sed 's/^/D /'",
+            f"{find} -delete 2>/dev/null || {find} -print0 2>/dev/null | xargs -0 rm -f 2>/dev/null",
+            f"{find} 2>/dev/null | sed 's/^/R /'",
+        ]
+    for pkg in dict.fromkeys(packages or []):
+        stop = f"am force-stop {shlex.quote(pkg)} >/dev/null 2>&1; echo \"K $? {pkg}\""
+        # 并行：各包各起一个子 shell，最后 wait 等齐
+        lines.append(f"( {stop} ) &" if parallel else stop)
+    if parallel:
+        lines.append("wait")
+    return "\n".join(lines)
+
+
+def parse_kill_report(output):
+    # 解析 build_kill_script 的输出；删除结果以最终残留为准
+    deleted, remain, stopped, failed = [], [], [], {}
+    for line in output.splitlines():
+        kind, _, rest = line.partition(" ")
+        if kind == "D" and rest:
+            deleted.append(rest)
+        elif kind == "R" and rest:
+            remain.append(rest)
+        elif kind == "K":
+            rc, _, pkg = rest.partition(" ")
+            if rc == "0":
+                stopped.append(pkg)
+            else:
+                failed[pkg] = f"rc={rc}"
+    remaining = set(remain)
+    deleted = [path for path in deleted if path not in remaining]
+    return deleted, remain, stopped, failed
+
+
+def kill_device(packages, delete_pdlog, serial=None, on_progress=None, parallel=False):
+    # 删除 pdlog（可选）并 force-stop 全部包，整个过程只有一次 adb 调用；
+    # 返回 {serial, deleted, remain, stopped, failed}
+    def emit(text):
+        if on_progress is not None:
+            on_progress(text if not serial else f"[{serial}] {text}")
+    packages = list(dict.fromkeys(packages or []))
+    result = {"serial": serial, "deleted": [], "remain": None, "stopped": [], "failed": {}}
+    emit(f"Kill {len(packages)} packages{' in parallel' if parallel else ''}"
+         f"{', delete pdlog' if delete_pdlog else ''}")
+    try:
+        output = adb_command(["shell", build_kill_script(packages, delete_pdlog, parallel)], serial)
+    except JobCancelled:
+        # 取消要抛到任务边界（与 adb_command 一致）；脚本可能已执行了一部分，清单同样作废
+        invalidate_catalog(serial)
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        result["failed"]["script"] = str(e)
+        emit(f"Kill failed: {e}")
+        invalidate_catalog(serial)
+        return result
+    deleted, remain, stopped, failed = parse_kill_report(output)
+    result.update(stopped=stopped)
+    result["failed"].update(failed)
+    # 没有回报的包视为失败（脚本被中断等）
+    for pkg in packages:
+        if pkg not in stopped and pkg not in failed:
+            result["failed"][pkg] = "no report"
+    if delete_pdlog:
+        result.update(deleted=deleted, remain=remain)
+        emit(f"Deleted {len(deleted)} pdlog files.")
+        if remain:
+            emit(f"Remain {len(remain)} pdlog files:")
+            for path in remain[:100]:
+                emit(path)
+        else:
+            emit("All pdlog files removed.")
+    emit(f"force-stop: {len(stopped)}/{len(packages)} ok")
+    for pkg, err in result["failed"].items():
+        emit(f"force-stop failed for {pkg}: {err}")
+    # kill/删除后设备日志会变化，清掉缓存的目录清单
+    invalidate_catalog(serial)
+    return result
+
+
+def kill_devices(packages, delete_pdlog, serials=None, on_progress=None, parallel=False):
+    # 多设备并行 kill；未指定设备时作用于默认设备
+    if not serials:
+        return [kill_device(packages, delete_pdlog, None, on_progress, parallel)]
+    with ThreadPoolExecutor(max_workers=len(serials)) as pool:
+        futures = [pool.submit(kill_device, packages, delete_pdlog, serial, on_progress, parallel) for serial in serials]
+        return [future.result() for future in futures]
+
+
 def pull_recent_log(number):
     logs = get_files_in_folder("sdcard/pudu/log")
     need_pull_log_name = []
@@ -102,7 +2229,210 @@ def pull_process_log(process, number):
     subprocess.call(["explorer", pull_to_dir])
 
 
+def _parse_cli_time(text):
+    # 命令行时间：epoch 秒或 ISO 格式（2024-05-01T08:00 / "2024-05-01 08:00:00"）
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def _cli_progress(quiet):
+    if quiet:
+        return None
+    return lambda message: print(message, file=sys.stderr, flush=True)
+
+
+def _cli_list(args):
+    if args.what == "devices":
+        return 0, [device._asdict() for device in list_devices()]
+    serial = args.serial[0] if args.serial else None
+    catalog = get_catalog(serial)
+    entries = [e for e in catalog.top_level() if not e.is_dir]
+    if args.service:
+        # 与 pull 同一套分桶（最长已知服务前缀、带轮转编号），列出的正是 pull --service 可选的文件
+        index = catalog.log_index(SERVICES)
+        names = {name for svc in args.service for _, name in index.entries(svc)}
+        entries = [e for e in entries if e.path in names]
+    return 0, [{"name": e.path, "size": e.size, "mtime": e.mtime} for e in sorted(entries, key=lambda e: e.path)]
+
+
+def _cli_pull(args):
+    time_window = None
+    if args.since or args.until:
+        start = _parse_cli_time(args.since) if args.since else 0
+        end = _parse_cli_time(args.until) if args.until else time.time()
+        time_window = (start, end)
+    puller = LogPuller(args.service or list(SERVICES), args.count, args.logcat, args.kernel, args.anr,
+                       selected_files=args.file, workers=args.workers, transfer_mode=args.mode,
+                       incremental=args.incremental, verify_md5=args.md5, serials=args.serial,
+                       time_window=time_window, grep_patterns=args.grep, grep_context=args.context,
+                       timeline=args.timeline, search_index=args.index, logcat_minutes=args.logcat_minutes,
+                       on_progress=_cli_progress(args.quiet), output_root=args.output)
+    result = puller.run()
+    failed = result["failures"] or any(device["errors"] for device in result["devices"])
+    return (2 if failed else 0), result
+
+
+def _cli_kill(args):
+    results = kill_devices(args.package or KILL_PACKAGES, args.delete_pdlog, args.serial, _cli_progress(args.quiet),
+                           args.parallel)
+    failed = any(r["failed"] or r["remain"] for r in results)
+    return (2 if failed else 0), results
+
+
+def _cli_timeline(args):
+    # 不带时间段：合并；带 --since/--until：从已合并的时间线按索引读出该时间段（尚未合并时先合并）
+    from timeline import TIMELINE_INDEX_NAME, merge_timeline, read_timeline
+    if not (args.since or args.until):
+        return 0, merge_timeline(args.dir, args.workers, _cli_progress(args.quiet))
+    # 索引与时间线一同写出且不会被归档压缩，以它判断是否已合并（timeline.log 本身可能已压缩）
+    if not os.path.exists(os.path.join(args.dir, TIMELINE_INDEX_NAME)):
+        merge_timeline(args.dir, args.workers, _cli_progress(args.quiet))
+    start = _parse_cli_time(args.since) if args.since else None
+    end = _parse_cli_time(args.until) if args.until else None
+    lines = []
+    for source, text in read_timeline(args.dir, start, end):
+        if len(lines) >= args.limit:
+            return 0, {"lines": lines, "truncated": True}
+        lines.append({"source": source, "line": text})
+    return 0, {"lines": lines, "truncated": False}
+
+
+def _cli_index(args):
+    from log_search import SearchIndex
+    index = SearchIndex(args.root)
+    try:
+        return 0, index.index_archive(args.workers, _cli_progress(args.quiet))
+    finally:
+        index.close()
+
+
+def _cli_search(args):
+    from log_search import SearchIndex
+    index = SearchIndex(args.root)
+    try:
+        started = time.perf_counter()
+        hits = index.search(args.query, args.limit, args.session, args.device, args.service, args.rotation)
+        return 0, {"ms": round((time.perf_counter() - started) * 1000, 2), "hits": [hit._asdict() for hit in hits]}
+    finally:
+        index.close()
+
+
+def _cli_capture(args):
+    # 前台运行后台抓取，Ctrl-C 结束；结束时输出各设备状态
+    from logcat_capture import LogcatCapture
+    captures = [LogcatCapture(serial, args.root, "all" if args.all_buffers else None, args.binary,
+                              args.segment_size * 1024 * 1024, args.segments, on_status=_cli_progress(args.quiet))
+                for serial in (args.serial or [None])]
+    for capture in captures:
+        capture.start()
+    try:
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    for capture in captures:
+        capture.stop()
+    return 0, [capture.status() for capture in captures]
+
+
+def _cli_maintain(args):
+    # 一次归档维护：保留策略 + 压缩旧会话 + 回收增量存储
+    import archive
+    return 0, archive.run_maintenance(args.root, args.compress_after, args.max_age,
+                                      int(args.max_total * 1024 ** 3), int(args.device_quota * 1024 ** 3),
+                                      args.codec, args.workers, args.dry_run, _cli_progress(args.quiet))
+
+
+def main(argv=None):
+    # 无界面命令行：结果以 JSON 写到 stdout，进度写到 stderr；
+    # 退出码 0 成功、1 整体失败、2 部分条目失败，便于 cron 批量采集
+    # 定时任务建议用 python -m pull_log 运行：可复用 __pycache__ 字节码，启动更快
+    import argparse
+    parser = argparse.ArgumentParser(prog="pull_log", description="PUDU 日志拉取（命令行）")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-s", "--serial", action="append", help="设备序列号，可重复；缺省为默认设备")
+    common.add_argument("-q", "--quiet", action="store_true", help="不输出进度")
+    common.add_argument("--indent", type=int, default=None, help="JSON 缩进")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_list = sub.add_parser("list", parents=[common], help="列出设备或设备上的日志")
+    p_list.add_argument("what", nargs="?", choices=("devices", "logs"), default="devices")
+    p_list.add_argument("--service", action="append", help="只列出这些服务的日志")
+    p_pull = sub.add_parser("pull", parents=[common], help="拉取日志")
+    p_pull.add_argument("--service", action="append", help="服务名，可重复；缺省为全部")
+    p_pull.add_argument("-n", "--count", type=int, default=5, help="每个服务拉取的份数")
+    p_pull.add_argument("--file", action="append", help="直接指定 sdcard/pudu/log 下的文件名，可重复")
+    p_pull.add_argument("--logcat", action="store_true")
+    p_pull.add_argument("--kernel", action="store_true")
+    p_pull.add_argument("--anr", action="store_true")
+    p_pull.add_argument("-j", "--workers", type=int, default=DEFAULT_PULL_WORKERS)
+    p_pull.add_argument("--mode", choices=TRANSFER_MODES, default=TRANSFER_PER_FILE)
+    p_pull.add_argument("--incremental", action="store_true")
+    p_pull.add_argument("--md5", action="store_true", help="增量拉取时用 md5 校验")
+    p_pull.add_argument("--since", help="时间段起点（epoch 秒或 ISO 时间）")
+    p_pull.add_argument("--until", help="时间段终点（epoch 秒或 ISO 时间）")
+    p_pull.add_argument("--grep", action="append", help="只拉取匹配行，可重复")
+    p_pull.add_argument("--context", type=int, default=0, help="grep 上下文行数")
+    p_pull.add_argument("-o", "--output", default=LOG_OUTPUT_ROOT, help="本地输出根目录")
+    p_pull.add_argument("--timeline", action="store_true", help="拉取后合并成按时间排序的 timeline.log")
+    p_pull.add_argument("--index", action="store_true", help="拉取后把新文件加入全文索引")
+    p_pull.add_argument("--logcat-minutes", type=float, default=0, help="从后台 logcat 抓取中取最近 N 分钟")
+    p_kill = sub.add_parser("kill", parents=[common], help="force-stop 业务进程")
+    p_kill.add_argument("--delete-pdlog", action="store_true", help="先删除设备上的 pdlog")
+    p_kill.add_argument("--package", action="append", help="要 force-stop 的包，可重复；缺省为内置列表")
+    p_kill.add_argument("--parallel", action="store_true", help="设备端并行 force-stop")
+    p_timeline = sub.add_parser("timeline", parents=[common], help="把已拉取目录下的日志合并成一条时间线")
+    p_timeline.add_argument("dir", help="拉取输出目录（单台设备的目录）")
+    p_timeline.add_argument("-j", "--workers", type=int, default=None, help="解析进程数，缺省为 CPU 数")
+    p_timeline.add_argument("--since", help="只读出该时间之后的记录（epoch 秒或 ISO 时间）")
+    p_timeline.add_argument("--until", help="只读出该时间之前的记录（epoch 秒或 ISO 时间）")
+    p_timeline.add_argument("--limit", type=int, default=1000, help="读时间段时最多输出的行数")
+    p_index = sub.add_parser("index", parents=[common], help="为整个拉取归档补建全文索引（增量）")
+    p_index.add_argument("-o", "--root", default=LOG_OUTPUT_ROOT, help="本地输出根目录")
+    p_index.add_argument("-j", "--workers", type=int, default=4, help="读取文件的线程数")
+    p_search = sub.add_parser("search", parents=[common], help="在全文索引中查询日志行")
+    p_search.add_argument("query", help="FTS5 查询，如 'timeout AND CoreService' 或 '\"connect failed\"'")
+    p_search.add_argument("-o", "--root", default=LOG_OUTPUT_ROOT, help="本地输出根目录")
+    p_search.add_argument("--service")
+    p_search.add_argument("--session", help="会话目录名（拉取时间戳）")
+    p_search.add_argument("--device", help="设备目录名")
+    p_search.add_argument("--rotation", type=int)
+    p_search.add_argument("--limit", type=int, default=200)
+    p_capture = sub.add_parser("capture", parents=[common], help="后台抓取 logcat 到本地分段环，Ctrl-C 结束")
+    p_capture.add_argument("-o", "--root", default=LOG_OUTPUT_ROOT, help="本地输出根目录")
+    p_capture.add_argument("--all-buffers", action="store_true", help="logcat -b all")
+    p_capture.add_argument("--binary", action="store_true", help="logcat -B 二进制格式")
+    p_capture.add_argument("--segment-size", type=int, default=4, help="分段大小（MB）")
+    p_capture.add_argument("--segments", type=int, default=32, help="每台设备保留的分段数")
+    p_capture.add_argument("--duration", type=float, default=0, help="抓取时长（秒），0 表示直到 Ctrl-C")
+    p_maintain = sub.add_parser("maintain", parents=[common], help="按保留策略清理并压缩旧会话")
+    p_maintain.add_argument("-o", "--root", default=LOG_OUTPUT_ROOT, help="本地输出根目录")
+    p_maintain.add_argument("--compress-after", type=float, default=3, help="压缩超过 N 天的会话")
+    p_maintain.add_argument("--max-age", type=float, default=90, help="删除超过 N 天的会话，0 为不限")
+    p_maintain.add_argument("--max-total", type=float, default=0, help="归档总大小上限（GB），0 为不限")
+    p_maintain.add_argument("--device-quota", type=float, default=0, help="单设备大小上限（GB），0 为不限")
+    p_maintain.add_argument("--codec", choices=("gzip", "zstd"), default=None, help="缺省：装了 zstandard 用 zstd")
+    p_maintain.add_argument("-j", "--workers", type=int, default=2, help="压缩进程数")
+    p_maintain.add_argument("--dry-run", action="store_true", help="只列出将删除的会话")
+    args = parser.parse_args(argv)
+    handlers = {"list": _cli_list, "pull": _cli_pull, "kill": _cli_kill, "timeline": _cli_timeline,
+                "index": _cli_index, "search": _cli_search, "capture": _cli_capture, "maintain": _cli_maintain}
+    try:
+        rc, result = handlers[args.cmd](args)
+        output = {"ok": rc == 0, "result": result}
+    except AdbError as e:
+        rc, output = 1, {"ok": False, "error": str(e)}
+    except Exception as e:
+        traceback.print_exc()
+        rc, output = 1, {"ok": False, "error": str(e)}
+    print(json.dumps(output, ensure_ascii=False, indent=args.indent))
+    return rc
+
+
 if __name__ == '__main__':
-    pull_recent_log(30)
-    # pull_process_log("pudutech-maptools", 5)
-    # pull_process_log("HardwareService", 1)
+    # 以 python pull_log.py / -m pull_log 运行时，让 timeline 等模块的 import pull_log 拿到同一个模块，
+    # 否则会再加载一份，AdbError 等类型与取消状态都不共享
+    sys.modules.setdefault("pull_log", sys.modules["__main__"])
+    sys.exit(main())
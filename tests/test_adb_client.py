@@ -0,0 +1,153 @@
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import adb_client
+import fake_adb
+from adb_client import AdbError, AdbServerUnreachable, SyncConnection
+
+SERIAL = "FAKE0001"
+LOG_DIR = "/sdcard/pudu/log"
+
+
+class NativeClientTest(unittest.TestCase):
+    # 直连客户端对 fake_adb 的 server 模式跑完整协议：host 服务、sync STAT/LIST/RECV、shell,v2 与 exec
+    @classmethod
+    def setUpClass(cls):
+        cls.device = tempfile.mkdtemp()
+        fake_adb.make_tree(cls.device, ["CoreService", "can_service"], files_per_service=3, file_size=200 * 1024,
+                           kernel_files=2, anr_files=1)
+        os.makedirs(os.path.join(cls.device, "data", "empty"))
+        # server 每条连接读取一次环境变量
+        cls.env = mock.patch.dict(os.environ, {fake_adb.ROOT_ENV: cls.device, fake_adb.SERIALS_ENV: SERIAL,
+                                               fake_adb.DROP_RATE_ENV: "0", fake_adb.BANDWIDTH_ENV: "0"})
+        cls.env.start()
+        cls.server = fake_adb.start_server(0)
+        cls.address = "127.0.0.1:%d" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.env.stop()
+        adb_client.close_sync_pool()
+        shutil.rmtree(cls.device, ignore_errors=True)
+
+    def setUp(self):
+        self.out = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out, ignore_errors=True)
+
+    def _device_path(self, remote):
+        return os.path.join(self.device, remote.lstrip("/"))
+
+    def _log_name(self, service):
+        return sorted(n for n in os.listdir(self._device_path(LOG_DIR)) if n.startswith(service + "."))[0]
+
+    def test_host_services(self):
+        self.assertTrue(adb_client.server_available(self.address))
+        self.assertIn(SERIAL, adb_client.list_devices_text(self.address))
+        self.assertIn("shell_v2", adb_client.device_features(SERIAL, self.address))
+
+    def test_list_matches_device(self):
+        conn = SyncConnection(SERIAL, self.address)
+        try:
+            names = {entry.name for entry in conn.list(LOG_DIR)}
+        finally:
+            conn.close()
+        self.assertEqual(names, set(os.listdir(self._device_path(LOG_DIR))))
+
+    def test_pull_file(self):
+        name = self._log_name("CoreService")
+        remote = f"{LOG_DIR}/{name}"
+        local = os.path.join(self.out, name)
+        progress = []
+        files, size = adb_client.pull(remote, local, SERIAL, on_bytes=progress.append, address=self.address)
+        with open(self._device_path(remote), "rb") as f:
+            expected = f.read()
+        with open(local, "rb") as f:
+            self.assertEqual(f.read(), expected)
+        self.assertEqual((files, size, sum(progress)), (1, len(expected), len(expected)))
+        self.assertEqual(int(os.path.getmtime(local)), int(os.path.getmtime(self._device_path(remote))))
+
+    def test_pull_dir_recursive(self):
+        files, size = adb_client.pull(f"{LOG_DIR}/kernel", os.path.join(self.out, "kernel"), SERIAL,
+                                      address=self.address)
+        expected = []
+        for dirpath, _, filenames in os.walk(self._device_path(f"{LOG_DIR}/kernel")):
+            expected += [os.path.getsize(os.path.join(dirpath, name)) for name in filenames]
+        self.assertEqual((files, size), (len(expected), sum(expected)))
+
+    def test_pull_empty_dir(self):
+        self.assertEqual(adb_client.pull("/data/empty", os.path.join(self.out, "empty"), SERIAL,
+                                         address=self.address), (0, 0))
+
+    @unittest.skipIf(hasattr(os, "geteuid") and os.geteuid() == 0, "root 可读任意目录，无法模拟权限不足")
+    def test_pull_unreadable_dir_fails(self):
+        locked = self._device_path("/data/locked")
+        os.makedirs(locked)
+        with open(os.path.join(locked, "a.txt"), "w") as f:
+            f.write("x")
+        os.chmod(locked, 0)
+        try:
+            with self.assertRaises(AdbError):
+                adb_client.pull("/data/locked", os.path.join(self.out, "locked"), SERIAL, address=self.address)
+        finally:
+            os.chmod(locked, stat.S_IRWXU)
+            shutil.rmtree(locked, ignore_errors=True)
+
+    def test_pull_missing_leaves_nothing(self):
+        local = os.path.join(self.out, "missing.log")
+        with self.assertRaises(AdbError):
+            adb_client.pull(f"{LOG_DIR}/missing.log", local, SERIAL, address=self.address)
+        self.assertFalse(os.path.exists(local))
+
+    def test_sync_connection_reused(self):
+        conn = adb_client.acquire_sync(SERIAL, self.address)
+        adb_client.release_sync(conn)
+        again = adb_client.acquire_sync(SERIAL, self.address)
+        try:
+            self.assertIs(again, conn)
+        finally:
+            adb_client.release_sync(again)
+
+    def test_shell_exit_status(self):
+        stream = adb_client.open_stream(["shell", "echo hello; exit 3"], SERIAL, self.address)
+        self.assertEqual(stream.stdout.read(), b"hello\n")
+        self.assertEqual(stream.wait(), 3)
+        stream = adb_client.open_stream(["shell", f"ls {LOG_DIR}"], SERIAL, self.address)
+        listing = stream.stdout.read().decode().split()
+        self.assertEqual(stream.wait(), 0)
+        self.assertEqual(sorted(listing), sorted(os.listdir(self._device_path(LOG_DIR))))
+
+    def test_exec_stream_is_binary(self):
+        name = self._log_name("can_service")
+        stream = adb_client.open_stream(["exec-out", f"cat {LOG_DIR}/{name}"], SERIAL, self.address)
+        with open(self._device_path(f"{LOG_DIR}/{name}"), "rb") as f:
+            self.assertEqual(stream.stdout.read(), f.read())
+        self.assertEqual(stream.wait(), 0)
+
+    def test_unknown_device(self):
+        with self.assertRaises(AdbError):
+            SyncConnection("NOPE", self.address)
+
+    def test_unreachable_server(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        address = "127.0.0.1:%d" % sock.getsockname()[1]
+        sock.close()
+        with self.assertRaises(AdbServerUnreachable):
+            adb_client.host_query("host:version", address, timeout=2)
+        self.assertFalse(adb_client.server_available(address))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import itertools
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pull_log import LogIndex, SERVICES
+
+
+# 原 main.py 中 LogPullWorker._select_logs 及其两个辅助方法（改造前的基准行为），逐字保留用于比对
+def _select_by_threshold(filenames, count):
+    id_list = []
+    for name in filenames:
+        parts = name.split(".")
+        if len(parts) > 3 and parts[3].isdigit():
+            id_list.append(int(parts[3]))
+    if not id_list:
+        return []
+    max_id = max(id_list)
+    threshold = max_id - count
+    selected = []
+    for name in filenames:
+        parts = name.split(".")
+        if len(parts) > 3 and parts[3].isdigit():
+            if int(parts[3]) > threshold:
+                selected.append(name)
+    return selected
+
+
+def _select_top_n(filenames, count):
+    candidates = []
+    for name in filenames:
+        parts = name.split(".")
+        if len(parts) > 3 and parts[3].isdigit():
+            candidates.append((int(parts[3]), name))
+    if not candidates:
+        return []
+    candidates.sort(key=lambda x: x[0], reverse=True)
+    return [name for _, name in candidates[:max(0, count)]]
+
+
+def _select_logs(all_filenames, service_names, count):
+    if not service_names:
+        return []
+    union_set = []
+    seen = set()
+    multiple = len(service_names) > 1
+    for svc in service_names:
+        svc_files = [name for name in all_filenames if name.startswith(svc)]
+        if multiple:
+            chosen = _select_top_n(svc_files, count)
+        else:
+            chosen = _select_by_threshold(svc_files, count)
+        for item in chosen:
+            if item not in seen:
+                seen.add(item)
+                union_set.append(item)
+    return union_set
+
+
+def _listing():
+    # 模拟 sdcard/pudu/log 的 ls：每个服务若干轮转，夹杂无编号文件、目录和重复编号
+    names = ["kernel", "anr", "README.txt", "CoreService.current.log"]
+    for svc in SERVICES:
+        for rid in (1, 2, 3, 5, 8):
+            if "g3log" in svc:
+                names.append(f"{svc}.20240501.{rid}")
+            else:
+                names.append(f"{svc}.20240501.pdlog.{rid}.log")
+    # 同一编号出现两次（不同日期），top-N 需保持列表原顺序
+    names.append("CoreService.20240502.pdlog.8.log")
+    random.Random(7).shuffle(names)
+    return names
+
+
+class LogIndexSelectTest(unittest.TestCase):
+    def setUp(self):
+        self.names = _listing()
+        self.index = LogIndex(self.names, SERVICES)
+
+    def test_single_select_matches_baseline(self):
+        for svc in SERVICES:
+            for count in (0, 1, 2, 3, 5, 7, 100):
+                self.assertEqual(self.index.select([svc], count), _select_logs(self.names, [svc], count), (svc, count))
+
+    def test_multi_select_matches_baseline(self):
+        for size in (2, 3, len(SERVICES)):
+            for services in itertools.islice(itertools.combinations(SERVICES, size), 20):
+                for count in (0, 1, 3, 100):
+                    self.assertEqual(self.index.select(list(services), count),
+                                     _select_logs(self.names, list(services), count), (services, count))
+
+    def test_above_threshold_and_top_n(self):
+        svc = "CoreService"
+        files = [name for name in self.names if name.startswith(svc)]
+        for count in (0, 1, 2, 4, 100):
+            self.assertEqual(self.index.above_threshold(svc, count), _select_by_threshold(files, count))
+            self.assertEqual(self.index.top_n(svc, count), _select_top_n(files, count))
+
+    def test_count_larger_than_rotations(self):
+        # 请求份数超过实际轮转数时返回该服务全部带编号的文件
+        svc = "launcher"
+        everything = [name for name in self.names if name.startswith(svc)]
+        self.assertEqual(sorted(self.index.top_n(svc, 50)), sorted(everything))
+        self.assertEqual(self.index.above_threshold(svc, 50), everything)
+        self.assertEqual(self.index.select([svc], 50), _select_logs(self.names, [svc], 50))
+
+    def test_mirsdk_prefix_collision(self):
+        # mirsdk.g3log 与 pudutech-mirsdk.g3log 互不串台，单选/多选都与基准一致
+        mirsdk = self.index.select(["mirsdk.g3log"], 3)
+        self.assertTrue(mirsdk)
+        self.assertTrue(all(name.startswith("mirsdk.g3log") for name in mirsdk))
+        both = ["pudutech-mirsdk.g3log", "mirsdk.g3log"]
+        self.assertEqual(self.index.select(both, 2), _select_logs(self.names, both, 2))
+        self.assertEqual(self.index.select(["pudutech-mirsdk.g3log"], 2),
+                         _select_logs(self.names, ["pudutech-mirsdk.g3log"], 2))
+
+    def test_known_service_takes_longest_prefix(self):
+        # 一个已知服务名是另一个的前缀时按最长前缀分桶（这是相对基准的有意修正：基准会把长名服务的文件算进短名服务）
+        names = ["Core.20240501.pdlog.1.log", "CoreService.20240501.pdlog.9.log"]
+        index = LogIndex(names, ["Core", "CoreService"])
+        self.assertEqual(index.select(["Core"], 1), ["Core.20240501.pdlog.1.log"])
+        self.assertEqual(index.select(["CoreService"], 1), ["CoreService.20240501.pdlog.9.log"])
+
+    def test_unknown_service_falls_back_to_prefix_scan(self):
+        svc = "CoreSer"
+        self.assertEqual(self.index.select([svc], 2), _select_logs(self.names, [svc], 2))
+
+    def test_empty(self):
+        self.assertEqual(self.index.select([], 5), [])
+        self.assertEqual(LogIndex([], SERVICES).select(["CoreService"], 5), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_search
+from log_search import SearchIndex
+
+
+def _write(path, lines):
+    with open(path, "w") as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.session = os.path.join(self.root, "20240501080000")
+        os.makedirs(self.session)
+        # 空行不入索引；批大小设得很小，确保一个文件被拆成多批、多次提交
+        for rid in (1, 2, 3):
+            _write(os.path.join(self.session, f"CoreService.20240501.pdlog.{rid}.log"),
+                   [("" if i % 5 == 0 else f"2024-05-01 08:00:{i % 60:02d}.000 I file{rid} token{i % 13}")
+                    for i in range(1000)])
+        patcher = mock.patch.multiple(log_search, SEARCH_BATCH_ROWS=64, SEARCH_QUEUE_BATCHES=2, SEARCH_COMMIT_ROWS=300)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = SearchIndex(self.root)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _count(self, sql):
+        return self.index._conn.execute(sql).fetchone()[0]
+
+    def test_index_and_search(self):
+        result = self.index.index_archive(workers=2)
+        self.assertEqual((result["files"], result["lines"]), (3, 2400))
+        self.assertEqual(self._count("SELECT COUNT(*) FROM log_lines"), 2400)
+        self.assertEqual(self._count("SELECT SUM(line_count) FROM files"), 2400)
+        hits = self.index.search("token7", limit=5000, rotation=2)
+        self.assertTrue(hits)
+        for hit in hits:
+            self.assertIn("file2 token7", hit.line)
+            with open(os.path.join(self.root, hit.path), "rb") as f:
+                f.seek(hit.offset)
+                self.assertEqual(f.readline().decode().rstrip("\n"), hit.line)
+        self.assertEqual(self.index.index_archive()["skipped"], 3)
+
+    def test_changed_file_is_reindexed(self):
+        self.index.index_archive()
+        path = os.path.join(self.session, "CoreService.20240501.pdlog.1.log")
+        _write(path, ["2024-05-01 09:00:00.000 I replaced"])
+        result = self.index.index_archive()
+        self.assertEqual((result["files"], result["skipped"]), (1, 2))
+        self.assertEqual(self._count("SELECT COUNT(*) FROM log_lines"), 1601)
+        self.assertEqual([hit.line for hit in self.index.search("file1")], [])
+
+    def test_failed_file_is_picked_up_again(self):
+        real_open = log_search.open_log
+
+        def failing_open(path, *args, **kwargs):
+            if str(path).endswith("pdlog.3.log"):
+                raise OSError("boom")
+            return real_open(path, *args, **kwargs)
+        # 只让读取线程失败；timeline_sources 的二进制探测照常打开文件
+        with mock.patch("log_search.open_log", failing_open):
+            with self.assertRaises(OSError):
+                self.index.index_archive(workers=2)
+        result = self.index.index_archive()
+        self.assertEqual(result["files"], 1)
+        self.assertEqual(self._count("SELECT COUNT(*) FROM log_lines"), 2400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive
+import timeline
+from pull_log import parse_log_timestamp
+from timeline import TIMELINE_FILE_NAME, merge_timeline, read_timeline, timeline_seek
+
+BASE = datetime(2024, 5, 1, 8, 0, 0)
+
+
+class TimelineWindowTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        # 两个交错的文件，每秒各一行；第二个文件带无时间戳的续行（堆栈）
+        for k in range(2):
+            with open(os.path.join(self.root, f"svc{k}.20240501.pdlog.1.log"), "w") as f:
+                for i in range(600):
+                    stamp = (BASE + timedelta(seconds=i, milliseconds=500 * k)).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+                    f.write(f"{stamp} I svc{k} line {i}\n")
+                    if k:
+                        f.write("    at continuation\n")
+        # 索引点稀疏一些，确保 seek 需要从索引点往后顺序读
+        self._stride = timeline.TIMELINE_INDEX_STRIDE
+        timeline.TIMELINE_INDEX_STRIDE = 64
+        merge_timeline(self.root, workers=1)
+
+    def tearDown(self):
+        timeline.TIMELINE_INDEX_STRIDE = self._stride
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _brute_window(self, start, end):
+        # 不用索引、从头顺序过滤的结果作为基准：按截至当前行的最大时间判断（续行跟随所属记录）
+        window = []
+        last = None
+        for source, text in read_timeline(self.root):
+            ts = parse_log_timestamp(text, BASE.year)
+            if ts is not None:
+                last = ts if last is None else max(last, ts)
+            if last is None or last < start:
+                continue
+            if last > end:
+                break
+            window.append((source, text))
+        return window
+
+    def test_seek_lands_on_first_record_at_or_after(self):
+        ts = (BASE + timedelta(seconds=300)).timestamp()
+        offset = timeline_seek(self.root, ts)
+        with open(os.path.join(self.root, TIMELINE_FILE_NAME), "rb") as f:
+            f.seek(offset)
+            line = f.readline()
+        self.assertIn(b"2024-05-01 08:05:00.000 I svc0 line 300", line)
+
+    def test_window_matches_sequential_filter(self):
+        for seconds in (0, 1, 150, 300.2, 599):
+            start = (BASE + timedelta(seconds=seconds)).timestamp()
+            end = start + 5
+            self.assertEqual(list(read_timeline(self.root, start, end)), self._brute_window(start, end), seconds)
+
+    def test_seek_past_end(self):
+        size = os.path.getsize(os.path.join(self.root, TIMELINE_FILE_NAME))
+        self.assertEqual(timeline_seek(self.root, (BASE + timedelta(days=1)).timestamp()), size)
+        self.assertEqual(list(read_timeline(self.root, (BASE + timedelta(days=1)).timestamp())), [])
+
+    def test_compacted_sources_merge_identically(self):
+        # 归档整理把日志压成 .gz 后，时间线仍能读到全部来源，合并结果逐字节相同
+        path = os.path.join(self.root, TIMELINE_FILE_NAME)
+        with open(path, "rb") as f:
+            before = f.read()
+        sources = timeline.timeline_sources(self.root)
+        unit = archive.ArchiveUnit("s", "d", self.root, 0, 0, 0)
+        with mock.patch.object(archive, "ARCHIVE_MIN_FILE_SIZE", 0):
+            self.assertEqual(archive.compact_units([unit], archive.CODEC_GZIP, workers=1)["files"], 3)
+        self.assertFalse(any(os.path.exists(p) for p in sources))
+        self.assertEqual(timeline.timeline_sources(self.root), sources)
+        merge_timeline(self.root, workers=2)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+import heapq
+import os
+import shutil
+import struct
+import tempfile
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from archive import list_logs, open_log, log_mtime
+from pull_log import parse_log_timestamp, format_size, TIMESTAMP_SCAN_CHARS
+
+# 拉取目录下合并后的时间线与其偏移索引
+TIMELINE_FILE_NAME = "timeline.log"
+TIMELINE_INDEX_NAME = "timeline.idx"
+# 每隔多少条记录写一个索引点（时间戳 -> 时间线文件偏移）
+TIMELINE_INDEX_STRIDE = 1024
+# 不参与合并的文件：指标、索引、归档、未完成的传输等
+TIMELINE_SKIP_SUFFIXES = (".jsonl", ".json", ".idx", ".part", ".gz", ".zst", ".db", ".tmp")
+# 每行前缀 "<来源相对路径> | "，之后是原始行
+TIMELINE_TAG_SEPARATOR = b" | "
+
+# 扫描结果：每条记录 (时间戳, 起始偏移, 字节数)
+_RECORD = struct.Struct("<dQQ")
+_INDEX_ENTRY = struct.Struct("<dQ")
+_READ_RECORDS = 4096
+
+
+def _looks_binary(path):
+    try:
+        with open_log(path) as f:
+            return b"\0" in f.read(4096)
+    except OSError:
+        return True
+
+
+def _walk_order(root):
+    # 与 os.walk（子目录按名排序）相同的顺序：同一目录下文件在子目录之前
+    def key(path):
+        parts = os.path.relpath(path, root).split(os.sep)
+        return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+    return key
+
+
+def timeline_sources(root):
+    # 拉取目录下参与合并的文本日志（pdlog、kernel、ANR），跳过隐藏文件、指标、时间线自身与二进制。
+    # 已被归档整理压缩的文件按原文件名列出（archive.list_logs），读取时经 open_log 透明解压
+    sources = []
+    for path in sorted(list_logs(root), key=_walk_order(root)):
+        name = os.path.basename(path)
+        if name in (TIMELINE_FILE_NAME, TIMELINE_INDEX_NAME) or name.endswith(TIMELINE_SKIP_SUFFIXES):
+            continue
+        if not _looks_binary(path):
+            sources.append(path)
+    return sources
+
+
+def scan_log_file(path, keys_path):
+    # 进程池 worker：逐行解析时间戳，把文件切成记录（带时间戳的行 + 其后的续行，如堆栈），
+    # 每条记录的 (时间戳, 偏移, 长度) 写入 keys_path，返回记录数。
+    # 记录时间取文件内的运行最大值，保证每个文件单调，k 路归并才成立；
+    # 开头没有时间戳的行并入第一条记录，整份文件都没有时间戳时用文件 mtime
+    mtime = log_mtime(path)
+    default_year = datetime.fromtimestamp(mtime).year
+    records = 0
+    key = None
+    start = 0
+    offset = 0
+    with open_log(path) as f, open(keys_path, "wb") as out:
+        for line in f:
+            ts = parse_log_timestamp(line[:TIMESTAMP_SCAN_CHARS].decode("utf-8", errors="replace"), default_year)
+            if ts is not None:
+                if key is None:
+                    key = ts
+                elif offset > start:
+                    out.write(_RECORD.pack(key, start, offset - start))
+                    records += 1
+                    start = offset
+                    key = max(key, ts)
+            offset += len(line)
+        if offset > start:
+            out.write(_RECORD.pack(key if key is not None else mtime, start, offset - start))
+            records += 1
+    return records
+
+
+def _iter_records(index, keys_path):
+    # 按顺序读回一个文件的扫描结果；元组带上文件序号，时间相同时按来源顺序稳定输出
+    with open(keys_path, "rb") as f:
+        while True:
+            chunk = f.read(_RECORD.size * _READ_RECORDS)
+            if not chunk:
+                return
+            for ts, offset, length in _RECORD.iter_unpack(chunk):
+                yield ts, index, offset, length
+
+
+def _scan_all(sources, keys, workers):
+    if workers == 1 or len(sources) == 1:
+        return [scan_log_file(path, keys_path) for path, keys_path in zip(sources, keys)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(scan_log_file, sources, keys))
+
+
+def merge_timeline(root, workers=None, on_progress=None):
+    # 把 root 下所有文本日志按时间合并成 root/timeline.log，并写稀疏偏移索引 root/timeline.idx。
+    # 解析在进程池里并行；归并是基于堆的流式 k 路归并，内存只与文件数有关，与总大小无关
+    started = time.perf_counter()
+    sources = timeline_sources(root)
+    timeline_path = os.path.join(root, TIMELINE_FILE_NAME)
+    index_path = os.path.join(root, TIMELINE_INDEX_NAME)
+    result = {"path": timeline_path, "index": index_path, "sources": len(sources), "records": 0, "bytes": 0}
+    if not sources:
+        return result
+    workers = max(1, min(workers or os.cpu_count() or 1, len(sources)))
+    if on_progress is not None:
+        on_progress(f"Timeline: scanning {len(sources)} files with {workers} processes")
+    tmp_dir = tempfile.mkdtemp(prefix=".timeline-", dir=root)
+    handles = []
+    try:
+        keys = [os.path.join(tmp_dir, f"{i}.keys") for i in range(len(sources))]
+        _scan_all(sources, keys, workers)
+        tags = [os.path.relpath(p, root).replace(os.sep, "/").encode("utf-8") + TIMELINE_TAG_SEPARATOR for p in sources]
+        handles = [open_log(p) for p in sources]
+        written = 0
+        records = 0
+        with open(timeline_path + ".tmp", "wb") as out, open(index_path + ".tmp", "wb") as idx:
+            for ts, i, _, length in heapq.merge(*(_iter_records(i, k) for i, k in enumerate(keys))):
+                if records % TIMELINE_INDEX_STRIDE == 0:
+                    idx.write(_INDEX_ENTRY.pack(ts, written))
+                records += 1
+                # 同一文件的记录按顺序连续覆盖整份文件，顺序读即可，无需 seek
+                f, tag, remaining = handles[i], tags[i], length
+                while remaining > 0:
+                    line = f.readline(remaining)
+                    if not line:
+                        break
+                    remaining -= len(line)
+                    if not line.endswith(b"\n"):
+                        # 文件末行没有换行
+                        line += b"\n"
+                    out.write(tag)
+                    out.write(line)
+                    written += len(tag) + len(line)
+        os.replace(timeline_path + ".tmp", timeline_path)
+        os.replace(index_path + ".tmp", index_path)
+        result.update(records=records, bytes=written, seconds=round(time.perf_counter() - started, 4))
+        if on_progress is not None:
+            on_progress(f"Timeline: {records} records from {len(sources)} files -> {timeline_path} "
+                        f"({format_size(written)}, {result['seconds']:.1f}s)")
+        return result
+    finally:
+        for f in handles:
+            f.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_timeline_index(index_path):
+    # 返回 (时间戳列表, 偏移列表)，两者都单调不减
+    times, offsets = [], []
+    with open(index_path, "rb") as f:
+        for ts, offset in _INDEX_ENTRY.iter_unpack(f.read()):
+            times.append(ts)
+            offsets.append(offset)
+    return times, offsets
+
+
+def timeline_offset(index, ts):
+    # 早于 ts 的最后一个索引点的偏移：它之前的记录都早于 ts，从这里顺序读即可找到 ts
+    times, offsets = index
+    i = bisect_left(times, ts) - 1
+    return offsets[i] if i >= 0 else 0
+
+
+def timeline_seek(root, ts):
+    # 时间线中第一条时间不早于 ts 的记录的字节偏移（都早于 ts 时为文件大小）：
+    # 先用索引跳到 ts 之前最近的索引点，再顺序读至多一个索引间隔的记录
+    timeline_path = os.path.join(root, TIMELINE_FILE_NAME)
+    offset = timeline_offset(load_timeline_index(os.path.join(root, TIMELINE_INDEX_NAME)), ts)
+    # 旧会话的 timeline.log 可能已被归档整理压缩（archive.py），open_log 透明解压
+    default_year = datetime.fromtimestamp(log_mtime(timeline_path)).year
+    last = None
+    with open_log(timeline_path) as f:
+        f.seek(offset)
+        for raw in f:
+            line = raw.partition(TIMELINE_TAG_SEPARATOR)[2]
+            line_ts = parse_log_timestamp(line[:TIMESTAMP_SCAN_CHARS].decode("utf-8", errors="replace"), default_year)
+            if line_ts is not None:
+                last = line_ts if last is None else max(last, line_ts)
+            if last is not None and last >= ts:
+                return offset
+            offset += len(raw)
+    return offset
+
+
+def read_timeline(root, start=None, end=None):
+    # 按时间段读取已合并的时间线，产出 (来源, 原始行)；借助索引直接 seek 到起点
+    timeline_path = os.path.join(root, TIMELINE_FILE_NAME)
+    offset = timeline_seek(root, start) if start is not None else 0
+    default_year = datetime.fromtimestamp(log_mtime(timeline_path)).year
+    last = None
+    with open_log(timeline_path) as f:
+        f.seek(offset)
+        for raw in f:
+            source, _, line = raw.partition(TIMELINE_TAG_SEPARATOR)
+            text = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            ts = parse_log_timestamp(text, default_year)
+            if ts is not None:
+                last = ts if last is None else max(last, ts)
+            if end is not None and last is not None and last > end:
+                return
+            yield source.decode("utf-8", errors="replace"), text